@@ -0,0 +1,429 @@
+#!/usr/bin/env python3
+"""Rust vs C comparisons over the mined and labeled datasets.
+
+Every repository in the manifest (`repos.toml`) is read from its labeled
+output (`{name}_labeled_commit_info`, csv or parquet) or, before it has
+been labeled, from its mining output (`{name}_commit_info` or
+`{name}_diffs.sqlite`). Only the hash, date, author, line counts and
+`llm_label` columns are read.
+
+Rows are reduced with pandas group-bys to additive aggregates, which are
+kept in `../data/analytics_cache.sqlite`:
+
+- `monthly`: commits and lines added/removed per repo, UTC month and label
+- `authors`: commits, fixes and lines changed per repo, month and author
+
+Reports are computed from these tables, never from the raw rows. On each
+run a repository is only re-read when its output changed. A csv that has
+only grown since (a resumed or extended mining run) is read from where the
+last run stopped, and a parquet output only from its new part files; the
+new rows' aggregates are added to the cached ones. Anything else (a
+relabeled csv is rewritten whole) re-aggregates that repository alone.
+
+    python analytics.py summary                      # per repo, grouped by pair
+    python analytics.py summary --by language        # C vs Rust overall
+    python analytics.py timeline --metric fix_ratio --freq quarter
+    python analytics.py timeline --metric labels --by language --freq year
+    python analytics.py authors --since 2020-01
+"""
+import argparse
+import csv
+import glob
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from orchestrate import DATA_DIR, load_manifest
+
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+# Bytes at the end of the aggregated part of a csv that must be unchanged for it to be extended
+TAIL_BYTES = 4096
+COLUMNS = ["hash", "date", "author", "lines_added", "lines_removed", "llm_label"]
+LABELS = ["feature", "fix", "refactor", "docs", "test", "other"]
+METRICS = ["commits", "churn", "churn_per_commit", "fix_ratio", "authors", "labels"]
+
+CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (
+    repo TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    format TEXT NOT NULL,
+    -- csv: byte offset and the sha1 of the bytes before it; parquet: size of each part file;
+    -- store: size and mtime
+    state TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS monthly (
+    repo TEXT NOT NULL,
+    month TEXT NOT NULL,
+    label TEXT NOT NULL,
+    commits INTEGER NOT NULL,
+    lines_added INTEGER NOT NULL,
+    lines_removed INTEGER NOT NULL,
+    PRIMARY KEY (repo, month, label)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS authors (
+    repo TEXT NOT NULL,
+    month TEXT NOT NULL,
+    author TEXT NOT NULL,
+    commits INTEGER NOT NULL,
+    fixes INTEGER NOT NULL,
+    lines_changed INTEGER NOT NULL,
+    PRIMARY KEY (repo, month, author)
+) WITHOUT ROWID;
+"""
+
+
+def find_source(name, data_dir=DATA_DIR):
+    """(format, path) of the output a repository is read from, labeled first, or None."""
+    for base in (f"{name}_labeled_commit_info", f"{name}_commit_info"):
+        path = os.path.join(data_dir, base)
+        if os.path.exists(f"{path}.csv"):
+            return "csv", f"{path}.csv"
+        if os.path.isdir(f"{path}.parquet"):
+            return "parquet", f"{path}.parquet"
+    store = os.path.join(data_dir, f"{name}_diffs.sqlite")
+    if os.path.exists(store):
+        return "store", store
+    return None
+
+
+def _tail_sha1(path, end):
+    with open(path, "rb") as f:
+        f.seek(max(0, end - TAIL_BYTES))
+        return hashlib.sha1(f.read(end - max(0, end - TAIL_BYTES))).hexdigest()
+
+
+def read_csv_rows(path, start=None):
+    """The wanted columns of a csv output from byte `start` (the first row by default)."""
+    with open(path, newline="", encoding="utf-8") as f:
+        header = next(csv.reader(f), [])
+    usecols = [c for c in COLUMNS if c in header]
+    with open(path, "rb") as f:
+        if start is None:
+            return pd.read_csv(f, usecols=usecols, dtype={"author": str, "llm_label": str})
+        f.seek(start)
+        return pd.read_csv(f, header=None, names=header, usecols=usecols, dtype={"author": str, "llm_label": str})
+
+
+def read_parquet_rows(parts):
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise SystemExit("[ERROR] Reading parquet outputs needs pyarrow (pip install pyarrow)")
+    frames = []
+    for part in parts:
+        names = pq.read_schema(part).names
+        frames.append(pq.read_table(part, columns=[c for c in COLUMNS if c in names]).to_pandas())
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=COLUMNS)
+
+
+def read_store_rows(name, data_dir):
+    from dataset_reader import Dataset
+
+    dataset = Dataset(name, data_dir)
+    try:
+        return pd.DataFrame.from_records(dataset.commits(columns=COLUMNS[:-1]), columns=COLUMNS[:-1])
+    finally:
+        dataset.close()
+
+
+def aggregate(frame):
+    """(monthly, authors) aggregates of commit rows, as frames keyed like the cache tables."""
+    month = pd.to_datetime(frame["date"], utc=True, format="ISO8601").dt.strftime("%Y-%m")
+    label = frame["llm_label"].fillna("") if "llm_label" in frame else pd.Series("", index=frame.index)
+    added = pd.to_numeric(frame["lines_added"], errors="coerce").fillna(0).astype("int64")
+    removed = pd.to_numeric(frame["lines_removed"], errors="coerce").fillna(0).astype("int64")
+    rows = pd.DataFrame({
+        "month": month,
+        "label": label,
+        "author": frame["author"].fillna(""),
+        "commits": np.ones(len(frame), dtype="int64"),
+        "lines_added": added,
+        "lines_removed": removed,
+        "fixes": (label == "fix").astype("int64"),
+        "lines_changed": added + removed,
+    })
+    monthly = rows.groupby(["month", "label"], sort=False, as_index=False)[
+        ["commits", "lines_added", "lines_removed"]].sum()
+    authors = rows.groupby(["month", "author"], sort=False, as_index=False)[
+        ["commits", "fixes", "lines_changed"]].sum()
+    return monthly, authors
+
+
+class AggregateCache:
+    """Per-repository monthly and per-author aggregates in SQLite, refreshed incrementally."""
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(CACHE_SCHEMA)
+
+    def _state(self, repo):
+        row = self._conn.execute("SELECT path, format, state FROM sources WHERE repo = ?", (repo,)).fetchone()
+        return (row[0], row[1], json.loads(row[2])) if row else None
+
+    def refresh(self, name, data_dir=DATA_DIR):
+        """Bring one repository's aggregates up to date. Returns a short description of what was done."""
+        source = find_source(name, data_dir)
+        if source is None:
+            with self._conn:
+                self._drop(name)
+            return "no outputs"
+        fmt, path = source
+        cached = self._state(name)
+        previous = cached[2] if cached and cached[:2] == (os.path.abspath(path), fmt) else None
+
+        if fmt == "csv":
+            size = os.path.getsize(path)
+            state = {"read_to": size, "tail_sha1": _tail_sha1(path, size)}
+            if previous and previous["read_to"] == size and previous["tail_sha1"] == state["tail_sha1"]:
+                return "unchanged"
+            if previous and size > previous["read_to"] and _tail_sha1(path, previous["read_to"]) == previous["tail_sha1"]:
+                return self._update(name, path, fmt, state, read_csv_rows(path, previous["read_to"]), append=True)
+            return self._update(name, path, fmt, state, read_csv_rows(path))
+
+        if fmt == "parquet":
+            parts = sorted(glob.glob(os.path.join(path, "part-*.parquet")))
+            state = {"parts": {os.path.basename(p): os.path.getsize(p) for p in parts}}
+            if previous == state:
+                return "unchanged"
+            old = previous["parts"] if previous else {}
+            if old and all(state["parts"].get(part) == size for part, size in old.items()):
+                new = [p for p in parts if os.path.basename(p) not in old]
+                return self._update(name, path, fmt, state, read_parquet_rows(new), append=True)
+            return self._update(name, path, fmt, state, read_parquet_rows(parts))
+
+        stat = os.stat(path)
+        state = {"size": stat.st_size, "mtime": stat.st_mtime}
+        if previous == state:
+            return "unchanged"
+        return self._update(name, path, fmt, state, read_store_rows(name, data_dir))
+
+    def _drop(self, repo):
+        for table in ("sources", "monthly", "authors"):
+            self._conn.execute(f"DELETE FROM {table} WHERE repo = ?", (repo,))
+
+    def _update(self, repo, path, fmt, state, frame, append=False):
+        monthly, authors = aggregate(frame)
+        with self._conn:
+            if not append:
+                self._drop(repo)
+            self._conn.executemany(
+                "INSERT INTO monthly VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (repo, month, label) DO UPDATE SET "
+                "commits = commits + excluded.commits, lines_added = lines_added + excluded.lines_added, "
+                "lines_removed = lines_removed + excluded.lines_removed",
+                ((repo, *row) for row in monthly.itertuples(index=False, name=None)))
+            self._conn.executemany(
+                "INSERT INTO authors VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (repo, month, author) DO UPDATE SET "
+                "commits = commits + excluded.commits, fixes = fixes + excluded.fixes, "
+                "lines_changed = lines_changed + excluded.lines_changed",
+                ((repo, *row) for row in authors.itertuples(index=False, name=None)))
+            self._conn.execute("INSERT OR REPLACE INTO sources VALUES (?, ?, ?, ?)",
+                               (repo, os.path.abspath(path), fmt, json.dumps(state)))
+        months = monthly["month"].nunique()
+        verb = "added" if append else "aggregated"
+        return f"{verb} {len(frame):,} rows ({months} months) from {os.path.basename(path)}"
+
+    def table(self, name, repos, since=None, until=None):
+        """One cache table for `repos`, limited to months in [since, until)."""
+        clauses = [f"repo IN ({', '.join('?' * len(repos))})"]
+        params = list(repos)
+        if since:
+            clauses.append("month >= ?")
+            params.append(since)
+        if until:
+            clauses.append("month < ?")
+            params.append(until)
+        return pd.read_sql_query(f"SELECT * FROM {name} WHERE {' AND '.join(clauses)}", self._conn, params=params)
+
+    def close(self):
+        self._conn.close()
+
+
+def _with_repo_info(frame, repos):
+    info = pd.DataFrame([{"repo": r["name"], "language": r["language"], "pair": r["pair"]} for r in repos])
+    return frame.merge(info, on="repo", how="left")
+
+
+def _group_columns(by):
+    return ["pair", "language", "repo"] if by == "repo" else ["language"]
+
+
+def _ratios(table, labeled):
+    """Add churn_per_commit, fix_ratio and one share column per label to per-group sums."""
+    table["churn"] = table["lines_added"] + table["lines_removed"]
+    table["churn_per_commit"] = (table["churn"] / table["commits"].replace(0, np.nan)).round(1)
+    shares = labeled.div(labeled.sum(axis=1).replace(0, np.nan), axis=0).round(3)
+    table = table.join(shares.add_suffix("_share"))
+    table["fix_ratio"] = table["fix_share"] if "fix_share" in table else np.nan
+    return table
+
+
+def summary(cache, repos, by="repo", since=None, until=None):
+    """Commits, churn, authors, fix ratio and label mix per repository (or language)."""
+    keys = _group_columns(by)
+    monthly = _with_repo_info(cache.table("monthly", [r["name"] for r in repos], since, until), repos)
+    authors = _with_repo_info(cache.table("authors", [r["name"] for r in repos], since, until), repos)
+    if monthly.empty:
+        return pd.DataFrame()
+
+    table = monthly.groupby(keys)[["commits", "lines_added", "lines_removed"]].sum()
+    labeled = monthly[monthly["label"] != ""].pivot_table(index=keys, columns="label", values="commits",
+                                                          aggfunc="sum", fill_value=0)
+    table["labeled"] = labeled.sum(axis=1).reindex(table.index).fillna(0).astype("int64")
+    table["authors"] = authors.groupby(keys)["author"].nunique()
+    table["first_month"] = monthly.groupby(keys)["month"].min()
+    table["last_month"] = monthly.groupby(keys)["month"].max()
+    table = _ratios(table, labeled.reindex(columns=[l for l in LABELS if l in labeled.columns]))
+    columns = ["first_month", "last_month", "commits", "labeled", "authors", "churn", "churn_per_commit", "fix_ratio"]
+    return table[columns + [c for c in table.columns if c.endswith("_share") and c != "fix_share"]].reset_index()
+
+
+def _period(months, freq):
+    if freq == "month":
+        return months
+    periods = pd.PeriodIndex(months, freq="M").asfreq({"quarter": "Q", "year": "Y"}[freq])
+    return periods.astype(str)
+
+
+def timeline(cache, repos, metric, by="repo", freq="month", since=None, until=None):
+    """One metric per period (rows) and repository or language (columns). `labels` gives label shares."""
+    group = "repo" if by == "repo" else "language"
+    names = [r["name"] for r in repos]
+    if metric == "authors":
+        frame = _with_repo_info(cache.table("authors", names, since, until), repos)
+        if frame.empty:
+            return pd.DataFrame()
+        frame["period"] = _period(frame["month"], freq)
+        return frame.groupby(["period", group])["author"].nunique().unstack(group)
+
+    frame = _with_repo_info(cache.table("monthly", names, since, until), repos)
+    if frame.empty:
+        return pd.DataFrame()
+    frame["period"] = _period(frame["month"], freq)
+    if metric == "labels":
+        labeled = frame[frame["label"] != ""]
+        counts = labeled.pivot_table(index=["period", group], columns="label", values="commits",
+                                     aggfunc="sum", fill_value=0)
+        counts = counts.reindex(columns=[l for l in LABELS if l in counts.columns])
+        return counts.div(counts.sum(axis=1), axis=0).round(3)
+
+    sums = frame.groupby(["period", group])[["commits", "lines_added", "lines_removed"]].sum()
+    if metric == "commits":
+        values = sums["commits"]
+    elif metric == "churn":
+        values = sums["lines_added"] + sums["lines_removed"]
+    elif metric == "churn_per_commit":
+        values = ((sums["lines_added"] + sums["lines_removed"]) / sums["commits"]).round(1)
+    else:
+        labeled = frame[frame["label"] != ""].groupby(["period", group])["commits"].sum()
+        fixes = frame[frame["label"] == "fix"].groupby(["period", group])["commits"].sum()
+        values = (fixes.reindex(labeled.index).fillna(0) / labeled.replace(0, np.nan)).round(3)
+    return values.unstack(group)
+
+
+def author_distribution(cache, repos, since=None, until=None):
+    """How concentrated each repository's commits are among its authors."""
+    frame = cache.table("authors", [r["name"] for r in repos], since, until)
+    if frame.empty:
+        return pd.DataFrame()
+    per_author = frame.groupby(["repo", "author"], as_index=False)[["commits", "fixes", "lines_changed"]].sum()
+    per_author = per_author.sort_values(["repo", "commits"], ascending=[True, False], ignore_index=True)
+    grouped = per_author.groupby("repo")
+    # Rank 1 is the most active author; the Gini coefficient needs the ascending rank
+    rank = grouped.cumcount() + 1
+    n = grouped["commits"].transform("size")
+    top_decile = rank <= np.ceil(0.1 * n)
+    per_author["ascending_weighted"] = (n - rank + 1) * per_author["commits"]
+    per_author["top_decile_commits"] = per_author["commits"].where(top_decile, 0)
+    per_author["single_commit"] = (per_author["commits"] == 1).astype("int64")
+
+    grouped = per_author.groupby("repo")
+    table = pd.DataFrame({
+        "authors": grouped.size(),
+        "commits": grouped["commits"].sum(),
+        "median_commits": grouped["commits"].median(),
+        "top_author_share": (grouped["commits"].max() / grouped["commits"].sum()).round(3),
+        "top_10pct_share": (grouped["top_decile_commits"].sum() / grouped["commits"].sum()).round(3),
+        "single_commit_authors": grouped["single_commit"].sum(),
+        "fixes_per_author": (grouped["fixes"].sum() / grouped.size()).round(2),
+        "lines_per_author": (grouped["lines_changed"].sum() / grouped.size()).round(1),
+    })
+    sums = grouped["ascending_weighted"].sum()
+    count = table["authors"]
+    table["gini"] = ((2 * sums) / (count * table["commits"]) - (count + 1) / count).round(3)
+    return _with_repo_info(table.reset_index(), repos).set_index(["pair", "language", "repo"]).sort_index().reset_index()
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Compare the mined Rust and C repositories")
+    sub = p.add_subparsers(dest="command", required=True)
+    for name, help_text in [("refresh", "Only bring the aggregate cache up to date"),
+                            ("summary", "Commits, churn, authors, fix ratio and label mix per repository"),
+                            ("timeline", "One metric per month, quarter or year"),
+                            ("authors", "Per-author commit distribution per repository")]:
+        s = sub.add_parser(name, help=help_text)
+        s.add_argument("--manifest", default="repos.toml")
+        s.add_argument("--only", nargs="+", default=None, help="Limit to these repo names")
+        s.add_argument("--cache", default=os.path.join(DATA_DIR, "analytics_cache.sqlite"),
+                       help="Aggregate cache (default ../data/analytics_cache.sqlite)")
+        s.add_argument("--rebuild", action="store_true", help="Re-aggregate every repository from scratch")
+        s.add_argument("--since", default=None, help="First month, YYYY-MM")
+        s.add_argument("--until", default=None, help="Month to stop before, YYYY-MM")
+        s.add_argument("--out", default=None, help="Also write the table to this csv")
+        if name in ("summary", "timeline"):
+            s.add_argument("--by", choices=["repo", "language"], default="repo")
+        if name == "timeline":
+            s.add_argument("--metric", choices=METRICS, default="commits")
+            s.add_argument("--freq", choices=["month", "quarter", "year"], default="month")
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+    _, repos = load_manifest(os.path.join(CODE_DIR, args.manifest) if not os.path.isabs(args.manifest) else args.manifest)
+    if args.only:
+        unknown = set(args.only) - {r["name"] for r in repos}
+        if unknown:
+            raise SystemExit(f"[ERROR] Not in the manifest: {', '.join(sorted(unknown))}")
+        repos = [r for r in repos if r["name"] in args.only]
+
+    if args.rebuild and os.path.exists(args.cache):
+        os.remove(args.cache)
+    cache = AggregateCache(args.cache)
+    start = time.perf_counter()
+    for repo in repos:
+        result = cache.refresh(repo["name"])
+        if result != "unchanged":
+            print(f"[INFO] {repo['name']}: {result}", file=sys.stderr)
+    print(f"[INFO] Aggregates up to date in {time.perf_counter() - start:.2f}s ({args.cache})", file=sys.stderr)
+
+    if args.command == "refresh":
+        cache.close()
+        return
+    if args.command == "summary":
+        table = summary(cache, repos, args.by, args.since, args.until)
+    elif args.command == "timeline":
+        table = timeline(cache, repos, args.metric, args.by, args.freq, args.since, args.until)
+    else:
+        table = author_distribution(cache, repos, args.since, args.until)
+    cache.close()
+
+    if table.empty:
+        print("[WARN] No mined outputs for these repositories yet")
+        return
+    with pd.option_context("display.max_rows", None, "display.max_columns", None, "display.width", 200):
+        print(table.to_string(index=args.command == "timeline"))
+    if args.out:
+        table.to_csv(args.out, index=args.command == "timeline")
+        print(f"[INFO] Written to {args.out}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,395 @@
+#!/usr/bin/env python3
+"""Reproducible speed benchmark for mining and labeling.
+
+Generates a synthetic git repository (same parameters and seed, same
+repository, down to the commit hashes), then times:
+
+- mine: grab_commits.py over the whole history
+- label: label_commits_llm.py --label against stub_openai_server.py, with
+  the configured latency and share of 429s, and an empty label cache
+
+Each path runs as its own subprocess with `--profile`, so the numbers are
+the scripts' own: commits/s, labels/s, cost per 1k commits and the stage
+breakdown. Peak RSS is the child's maximum resident set size (including
+mining worker processes) from wait4.
+
+Every run is appended to `../data/benchmark_history.json` with the git
+commit it measured. Runs are compared with the last earlier run of the
+same configuration; a throughput drop or RSS growth beyond `--tolerance`
+is flagged as a regression, and `--fail-on-regression` makes it exit 1.
+
+    python benchmark.py                              # 2000 commits, mine + label
+    python benchmark.py --commits 10000 --files 400 --rust-share 0.5 --workers 4
+    python benchmark.py --paths label --latency 0.2 --rate-429 0.05 --label-args --pack 8
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from datetime import datetime, timezone
+
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = "../data"
+BENCH_DIR = os.path.join(DATA_DIR, "bench")
+PATHS = ["mine", "label"]
+
+AUTHORS = [("Ann Dev", "ann@example.com"), ("Bo Core", "bo@example.com"), ("Cy Ops", "cy@example.com"),
+           ("Di Tests", "di@example.com"), ("Ed Docs", "ed@example.com"), ("Flo Fix", "flo@example.com")]
+# (weight, kind, message template); kinds pick which files a commit touches
+MESSAGES = [
+    (30, "src", "Fix {thing} overflow in {fn}"),
+    (25, "src", "Add support for {thing} in {fn}"),
+    (12, "src", "Refactor {fn} to simplify {thing} handling"),
+    (8, "src", "Handle {thing} errors in {fn}"),
+    (8, "docs", "Document {thing} options"),
+    (8, "tests", "Cover {thing} edge cases in {fn}"),
+    (5, "src", "Bump version to 1.{n}.0"),
+    (4, "src", "Merge fixes for {thing}"),
+]
+THINGS = ["buffer", "header", "chunk", "cookie", "utf8", "stream", "socket", "timeout", "parser", "cert"]
+
+
+def c_function(name, k):
+    return [f"int {name}(int x) {{",
+            f"    if (x > {k}) return x - {k};",
+            f"    for (int i = 0; i < {k % 7 + 1}; i++) x += i;",
+            "    return x;",
+            "}", ""]
+
+
+def rust_function(name, k):
+    return [f"pub fn {name}(x: i64) -> i64 {{",
+            f"    if x > {k} {{ return x - {k}; }}",
+            f"    (0..{k % 7 + 1}).fold(x, |acc, i| acc + i)",
+            "}", ""]
+
+
+class SyntheticRepo:
+    """Deterministic commit stream for `git fast-import`."""
+
+    def __init__(self, commits, files, diff_lines, rust_share, seed):
+        self.commits = commits
+        self.diff_lines = diff_lines
+        self.rng = random.Random(seed)
+        self.sources = []
+        for i in range(files):
+            rust = self.rng.random() < rust_share
+            self.sources.append(f"src/mod_{i:04d}.rs" if rust else f"src/mod_{i:04d}.c")
+        self.contents = {}
+        self.counter = 0
+        self.weights = [w for w, _, _ in MESSAGES]
+
+    def _function(self, path):
+        self.counter += 1
+        name = f"f_{self.counter}"
+        return rust_function(name, self.counter) if path.endswith(".rs") else c_function(name, self.counter)
+
+    def _change(self, path):
+        """New content for `path`: about `diff_lines` lines replaced or added at a random place."""
+        lines = self.contents.get(path)
+        if lines is None:
+            lines = []
+            while len(lines) < 4 * self.diff_lines:
+                lines += self._function(path)
+        else:
+            at = self.rng.randrange(0, max(1, len(lines) - self.diff_lines))
+            del lines[at:at + self.diff_lines // 2]
+            new = []
+            while len(new) < self.diff_lines:
+                new += self._function(path)
+            lines[at:at] = new
+        self.contents[path] = lines
+        return "\n".join(lines) + "\n"
+
+    def stream(self):
+        """fast-import commands for the whole history, as bytes chunks."""
+        start = int(datetime(2020, 1, 1, tzinfo=timezone.utc).timestamp())
+        for n in range(1, self.commits + 1):
+            _, kind, template = self.rng.choices(MESSAGES, self.weights)[0]
+            if n == 1:
+                kind, template = "src", "Initial import"
+            if kind == "docs":
+                paths = [f"docs/{self.rng.choice(THINGS)}.md"]
+            elif kind == "tests":
+                paths = [f"tests/test_{self.rng.choice(THINGS)}{'.rs' if self.rng.random() < 0.5 else '.c'}"]
+            elif n == 1:
+                paths = self.sources
+            else:
+                paths = self.rng.sample(self.sources, min(len(self.sources), self.rng.randint(1, 3)))
+            fn = f"f_{self.rng.randint(1, max(1, self.counter))}"
+            message = template.format(thing=self.rng.choice(THINGS), fn=fn, n=n // 100)
+            author, email = self.rng.choice(AUTHORS)
+            when = start + 3600 * n
+            out = [f"commit refs/heads/main\nmark :{n}\n"
+                   f"author {author} <{email}> {when} +0000\ncommitter {author} <{email}> {when} +0000\n"]
+            data = message.encode("utf-8")
+            out.append(f"data {len(data)}\n")
+            out.append(data)
+            out.append(b"\n")
+            if n > 1:
+                out.append(f"from :{n - 1}\n")
+            for path in paths:
+                body = self._change(path).encode("utf-8")
+                out.append(f"M 100644 inline {path}\ndata {len(body)}\n")
+                out.append(body)
+                out.append(b"\n")
+            yield b"".join(part.encode("utf-8") if isinstance(part, str) else part for part in out)
+
+
+def generate_repo(args):
+    """The synthetic repository for these parameters, generated on first use."""
+    name = (f"synth_c{args.commits}_f{args.files}_d{args.diff_lines}_r{int(100 * args.rust_share)}"
+            f"_s{args.seed}")
+    path = os.path.join(BENCH_DIR, name)
+    if os.path.isdir(os.path.join(path, ".git")):
+        return path
+    tmp = path + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    start = time.time()
+    subprocess.run(["git", "init", "--quiet", "--initial-branch=main", tmp], check=True)
+    importer = subprocess.Popen(["git", "-C", tmp, "fast-import", "--quiet"], stdin=subprocess.PIPE)
+    for chunk in SyntheticRepo(args.commits, args.files, args.diff_lines, args.rust_share, args.seed).stream():
+        importer.stdin.write(chunk)
+    importer.stdin.close()
+    if importer.wait() != 0:
+        raise SystemExit("[ERROR] git fast-import failed")
+    subprocess.run(["git", "-C", tmp, "checkout", "--quiet", "--force", "main"], check=True)
+    os.replace(tmp, path)
+    print(f"[INFO] Generated {path} ({args.commits:,} commits) in {time.time() - start:.1f}s")
+    return path
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_stub(args):
+    port = free_port()
+    cmd = [sys.executable, "stub_openai_server.py", "--port", str(port), "--latency", str(args.latency),
+           "--jitter", str(args.jitter), "--rate-429", str(args.rate_429), "--retry-after", str(args.retry_after),
+           "--seed", str(args.seed)]
+    proc = subprocess.Popen(cmd, cwd=CODE_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}/v1"
+    for _ in range(100):
+        try:
+            stub_stats(base_url)
+            return proc, base_url
+        except OSError:
+            time.sleep(0.05)
+    proc.kill()
+    raise SystemExit("[ERROR] The stub OpenAI server did not start")
+
+
+def stub_stats(base_url):
+    with urllib.request.urlopen(f"{base_url}/stats", timeout=2) as resp:
+        return json.load(resp)
+
+
+def run_timed(cmd, log_path, env=None):
+    """Run `cmd` from the code directory. Returns (wall seconds, peak RSS bytes)."""
+    start = time.perf_counter()
+    with open(log_path, "wb") as log:
+        proc = subprocess.Popen(cmd, cwd=CODE_DIR, stdout=log, stderr=subprocess.STDOUT, env=env)
+        # wait4 gives this child's own rusage, where getrusage(RUSAGE_CHILDREN) would mix runs
+        _, status, usage = os.wait4(proc.pid, 0)
+    wall = time.perf_counter() - start
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    if proc.returncode != 0:
+        raise SystemExit(f"[ERROR] {' '.join(cmd[1:3])} failed (exit {proc.returncode}); see {log_path}")
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    return wall, usage.ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+
+
+def remove_outputs(saveas):
+    for path in glob.glob(os.path.join(DATA_DIR, f"{saveas}_*")):
+        shutil.rmtree(path) if os.path.isdir(path) else os.remove(path)
+
+
+def bench_mine(args, repo, work):
+    saveas = "bench_mine"
+    remove_outputs(saveas)
+    profile = os.path.join(work, "mine_profile.json")
+    cmd = [sys.executable, "grab_commits.py", "--repo", repo, "--saveas", saveas, "--fresh",
+           "--workers", str(args.workers), "--format", args.format, "--profile", profile, *args.mine_args]
+    wall, rss = run_timed(cmd, os.path.join(work, "mine.log"))
+    with open(profile, encoding="utf-8") as f:
+        report = json.load(f)
+    remove_outputs(saveas)
+    return {
+        "wall_seconds": round(wall, 3),
+        "commits": report["commits"],
+        "commits_per_second": round(report["commits"] / wall, 2),
+        "peak_rss_mib": round(rss / 2**20, 1),
+        "stages": {name: stage["seconds"] for name, stage in report["stages"].items()},
+    }
+
+
+def bench_label(args, repo, work, base_url):
+    saveas = "bench_label"
+    remove_outputs(saveas)
+    profile = os.path.join(work, "label_profile.json")
+    cache = os.path.join(work, "label_cache.sqlite")
+    cmd = [sys.executable, "label_commits_llm.py", "--repo", repo, "--saveas", saveas, "--label",
+           "--label-cache", cache, "--import-cache", "", "--concurrency", str(args.concurrency),
+           "--rpm", "1000000", "--tpm", "1000000000", "--profile", profile, *args.label_args]
+    env = {**os.environ, "OPENAI_API_KEY": "stub", "OPENAI_BASE_URL": base_url}
+    before = stub_stats(base_url)
+    wall, rss = run_timed(cmd, os.path.join(work, "label.log"), env)
+    after = stub_stats(base_url)
+    with open(profile, encoding="utf-8") as f:
+        report = json.load(f)
+    remove_outputs(saveas)
+    latency = report["latency"].get("llm_request", {})
+    return {
+        "wall_seconds": round(wall, 3),
+        "commits": report["commits"],
+        "labeled": report["labeled"],
+        "llm_labeled": report["llm_labeled"],
+        "labels_per_second": round(report["labeled"] / wall, 2),
+        "cost_per_1k_commits": report["cost_per_1k_commits"],
+        "requests": after["chat_completions"] - before["chat_completions"],
+        "rate_limited": after["rate_limited"] - before["rate_limited"],
+        "llm_request_p50": latency.get("p50"),
+        "llm_request_p95": latency.get("p95"),
+        "peak_rss_mib": round(rss / 2**20, 1),
+        "stages": {name: stage["seconds"] for name, stage in report["stages"].items()},
+    }
+
+
+def git_version():
+    def git(*a):
+        return subprocess.run(["git", "-C", CODE_DIR, *a], capture_output=True, text=True).stdout.strip()
+    return git("rev-parse", "--short", "HEAD") or None, bool(git("status", "--porcelain", "--untracked-files=no"))
+
+
+# (metric, True when higher is better)
+TRACKED = {
+    "mine": [("commits_per_second", True), ("peak_rss_mib", False)],
+    "label": [("labels_per_second", True), ("cost_per_1k_commits", False), ("peak_rss_mib", False)],
+}
+
+
+def compare(run, history, tolerance):
+    """Lines comparing `run` with the last earlier run of the same configuration, and whether anything regressed."""
+    previous = next((h for h in reversed(history) if h["config"] == run["config"]), None)
+    if previous is None:
+        return ["No earlier run with this configuration to compare with"], False
+    lines = [f"Compared with {previous['git_commit'] or '?'}{' (dirty)' if previous['git_dirty'] else ''} "
+             f"from {previous['timestamp']}:"]
+    regressed = False
+    for path, metrics in TRACKED.items():
+        if path not in run["results"] or path not in previous["results"]:
+            continue
+        for metric, higher_is_better in metrics:
+            new, old = run["results"][path].get(metric), previous["results"][path].get(metric)
+            if new is None or not old:
+                continue
+            change = (new - old) / old
+            worse = -change if higher_is_better else change
+            flag = ""
+            if worse > tolerance:
+                flag = "  [REGRESSION]"
+                regressed = True
+            lines.append(f"  {path + ' ' + metric:32} {old:>12,.6g} -> {new:>12,.6g}  {100 * change:+6.1f}%{flag}")
+    return lines, regressed
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Benchmark mining and labeling on a synthetic repository")
+    p.add_argument("--paths", nargs="+", choices=PATHS, default=PATHS, help="What to benchmark")
+    p.add_argument("--commits", type=int, default=2000, help="Commits in the synthetic repository")
+    p.add_argument("--files", type=int, default=50, help="Source files in the synthetic repository")
+    p.add_argument("--diff-lines", type=int, default=20, help="Lines added per changed file")
+    p.add_argument("--rust-share", type=float, default=0.5, help="Share of source files that are Rust")
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--workers", type=int, default=1, help="grab_commits.py --workers")
+    p.add_argument("--format", choices=["csv", "parquet", "store"], default="csv", help="grab_commits.py --format")
+    p.add_argument("--mine-args", nargs=argparse.REMAINDER, default=[], help="Extra grab_commits.py flags (last)")
+    p.add_argument("--concurrency", type=int, default=16, help="label_commits_llm.py --concurrency")
+    p.add_argument("--label-args", nargs=argparse.REMAINDER, default=[],
+                   help="Extra label_commits_llm.py flags (last)")
+    p.add_argument("--latency", type=float, default=0.05, help="Stub seconds per chat completion")
+    p.add_argument("--jitter", type=float, default=0.05, help="Stub extra seconds, uniformly at random")
+    p.add_argument("--rate-429", type=float, default=0.0, help="Share of stub responses that are 429s")
+    p.add_argument("--retry-after", type=float, default=0.2, help="retry-after seconds on the stub's 429s")
+    p.add_argument("--history", default=os.path.join(DATA_DIR, "benchmark_history.json"))
+    p.add_argument("--tolerance", type=float, default=0.10,
+                   help="Relative change that counts as a regression (default 10%%)")
+    p.add_argument("--fail-on-regression", action="store_true", help="Exit 1 when a metric regressed")
+    p.add_argument("--no-history", action="store_true", help="Don't record this run")
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+    os.makedirs(BENCH_DIR, exist_ok=True)
+    repo = os.path.abspath(generate_repo(args))
+    work = os.path.join(BENCH_DIR, "last_run")
+    shutil.rmtree(work, ignore_errors=True)
+    os.makedirs(work)
+
+    config = {
+        "commits": args.commits, "files": args.files, "diff_lines": args.diff_lines,
+        "rust_share": args.rust_share, "seed": args.seed,
+    }
+    results = {}
+    if "mine" in args.paths:
+        config["mine"] = {"workers": args.workers, "format": args.format, "args": args.mine_args}
+        print(f"[INFO] Mining {repo}")
+        results["mine"] = r = bench_mine(args, repo, work)
+        print(f"mine:   {r['commits']:,} commits in {r['wall_seconds']:.1f}s  {r['commits_per_second']:,.1f} commits/s  "
+              f"peak RSS {r['peak_rss_mib']:,.1f} MiB")
+    if "label" in args.paths:
+        config["label"] = {"concurrency": args.concurrency, "args": args.label_args, "latency": args.latency,
+                           "jitter": args.jitter, "rate_429": args.rate_429, "retry_after": args.retry_after}
+        stub, base_url = start_stub(args)
+        try:
+            print(f"[INFO] Labeling {repo} against the stub at {base_url}")
+            results["label"] = r = bench_label(args, repo, work, base_url)
+        finally:
+            stub.terminate()
+            stub.wait()
+        print(f"label:  {r['labeled']:,} commits in {r['wall_seconds']:.1f}s  {r['labels_per_second']:,.1f} labels/s  "
+              f"${r['cost_per_1k_commits'] or 0:.4f}/1k commits  peak RSS {r['peak_rss_mib']:,.1f} MiB  "
+              f"({r['requests']:,} requests, {r['rate_limited']:,} 429s)")
+
+    commit, dirty = git_version()
+    run = {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git_commit": commit,
+        "git_dirty": dirty,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "config": config,
+        "results": results,
+    }
+    history = []
+    if os.path.exists(args.history):
+        with open(args.history, encoding="utf-8") as f:
+            history = json.load(f)
+    lines, regressed = compare(run, history, args.tolerance)
+    for line in lines:
+        print(line)
+    if not args.no_history:
+        history.append(run)
+        with open(args.history, "w", encoding="utf-8") as f:
+            json.dump(history, f, indent=2)
+        print(f"[INFO] Run recorded in {args.history} ({len(history)} runs)")
+    if regressed and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
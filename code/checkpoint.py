@@ -0,0 +1,87 @@
+"""Resumable mining checkpoints.
+
+A checkpoint for a `--saveas` name is two files in the data directory:
+
+- `{name}_mined_hashes.txt`: every commit hash already mined, one per line
+- `{name}_checkpoint.json`: the size of each output (bytes for csv files,
+  part count for parquet directories) and of the hash list as of the last
+  successful flush
+
+Outputs are flushed before the checkpoint is written, so on resume each output
+is rolled back to the recorded size. That drops any rows written after the
+last checkpoint, and those commits are mined again.
+"""
+import json
+import os
+
+from writers import output_size, truncate_output
+
+
+class Checkpoint:
+    def __init__(self, name, data_dir="../data"):
+        self.path = os.path.join(data_dir, f"{name}_checkpoint.json")
+        self.hashes_path = os.path.join(data_dir, f"{name}_mined_hashes.txt")
+        self.state = {}
+        self.mined = set()
+        self._pending = []
+
+    def load(self):
+        """Load a previous checkpoint. Returns False if there is nothing to resume."""
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path, "r", encoding="utf-8") as f:
+            self.state = json.load(f)
+        expected = dict(self.state.get("outputs", {}))
+        expected[self.hashes_path] = self.state.get("hashes_bytes", 0)
+        for path, size in expected.items():
+            if not os.path.exists(path) or output_size(path) < size:
+                print(f"[WARN] Checkpoint output {path} is missing or truncated, starting over")
+                self.state = {}
+                return False
+
+        os.truncate(self.hashes_path, self.state["hashes_bytes"])
+        with open(self.hashes_path, "r", encoding="utf-8") as f:
+            self.mined = {line.strip() for line in f if line.strip()}
+        return True
+
+    def restore_outputs(self):
+        """Cut each output file back to its size at the last checkpoint."""
+        for path, size in self.state.get("outputs", {}).items():
+            truncate_output(path, size)
+
+    def reset(self):
+        for path in (self.path, self.hashes_path):
+            if os.path.exists(path):
+                os.remove(path)
+        self.state = {}
+        self.mined = set()
+        self._pending = []
+
+    def mark(self, commit_hash):
+        self._pending.append(commit_hash)
+
+    def save(self, writers, **info):
+        """Flush the writers, then record their sizes and the newly mined hashes."""
+        for w in writers:
+            w.flush()
+
+        with open(self.hashes_path, "a", encoding="utf-8") as f:
+            for h in self._pending:
+                f.write(h + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+            hashes_bytes = f.tell()
+        self.mined.update(self._pending)
+        self._pending = []
+
+        self.state.update(info)
+        self.state["mined"] = len(self.mined)
+        self.state["hashes_bytes"] = hashes_bytes
+        self.state["outputs"] = {w.path: w.size() for w in writers}
+
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
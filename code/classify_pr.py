@@ -1,23 +1,25 @@
-import github
+import argparse
 from datetime import datetime, timedelta, timezone
 import re
 import os
 import json
 import csv
+import time
 from openai import OpenAI
 from collections import Counter
-
-
-# Setup
-print("🔧 Setting up GitHub connection...")
-auth = github.Auth.Token("ghp_xxx") # replace with your own token
-g = github.Github(auth=auth)
-repo = g.get_repo("serde-rs/json")
-print(f"✓ Connected to repository: {repo.full_name}\n")
+from rules import RuleEngine, PR_RULES
+from label_cache import PRLabelCache, prompt_version
+from pr_store import README_REPOS, add_arguments, open_store, merged_in_window
+from profiling import Profiler, add_arguments as add_profile_argument
 
 INPUT_COST_PER_MILLION_TOKENS = 0.25
 OUTPUT_COST_PER_MILLION_TOKENS = 2.00
 
+# Rule matches below this confidence fall back to the LLM
+REGEX_THRESHOLD = 0.8
+pr_rules = RuleEngine(PR_RULES, REGEX_THRESHOLD)
+profiler = Profiler("classify_pr", unit="prs")
+
 
 openai_client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
 
@@ -35,18 +37,23 @@ Heuristics:
 - other: anything else
 """
 
-def classify_pr_llm(title, body):
-    user = f"""Classify this commit.
+MODEL = "gpt-4.1-mini"
+
+USER_PROMPT = """Classify this commit.
 
 Commit message:
 ---
 PR Title: {title}
-PR Body: {body[:500] if body else 'No description'}
+PR Body: {body}
 ---
 """
 
+def classify_pr_llm(title, body):
+    user = USER_PROMPT.format(title=title, body=body[:500] if body else 'No description')
+
+    start = time.perf_counter()
     resp = openai_client.chat.completions.create(
-        model="gpt-4.1-mini",
+        model=MODEL,
         # temperature=0,
         response_format={"type":"json_object"},
         messages=[
@@ -57,7 +64,12 @@ PR Body: {body[:500] if body else 'No description'}
         #max_completion_tokens=200
     )
 
+    profiler.observe("llm_request", time.perf_counter() - start)
+
     if resp.usage:
+        profiler.count("requests")
+        profiler.count("prompt_tokens", resp.usage.prompt_tokens)
+        profiler.count("completion_tokens", resp.usage.completion_tokens)
         input_cost = (resp.usage.prompt_tokens / 1_000_000) * INPUT_COST_PER_MILLION_TOKENS
         output_cost = (resp.usage.completion_tokens / 1_000_000) * OUTPUT_COST_PER_MILLION_TOKENS
         total_cost = input_cost + output_cost
@@ -77,84 +89,77 @@ PR Body: {body[:500] if body else 'No description'}
 
 def classify_pr_regex(title, body):
     """Try to classify PR using regex patterns. Returns None if uncertain."""
-    title_lower = title.lower()
-    body_lower = (body or "").lower()
-    text = title_lower + " " + body_lower
-
-    # Dependency updates
-    if any(word in title_lower for word in ['dependabot', 'bump', 'update dependencies']):
-        return 'dependency_update'
-
-    # Documentation
-    if any(word in title_lower for word in ['docs', 'documentation', 'readme', 'comment']):
-        if 'fix' not in title_lower:  # "fix docs" is different from "add docs"
-            return 'documentation'
-
-    # Bug fixes - be conservative, look for clear signals
-    bug_patterns = [
-        r'\bfix(es|ed)?\s+(bug|issue|#\d+)',
-        r'\b(bug|issue)\s*fix',
-        r'^fix:',
-        r'\bsegfault\b',
-        r'\bcrash\b',
-        r'\bmemory leak\b'
-    ]
-    if any(re.search(pattern, title_lower) for pattern in bug_patterns):
-        return 'bug_fix'
-
-    # Refactoring
-    if any(word in title_lower for word in ['refactor', 'clean up', 'simplify', 'reorganize']):
-        return 'refactor'
-
-    # CI/Build
-    if any(word in title_lower for word in ['ci ', 'github actions', 'build', 'test']):
-        return 'ci_build'
-
-    # If we're unsure, return None to trigger LLM
-    return None
-
-def classify_pr(pr):
-    """Classify a PR, trying regex first, then LLM."""
+    match = pr_rules.classify(title)
+    if match is None:
+        # If we're unsure, return None to trigger LLM
+        return None
+    return {
+        "classification": {
+            "label": match.label,
+            "confidence": match.confidence,
+            "rationale": f"regex rule: {match.rule}"
+        },
+        "cost": 0.0,
+        "api_call_id": None
+    }
+
+def classify_pr(pr, cached=None):
+    """Classify a PR, trying regex first, then the cached LLM result, then the LLM.
+
+    The third value is True when the LLM label came from the cache.
+    """
     # Try regex first
-    category = classify_pr_regex(pr.title, pr.body)
+    with profiler.stage("regex"):
+        output = classify_pr_regex(pr.title, pr.body)
 
-    if category:
-        return category, 'regex'
+    if output:
+        return output, 'regex', False
+
+    if cached and pr.number in cached:
+        # Paid for in an earlier run
+        return {**cached[pr.number], "cost": 0.0}, 'llm', True
 
     # Fall back to LLM
-    output = classify_pr_llm(pr.title, pr.body)
-    return output, 'llm'
+    with profiler.stage("llm"):
+        output = classify_pr_llm(pr.title, pr.body)
+    return output, 'llm', False
 
-def main():
+def parse_args():
+    p = argparse.ArgumentParser(description="Classify merged PRs with regex rules and an LLM")
+    add_arguments(p, days=180)
+    add_profile_argument(p)
+    return p.parse_args()
+
+def classify_repo(repo_name, store, args, cache=None):
     # Date range
     end_date = datetime.now(timezone.utc)
-    start_date = end_date - timedelta(days=180)
+    start_date = end_date - timedelta(days=args.days)
 
-    print(f"📊 Fetching PRs from {start_date.date()} to {end_date.date()}...\n")
+    print(f"📊 Fetching PRs of {repo_name} from {start_date.date()} to {end_date.date()}...\n")
 
     # Get PRs
-    prs = repo.get_pulls(state='closed', sort='updated', direction='desc')
+    with profiler.stage("fetch"):
+        prs = merged_in_window(store.pulls(repo_name, start_date), start_date, end_date, args.limit)
+
+    cached = {}
+    if cache is not None and not args.relabel:
+        with profiler.stage("cache"):
+            cached = cache.get_many(repo_name, prs, MODEL)
 
     classified_prs = []
-    count = 0
     total_api_cost = 0.0
+    llm_sent = llm_cached = 0
 
     for pr in prs:
-        if pr.updated_at < start_date:
-            print(f"\nStopped - reached PRs older than {start_date.date()}")
-            break
-
-        count += 1
-        if count > 50:  # Limit for testing
-            print("\nStopped at 50 PRs")
-            break
-
-        # Only process merged PRs
-        if not pr.merged_at or pr.merged_at < start_date or pr.merged_at > end_date:
-            continue
-
         # Classify
-        output, method = classify_pr(pr)
+        output, method, from_cache = classify_pr(pr, cached)
+        if method == 'llm':
+            if from_cache:
+                llm_cached += 1
+            else:
+                llm_sent += 1
+                if cache is not None:
+                    cache.put(repo_name, pr, MODEL, output)
 
         classification = output['classification']
 
@@ -165,18 +170,26 @@ def main():
             'method': method,
             'merged_at': pr.merged_at,
             'confidence': classification.get("confidence"),
-            'rationale': classification.get("rationale")
+            'rationale': classification.get("rationale"),
+            'labels': "|".join(pr.labels),
+            'additions': pr.additions,
+            'deletions': pr.deletions,
+            'changed_files': pr.changed_files
         })
 
         total_api_cost += output['cost']
+        profiler.count("prs")
+        profiler.count("cost", output['cost'])
 
         print(f"PR #{pr.number}: {classification.get('label'):20} [{method}] - {pr.title[:60]}")
         print(f"    confidence: {classification.get('confidence')}\n    rationale: {classification.get('rationale')[:60]}")
         print(f"    cost: {output['cost']:.5f}")
+        if len(classified_prs) % 25 == 0:
+            print(f"[DEBUG] Classified {len(classified_prs)} PRs ({profiler.throughput(profiler.counters['prs'], profiler.counters['cost'])})")
 
     # Summary
     print(f"\n{'='*80}")
-    print("CLASSIFICATION SUMMARY")
+    print(f"CLASSIFICATION SUMMARY: {repo_name}")
     print(f"{'='*80}")
 
     categories = Counter(p['category'] for p in classified_prs)
@@ -191,23 +204,54 @@ def main():
     for method, count in methods.items():
         print(f"  {method:10} {count:3} ({100*count/len(classified_prs):.1f}%)")
 
-    # API usage
-    remaining, limit = g.rate_limiting
-    print(f"\nGitHub API requests remaining: {remaining}/{limit}")
-    print(f"Total API cost (this run): {total_api_cost:.5f}")
+    if cache is not None:
+        cache.commit()
+        print(f"LLM cache: {llm_cached} of {llm_cached + llm_sent} LLM labels reused, {llm_sent} PRs sent to the LLM")
+    profiler.count("cache_hits", llm_cached)
+    profiler.count("llm_sent", llm_sent)
+    print(f"Total API cost ({repo_name}): {total_api_cost:.5f}")
 
     # Save to CSV
-    csv_filename = f"pr_classifications_{repo.name}_{start_date.date()}_to_{end_date.date()}.csv"
+    csv_filename = f"pr_classifications_{repo_name.split('/')[-1]}_{start_date.date()}_to_{end_date.date()}.csv"
 
-    fieldnames=['number', 'title', 'category', 'method', 'merged_at','confidence','rationale']
+    fieldnames=['number', 'title', 'category', 'method', 'merged_at','confidence','rationale',
+                'labels', 'additions', 'deletions', 'changed_files']
 
-    with open(csv_filename, 'w', newline='', encoding='utf-8') as f:
+    with profiler.stage("write"), open(csv_filename, 'w', newline='', encoding='utf-8') as f:
         writer = csv.DictWriter(f, fieldnames=fieldnames)
         writer.writeheader()
         writer.writerows(classified_prs)
 
-    print(f"\nResults saved to: {csv_filename}")
+    print(f"\nResults saved to: {csv_filename}\n")
+    return total_api_cost
+
+def main():
+    args = parse_args()
+    store = open_store(args)
+    cache = PRLabelCache(args.label_cache, prompt_version(CLASSIFIER_SYSTEM, USER_PROMPT)) if args.label_cache else None
+
+    total_api_cost = 0.0
+    for repo_name in (README_REPOS if args.all_repos else args.repo):
+        total_api_cost += classify_repo(repo_name, store, args, cache)
+    if cache is not None:
+        cache.close()
+
+    print()
+    for line in pr_rules.report():
+        print(line)
+
+    # API usage
+    for line in store.report():
+        print(line)
+    print(f"Total API cost (this run): {total_api_cost:.5f}")
+    store.close()
+
+    if args.profile:
+        report = profiler.report(profiler.counters["prs"], total_api_cost,
+                                 repos=README_REPOS if args.all_repos else args.repo, graphql=args.graphql)
+        for line in profiler.summary(report):
+            print(line)
+        profiler.write(args.profile, report)
 
 if __name__ == '__main__':
     main()
-
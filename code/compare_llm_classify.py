@@ -1,27 +1,43 @@
-import github
+import argparse
 from datetime import datetime, timedelta, timezone
 import re
 import os
 import json
 import csv
-from openai import OpenAI
-from collections import Counter
+import asyncio
+import time
+from openai import AsyncOpenAI
+from collections import Counter, namedtuple
+from pr_store import README_REPOS, add_arguments, open_store, merged_in_window
+from label_cache import PRLabelCache, prompt_version
+from profiling import Profiler, add_arguments as add_profile_argument
 
-# Setup
-print("🔧 Setting up GitHub connection...")
-auth = github.Auth.Token("ghp_xxx")
-g = github.Github(auth=auth)
-repo = g.get_repo("serde-rs/json")
-print(f"✓ Connected to repository: {repo.full_name}\n")
+# PRs classified at once; every provider is queried concurrently for each of them
+PR_WORKERS = 8
 
-INPUT_COST_PER_MILLION_TOKENS = 0.25
-OUTPUT_COST_PER_MILLION_TOKENS = 2.00
+Provider = namedtuple("Provider", ["name", "model", "base_url", "api_key_env",
+                                   "input_cost_per_million", "output_cost_per_million"])
 
-openai_client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
-deepseek_client = OpenAI(
-    api_key=os.environ.get("DEEPSEEK_API_KEY"),
-    base_url="https://api.deepseek.com"
-)
+# Providers to compare, in column order. Any OpenAI-compatible endpoint can be added here.
+PROVIDERS = [
+    Provider("openai", "gpt-4.1-mini", None, "OPENAI_API_KEY", 0.25, 2.00),
+    # deepseek-chat list price, cache-miss input
+    Provider("deepseek", "deepseek-chat", "https://api.deepseek.com", "DEEPSEEK_API_KEY", 0.28, 0.42),
+]
+
+profiler = Profiler("compare_llm_classify", unit="prs")
+
+
+def provider_client(provider, clients):
+    """One AsyncOpenAI client per provider in `clients`, created on first use.
+
+    A client's connections belong to the event loop that opened them, so
+    every `asyncio.run` gets its own `clients` and closes them at the end.
+    """
+    if provider.name not in clients:
+        clients[provider.name] = AsyncOpenAI(api_key=os.environ.get(provider.api_key_env),
+                                             base_url=provider.base_url)
+    return clients[provider.name]
 
 CLASSIFIER_SYSTEM = """You are a precise PR classifier.
 Return valid JSON only in the following format:
@@ -43,56 +59,25 @@ Decision hierarchy:
 Always output valid JSON and ignore unrelated text or boilerplate.
 """
 
-def classify_pr_openai(title, body):
-    user = f"""Classify this commit.
+USER_PROMPT = """Classify this commit.
 
 Commit message:
 ---
 PR Title: {title}
-PR Body: {body[:500] if body else 'No description'}
+PR Body: {body}
 ---
 """
 
-    resp = openai_client.chat.completions.create(
-        model="gpt-4.1-mini",
-        # temperature=0,
-        response_format={"type":"json_object"},
-        messages=[
-            {"role": "system", "content": CLASSIFIER_SYSTEM},
-            {"role": "user", "content": user},
-        ],
-        #reasoning={"effort": "low"}
-        #max_completion_tokens=200
-    )
-
-    if resp.usage:
-        input_cost = (resp.usage.prompt_tokens / 1_000_000) * INPUT_COST_PER_MILLION_TOKENS
-        output_cost = (resp.usage.completion_tokens / 1_000_000) * OUTPUT_COST_PER_MILLION_TOKENS
-        total_cost = input_cost + output_cost
-    else:
-        total_cost = 0.0
-
-    # Return a dictionary with classification and cost
-    classification = json.loads(resp.choices[0].message.content)
-
-    return {
-        "classification": classification,
-        "cost": total_cost,
-        "api_call_id": resp.id
-    }
-
-def classify_pr_deepseek(title, body):
-    user = f"""Classify this commit.
+def cache_model(provider):
+    # Cache entries are per provider, in case two providers serve a model under the same name
+    return f"{provider.name}/{provider.model}"
 
-Commit message:
----
-PR Title: {title}
-PR Body: {body[:500] if body else 'No description'}
----
-"""
+async def classify_pr_provider(provider, clients, title, body):
+    user = USER_PROMPT.format(title=title, body=body[:500] if body else 'No description')
 
-    resp = deepseek_client.chat.completions.create(
-        model="deepseek-chat",
+    start = time.perf_counter()
+    resp = await provider_client(provider, clients).chat.completions.create(
+        model=provider.model,
         # temperature=0,
         response_format={"type":"json_object"},
         messages=[
@@ -103,9 +88,14 @@ PR Body: {body[:500] if body else 'No description'}
         #max_completion_tokens=200
     )
 
+    profiler.observe(f"llm_request:{provider.name}", time.perf_counter() - start)
+
     if resp.usage:
-        input_cost = (resp.usage.prompt_tokens / 1_000_000) * INPUT_COST_PER_MILLION_TOKENS
-        output_cost = (resp.usage.completion_tokens / 1_000_000) * OUTPUT_COST_PER_MILLION_TOKENS
+        profiler.count(f"{provider.name}_requests")
+        profiler.count(f"{provider.name}_prompt_tokens", resp.usage.prompt_tokens)
+        profiler.count(f"{provider.name}_completion_tokens", resp.usage.completion_tokens)
+        input_cost = (resp.usage.prompt_tokens / 1_000_000) * provider.input_cost_per_million
+        output_cost = (resp.usage.completion_tokens / 1_000_000) * provider.output_cost_per_million
         total_cost = input_cost + output_cost
     else:
         total_cost = 0.0
@@ -119,125 +109,183 @@ PR Body: {body[:500] if body else 'No description'}
         "api_call_id": resp.id
     }
 
-def classify_pr(pr):
-    """Classify a PR with both OpenAI and DeepSeek."""
-    # Get both classifications
-    openai_output = classify_pr_openai(pr.title, pr.body)
-    deepseek_output = classify_pr_deepseek(pr.title, pr.body)
-
-    openai_class = openai_output['classification']
-    deepseek_class = deepseek_output['classification']
-
-    agreement = (openai_class.get('label') == deepseek_class.get('label'))
-
-    return {
-        'openai': openai_output,
-        'deepseek': deepseek_output,
-        'agreement': agreement
-    }
-
-def main():
+async def classify_pr(pr, cached, clients):
+    """Classify a PR with every provider at once; providers with a cached result for it are skipped.
+
+    `cached` maps provider name to {PR number: output}. Fresh results are marked
+    with "fresh" so the caller can store them.
+    """
+    todo = [p for p in PROVIDERS if pr.number not in cached.get(p.name, {})]
+    results = await asyncio.gather(
+        *(classify_pr_provider(p, clients, pr.title, pr.body) for p in todo), return_exceptions=True)
+    results = dict(zip((p.name for p in todo), results))
+
+    outputs = {}
+    for provider in PROVIDERS:
+        if provider.name not in results:
+            # Paid for in an earlier run
+            outputs[provider.name] = {**cached[provider.name][pr.number], "cost": 0.0}
+            continue
+        result = results[provider.name]
+        if isinstance(result, Exception):
+            print(f"[WARN] {provider.name} failed for PR #{pr.number}: {result}")
+            result = {"classification": {}, "cost": 0.0, "api_call_id": None}
+        else:
+            result["fresh"] = True
+        outputs[provider.name] = result
+
+    labels = [o['classification'].get('label') for o in outputs.values()]
+    agreement = None not in labels and len(set(labels)) == 1
+
+    return {**outputs, 'agreement': agreement}
+
+async def classify_prs(prs, workers, cached):
+    """Classify PRs with at most `workers` in flight. Results come back in input order."""
+    sem = asyncio.Semaphore(workers)
+    clients = {}
+
+    async def one(pr):
+        async with sem:
+            output = await classify_pr(pr, cached, clients)
+        labels = " ".join(f"{p.name}={output[p.name]['classification'].get('label') or '-':15}" for p in PROVIDERS)
+        print(f"PR #{pr.number}: {labels} {'✓' if output['agreement'] else '✗'}")
+        if not output['agreement']:
+            print(f"    DISAGREEMENT - manual review needed")
+        cost = sum(output[p.name]['cost'] for p in PROVIDERS)
+        print(f"    cost: {cost:.5f}")
+        profiler.count("prs")
+        profiler.count("cost", cost)
+        if profiler.counters["prs"] % 25 == 0:
+            print(f"[DEBUG] Classified {profiler.counters['prs']} PRs ({profiler.throughput(profiler.counters['prs'], profiler.counters['cost'])})")
+        return output
+
+    try:
+        return await asyncio.gather(*(one(pr) for pr in prs))
+    finally:
+        await asyncio.gather(*(client.close() for client in clients.values()))
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Compare PR labels across LLM providers")
+    add_arguments(p, days=30)
+    p.add_argument("--workers", type=int, default=PR_WORKERS, help="PRs classified at once")
+    add_profile_argument(p)
+    return p.parse_args()
+
+def compare_repo(repo_name, store, args, cache=None):
     # Date range
     end_date = datetime.now(timezone.utc)
-    start_date = end_date - timedelta(days=30)
+    start_date = end_date - timedelta(days=args.days)
 
-    print(f"📊 Fetching PRs from {start_date.date()} to {end_date.date()}...\n")
+    print(f"📊 Fetching PRs of {repo_name} from {start_date.date()} to {end_date.date()}...\n")
 
     # Get PRs
-    prs = repo.get_pulls(state='closed', sort='updated', direction='desc')
-
-    classified_prs = []
-    count = 0
-    total_api_cost = 0.0
-
-    for pr in prs:
-        if pr.updated_at < start_date:
-            print(f"\nStopped - reached PRs older than {start_date.date()}")
-            break
+    with profiler.stage("fetch"):
+        selected = merged_in_window(store.pulls(repo_name, start_date), start_date, end_date, args.limit)
 
-        count += 1
-        if count > 50:  # Limit for testing
-            print("\nStopped at 50 PRs")
-            break
+    cached = {}
+    if cache is not None and not args.relabel:
+        with profiler.stage("cache"):
+            cached = {p.name: cache.get_many(repo_name, selected, cache_model(p)) for p in PROVIDERS}
 
-        # Only process merged PRs
-        if not pr.merged_at or pr.merged_at < start_date or pr.merged_at > end_date:
-            continue
+    # Classify
+    with profiler.stage("llm"):
+        outputs = asyncio.run(classify_prs(selected, args.workers, cached))
 
-        # Classify
-        output = classify_pr(pr)
-
-        openai_class = output['openai']['classification']
-        deepseek_class = output['deepseek']['classification']
-
-        classified_prs.append({
-            'number': pr.number,
-            'title': pr.title,
-            'openai_category': openai_class.get('label'),
-            'openai_confidence': openai_class.get('confidence'),
-            'openai_rationale': openai_class.get('rationale'),
-            'openai_magnitude': openai_class.get('magnitude'),
-            'deepseek_category': deepseek_class.get('label'),
-            'deepseek_confidence': deepseek_class.get('confidence'),
-            'deepseek_rationale': deepseek_class.get('rationale'),
-            'deepseek_magnitude': deepseek_class.get('magnitude'),
-            'agreement': output['agreement'],
-            'merged_at': pr.merged_at
-        })
-
-        total_api_cost += output['openai']['cost'] + output['deepseek']['cost']
-
-        agree_symbol = '✓' if output['agreement'] else '✗'
-        print(f"PR #{pr.number}: OpenAI={openai_class.get('label'):15} DeepSeek={deepseek_class.get('label'):15} {agree_symbol}")
-        if not output['agreement']:
-            print(f"    DISAGREEMENT - manual review needed")
-        print(f"    cost: {output['openai']['cost'] + output['deepseek']['cost']:.5f}")
+    classified_prs = []
+    provider_costs = Counter()
+    sent = Counter()
+    for pr, output in zip(selected, outputs):
+        row = {'number': pr.number, 'title': pr.title}
+        for p in PROVIDERS:
+            if output[p.name].pop('fresh', False):
+                sent[p.name] += 1
+                if cache is not None:
+                    cache.put(repo_name, pr, cache_model(p), output[p.name])
+            classification = output[p.name]['classification']
+            row[f'{p.name}_category'] = classification.get('label')
+            row[f'{p.name}_confidence'] = classification.get('confidence')
+            row[f'{p.name}_rationale'] = classification.get('rationale')
+            row[f'{p.name}_magnitude'] = classification.get('magnitude')
+            provider_costs[p.name] += output[p.name]['cost']
+        row['agreement'] = output['agreement']
+        row['merged_at'] = pr.merged_at
+        classified_prs.append(row)
+
+    total_api_cost = sum(provider_costs.values())
 
     print(f"\n{'='*80}")
-    print("CLASSIFICATION SUMMARY")
+    print(f"CLASSIFICATION SUMMARY: {repo_name}")
     print(f"{'='*80}")
 
-    openai_categories = Counter(p['openai_category'] for p in classified_prs)
-    deepseek_categories = Counter(p['deepseek_category'] for p in classified_prs)
-
     print(f"\nTotal PRs classified: {len(classified_prs)}")
 
-    print(f"\nOpenAI categories:")
-    for cat, count in openai_categories.most_common():
-        print(f"  {cat:20} {count:3}")
-
-    print(f"\nDeepSeek categories:")
-    for cat, count in deepseek_categories.most_common():
-        print(f"  {cat:20} {count:3}")
-
-    # API usage
-    remaining, limit = g.rate_limiting
-    print(f"\nGitHub API requests remaining: {remaining}/{limit}")
-    print(f"Total API cost (this run): {total_api_cost:.5f}")
+    for p in PROVIDERS:
+        print(f"\n{p.name} categories ({p.model}):")
+        for cat, count in Counter(row[f'{p.name}_category'] for row in classified_prs).most_common():
+            print(f"  {str(cat):20} {count:3}")
+
+    print(f"\nTotal API cost ({repo_name}): {total_api_cost:.5f}")
+    for p in PROVIDERS:
+        print(f"  {p.name:10} {provider_costs[p.name]:.5f}")
+    if cache is not None:
+        cache.commit()
+        print(f"\nLLM cache:")
+        for p in PROVIDERS:
+            hits = len(cached.get(p.name, {}))
+            print(f"  {p.name:10} {hits} reused, {sent[p.name]} sent to the LLM")
+            profiler.count("cache_hits", hits)
 
     # Disagreement analysis
     disagreements = [p for p in classified_prs if not p['agreement']]
-    print(f"\nAgreement rate: {100*(1-len(disagreements)/len(classified_prs)):.1f}%")
+    if classified_prs:
+        print(f"\nAgreement rate: {100*(1-len(disagreements)/len(classified_prs)):.1f}%")
     if disagreements:
         print(f"\nDisagreements ({len(disagreements)}):")
-        for p in disagreements[:10]:  # Show first 10
-            print(f"  PR #{p['number']}: OpenAI={p['openai_category']}, DeepSeek={p['deepseek_category']}")
+        for row in disagreements[:10]:  # Show first 10
+            labels = ", ".join(f"{p.name}={row[f'{p.name}_category']}" for p in PROVIDERS)
+            print(f"  PR #{row['number']}: {labels}")
 
     # Save to CSV
-    csv_filename = f"pr_classifications_{repo.name}_llm_comparisons_{start_date.date()}_to_{end_date.date()}.csv"
+    csv_filename = f"pr_classifications_{repo_name.split('/')[-1]}_llm_comparisons_{start_date.date()}_to_{end_date.date()}.csv"
 
-    fieldnames = ['number', 'title',
-              'openai_category', 'openai_confidence', 'openai_rationale', 'openai_magnitude',
-              'deepseek_category', 'deepseek_confidence', 'deepseek_rationale', 'deepseek_magnitude',
-              'agreement', 'merged_at']
+    fieldnames = ['number', 'title']
+    for p in PROVIDERS:
+        fieldnames += [f'{p.name}_category', f'{p.name}_confidence', f'{p.name}_rationale', f'{p.name}_magnitude']
+    fieldnames += ['agreement', 'merged_at']
 
 
-    with open(csv_filename, 'w', newline='', encoding='utf-8') as f:
+    with profiler.stage("write"), open(csv_filename, 'w', newline='', encoding='utf-8') as f:
         writer = csv.DictWriter(f, fieldnames=fieldnames)
         writer.writeheader()
         writer.writerows(classified_prs)
 
-    print(f"\nResults saved to: {csv_filename}")
+    print(f"\nResults saved to: {csv_filename}\n")
+    return total_api_cost
+
+def main():
+    args = parse_args()
+    store = open_store(args)
+    cache = PRLabelCache(args.label_cache, prompt_version(CLASSIFIER_SYSTEM, USER_PROMPT)) if args.label_cache else None
+
+    total_api_cost = 0.0
+    for repo_name in (README_REPOS if args.all_repos else args.repo):
+        total_api_cost += compare_repo(repo_name, store, args, cache)
+    if cache is not None:
+        cache.close()
+
+    # API usage
+    for line in store.report():
+        print(line)
+    print(f"Total API cost (this run): {total_api_cost:.5f}")
+    store.close()
+
+    if args.profile:
+        report = profiler.report(profiler.counters["prs"], total_api_cost,
+                                 repos=README_REPOS if args.all_repos else args.repo,
+                                 providers=[p.name for p in PROVIDERS], workers=args.workers)
+        for line in profiler.summary(report):
+            print(line)
+        profiler.write(args.profile, report)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,486 @@
+#!/usr/bin/env python3
+"""Read mined outputs back without loading them whole.
+
+`Dataset(name)` opens whatever grab_commits.py wrote for `--saveas name`:
+the csv pair, the parquet directories, or a `--format store` SQLite file.
+`commits()` and `files()` stream rows as dicts with only the requested
+columns, decoded to the same types as the mining rows (ints, bools,
+datetimes, lists, and `diff_parsed` as a dict):
+
+    from dataset_reader import Dataset
+
+    ds = Dataset("openssl")
+    for row in ds.files(columns=["commit_hash", "path", "added_lines_count"],
+                        path="ssl/*.c", since="2023-01-01", until="2024-01-01"):
+        ...
+
+Filters:
+
+- `hashes`: only these commits
+- `since` / `until`: YYYY-MM-DD, compared against the commit date in UTC
+  (`since` <= date < `until`)
+- `path` (files only): a glob over the file's path in the repo, with
+  fnmatch rules, so `*` also matches "/"
+
+A filtered csv query goes through a sidecar index, `{name}_index.sqlite`,
+holding the byte offset, commit hash, UTC date and path of every row. The
+matching rows are then read straight from a memory map of the csv, so
+nothing else is parsed. The index is built on first use and extended in
+place when the csv has only grown since (a resumed mining run); any other
+change rebuilds it. Parquet queries use pyarrow's column projection and
+filters instead, and a store is queried directly.
+
+Only a column that is asked for gets decoded, so `diff_parsed` JSON is
+left alone unless it's requested. In csv outputs, `added_content` and
+`deleted_content` are rebuilt from `diff_parsed`, because the pipe-joined
+text can't be split back reliably.
+
+Outputs mined before the `path` column existed fall back to the file name
+for path filters.
+
+    python dataset_reader.py files --name openssl --path 'ssl/*.c' --since 2023-01-01 \\
+        --columns commit_hash,path,added_lines_count
+"""
+import argparse
+import csv
+import hashlib
+import json
+import mmap
+import os
+import sqlite3
+import sys
+from datetime import datetime, timezone
+from fnmatch import fnmatchcase
+
+from diff_store import DiffStore, utc_date
+
+DATA_DIR = "../data"
+# Bytes at the end of the indexed part of a csv that must be unchanged for the index to be extended
+TAIL_BYTES = 4096
+
+# Diff cells can be far larger than the csv module's default field limit
+csv.field_size_limit(sys.maxsize)
+
+INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (
+    kind TEXT PRIMARY KEY,
+    path TEXT,
+    header TEXT,
+    indexed_to INTEGER,
+    tail_sha1 TEXT
+);
+CREATE TABLE IF NOT EXISTS commits (
+    offset INTEGER PRIMARY KEY,
+    hash TEXT,
+    date TEXT
+);
+CREATE INDEX IF NOT EXISTS commits_hash ON commits(hash);
+CREATE INDEX IF NOT EXISTS commits_date ON commits(date);
+CREATE TABLE IF NOT EXISTS files (
+    offset INTEGER PRIMARY KEY,
+    commit_hash TEXT,
+    date TEXT,
+    path TEXT
+);
+CREATE INDEX IF NOT EXISTS files_commit ON files(commit_hash);
+CREATE INDEX IF NOT EXISTS files_date ON files(date);
+"""
+
+
+def _int(value):
+    return int(value) if value != "" else None
+
+
+def _ints(value):
+    return [int(n) for n in value.split(",")] if value else []
+
+
+def _diff_lines(key):
+    return lambda row: [line[1] for line in json.loads(row["diff_parsed"])[key]]
+
+
+def _change_type(value):
+    # The csv holds PyDriller's enum as "ModificationType.MODIFY"; the other formats just the name
+    return value.rpartition(".")[2]
+
+
+# How each csv column turns back into the value grab_commits produced. Decoders
+# take the whole raw row, so derived columns can read the column they come from.
+COMMIT_DECODERS = {
+    "hash": lambda r: r["hash"],
+    "date": lambda r: datetime.fromisoformat(r["date"]),
+    "author": lambda r: r["author"],
+    "message": lambda r: r["message"],
+    "lines_added": lambda r: _int(r["lines_added"]),
+    "lines_removed": lambda r: _int(r["lines_removed"]),
+    "in_main_branch": lambda r: r["in_main_branch"] == "True",
+}
+FILE_DECODERS = {
+    "commit_hash": lambda r: r["commit_hash"],
+    "commit_message": lambda r: r["commit_message"],
+    "filename": lambda r: r["filename"],
+    "path": lambda r: r.get("path", r["filename"]),
+    "change_type": lambda r: _change_type(r["change_type"]),
+    "diff_parsed": lambda r: json.loads(r["diff_parsed"]),
+    "changed_methods": lambda r: r["changed_methods"].split(", ") if r["changed_methods"] else [],
+    "nloc": lambda r: _int(r["nloc"]),
+    "complexity": lambda r: _int(r["complexity"]),
+    "token_count": lambda r: _int(r["token_count"]),
+    "added_line_placement": lambda r: _ints(r["added_line_placement"]),
+    "added_content": _diff_lines("added"),
+    "deleted_line_placement": lambda r: _ints(r["deleted_line_placement"]),
+    "deleted_content": _diff_lines("deleted"),
+    "added_lines_count": lambda r: _int(r["added_lines_count"]),
+    "deleted_lines_count": lambda r: _int(r["deleted_lines_count"]),
+}
+
+
+def _projection(columns, decoders):
+    columns = list(columns or decoders)
+    unknown = [c for c in columns if c not in decoders]
+    if unknown:
+        raise ValueError(f"unknown columns: {', '.join(unknown)} (choose from {', '.join(decoders)})")
+    return columns
+
+
+def _records(mm, start):
+    """Yield (offset, fields) for each csv record in the map from byte `start`, which must begin a record."""
+    pos = start
+
+    def lines():
+        # Slicing instead of seek/readline, so several readers can share one map
+        nonlocal pos
+        size = mm.size()
+        while pos < size:
+            end = mm.find(b"\n", pos)
+            end = size if end == -1 else end + 1
+            line = mm[pos:end]
+            pos = end
+            yield line.decode("utf-8")
+
+    record_start = start
+    # csv.reader pulls only the lines of the record it returns, so `pos` is where the next one starts
+    for fields in csv.reader(lines()):
+        yield record_start, fields
+        record_start = pos
+
+
+def _read_at(mm, offset):
+    return next(_records(mm, offset))[1]
+
+
+class CsvSource:
+    """One csv output, memory mapped, with its header."""
+
+    def __init__(self, path):
+        self.path = path
+        self._f = open(path, "rb")
+        size = os.path.getsize(path)
+        # An empty file can't be mapped, and has nothing to read anyway
+        self.mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        if self.mm is None:
+            self.header, self.data_start = [], 0
+        else:
+            self.header = _read_at(self.mm, 0)
+            # Column names never contain a newline, so the header is exactly the first line
+            self.data_start = self.mm.find(b"\n") + 1
+
+    def size(self):
+        return self.mm.size() if self.mm is not None else 0
+
+    def rows(self, start=None):
+        """(offset, raw row dict) for every row from `start` (the first row by default)."""
+        if self.mm is None:
+            return
+        for offset, fields in _records(self.mm, self.data_start if start is None else start):
+            yield offset, dict(zip(self.header, fields))
+
+    def row_at(self, offset):
+        return dict(zip(self.header, _read_at(self.mm, offset)))
+
+    def tail_sha1(self, end):
+        return hashlib.sha1(self.mm[max(0, end - TAIL_BYTES):end] if self.mm is not None else b"").hexdigest()
+
+    def close(self):
+        if self.mm is not None:
+            self.mm.close()
+        self._f.close()
+
+
+class SidecarIndex:
+    """Offsets, commit hashes, dates and paths of every row of a csv pair, in SQLite."""
+
+    def __init__(self, path, commit_source, file_source):
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.executescript(INDEX_SCHEMA)
+        self._conn.create_function("fnmatch", 2, lambda name, pattern: name is not None and fnmatchcase(name, pattern),
+                                   deterministic=True)
+        self.commit_source = commit_source
+        self.file_source = file_source
+
+    def _state(self, kind, source):
+        """Where to continue indexing `source` from, or None when the index has to start over."""
+        row = self._conn.execute("SELECT path, header, indexed_to, tail_sha1 FROM sources WHERE kind = ?",
+                                 (kind,)).fetchone()
+        if row is None:
+            return None
+        path, header, indexed_to, tail = row
+        if (path != os.path.abspath(source.path) or json.loads(header) != source.header
+                or source.size() < indexed_to or source.tail_sha1(indexed_to) != tail):
+            return None
+        return indexed_to
+
+    def refresh(self):
+        """Bring the index up to date with the csv files. Returns the number of rows added."""
+        commit_from = self._state("commits", self.commit_source)
+        file_from = self._state("files", self.file_source)
+        if commit_from is None or file_from is None:
+            with self._conn:
+                self._conn.execute("DELETE FROM sources")
+                self._conn.execute("DELETE FROM commits")
+                self._conn.execute("DELETE FROM files")
+            commit_from = file_from = None
+        added = 0
+        with self._conn:
+            added += self._extend("commits", self.commit_source, commit_from,
+                                  lambda r: (r["hash"], utc_date(r["date"])))
+            dates = dict(self._conn.execute("SELECT hash, date FROM commits"))
+            added += self._extend("files", self.file_source, file_from,
+                                  lambda r: (r["commit_hash"], dates.get(r["commit_hash"]), r.get("path", r["filename"])))
+        return added
+
+    def _extend(self, kind, source, start, values):
+        """Index the rows of `source` from byte `start` (None: from the first row)."""
+        added = 0
+        batch = []
+        for offset, row in source.rows(start):
+            batch.append((offset, *values(row)))
+            if len(batch) >= 10000:
+                added += self._insert(kind, batch)
+                batch = []
+        added += self._insert(kind, batch)
+        end = source.size()
+        self._conn.execute("INSERT OR REPLACE INTO sources VALUES (?, ?, ?, ?, ?)",
+                           (kind, os.path.abspath(source.path), json.dumps(source.header), end, source.tail_sha1(end)))
+        return added
+
+    def _insert(self, kind, batch):
+        if batch:
+            marks = ", ".join("?" * len(batch[0]))
+            self._conn.executemany(f"INSERT OR REPLACE INTO {kind} VALUES ({marks})", batch)
+        return len(batch)
+
+    def offsets(self, kind, hashes=None, since=None, until=None, path=None):
+        """Offsets of the matching rows, in file order."""
+        hash_column = "hash" if kind == "commits" else "commit_hash"
+        clauses, params = [], []
+        if hashes is not None:
+            self._conn.execute("CREATE TEMP TABLE IF NOT EXISTS wanted (hash TEXT PRIMARY KEY)")
+            self._conn.execute("DELETE FROM wanted")
+            self._conn.executemany("INSERT OR IGNORE INTO wanted VALUES (?)", ((h,) for h in hashes))
+            clauses.append(f"{hash_column} IN (SELECT hash FROM wanted)")
+        if since:
+            clauses.append("date >= ?")
+            params.append(since)
+        if until:
+            clauses.append("date < ?")
+            params.append(until)
+        if path:
+            clauses.append("fnmatch(path, ?)")
+            params.append(path)
+        where = " WHERE " + " AND ".join(clauses) if clauses else ""
+        return [offset for offset, in self._conn.execute(f"SELECT offset FROM {kind}{where} ORDER BY offset", params)]
+
+    def close(self):
+        self._conn.close()
+
+
+def _utc_bound(day):
+    return datetime.fromisoformat(day).replace(tzinfo=timezone.utc)
+
+
+class Dataset:
+    """The outputs of one grab_commits.py run, found by their `--saveas` name."""
+
+    def __init__(self, name, data_dir=DATA_DIR):
+        self.name = name
+        base = os.path.join(data_dir, name)
+        self._index_path = f"{base}_index.sqlite"
+        self._csv = self._index = self._store = None
+        if os.path.exists(f"{base}_commit_info.csv"):
+            self.format = "csv"
+            files = f"{base}_modified_file_info.csv"
+            self._csv = (CsvSource(f"{base}_commit_info.csv"), CsvSource(files) if os.path.exists(files) else None)
+        elif os.path.isdir(f"{base}_commit_info.parquet"):
+            self.format = "parquet"
+            self._parquet = (f"{base}_commit_info.parquet", f"{base}_modified_file_info.parquet")
+        elif os.path.exists(f"{base}_diffs.sqlite"):
+            self.format = "store"
+            self._store = DiffStore(f"{base}_diffs.sqlite")
+        else:
+            raise FileNotFoundError(f"No mined outputs for {name} in {data_dir}")
+
+    def index(self):
+        """The csv sidecar index, refreshed. Built on first use."""
+        if self._index is None:
+            commit_source, file_source = self._csv
+            if file_source is None:
+                raise FileNotFoundError(f"No modified_file_info csv for {self.name} (mined with --commits-only?)")
+            self._index = SidecarIndex(self._index_path, commit_source, file_source)
+            added = self._index.refresh()
+            if added:
+                print(f"[INFO] Indexed {added:,} rows into {self._index_path}", file=sys.stderr)
+        return self._index
+
+    def commits(self, columns=None, hashes=None, since=None, until=None):
+        """Commit rows with only `columns` (all by default), filtered by commit hash and date."""
+        columns = _projection(columns, COMMIT_DECODERS)
+        if self.format == "store":
+            for row in self._store.commits(hashes=hashes, since=since, until=until):
+                yield {c: row[c] for c in columns}
+        elif self.format == "parquet":
+            yield from self._parquet_rows(self._parquet[0], columns, "hash", hashes, since, until)
+        else:
+            yield from self._csv_rows("commits", self._csv[0], columns, COMMIT_DECODERS, hashes, since, until)
+
+    def files(self, columns=None, hashes=None, since=None, until=None, path=None):
+        """Modified file rows with only `columns` (all by default), filtered by commit, date and path."""
+        columns = _projection(columns, FILE_DECODERS)
+        if self.format == "store":
+            for diff in self._store.files(hashes=hashes, since=since, until=until, path=path):
+                # FileDiff builds its diff columns on access, so unrequested ones are never read
+                yield {c: getattr(diff, c) for c in columns}
+        elif self.format == "parquet":
+            if since or until:
+                in_range = {row["hash"] for row in self.commits(["hash"], since=since, until=until)}
+                hashes = in_range if hashes is None else in_range & set(hashes)
+            yield from self._parquet_rows(self._parquet[1], columns, "commit_hash", hashes, path_glob=path)
+        else:
+            yield from self._csv_rows("files", self._csv[1], columns, FILE_DECODERS, hashes, since, until, path)
+
+    def _csv_rows(self, kind, source, columns, decoders, hashes, since, until, path=None):
+        if source is None:
+            return
+        if hashes is None and not (since or until or path):
+            # Nothing to look up, so a plain sequential read is cheapest
+            rows = (row for _, row in source.rows())
+        else:
+            offsets = self.index().offsets(kind, hashes, since, until, path)
+            rows = (source.row_at(offset) for offset in offsets)
+        for row in rows:
+            yield {c: decoders[c](row) for c in columns}
+
+    def _parquet_rows(self, path, columns, hash_column, hashes, since=None, until=None, path_glob=None):
+        try:
+            import pyarrow.dataset as pads
+        except ImportError:
+            raise SystemExit("[ERROR] Reading parquet outputs needs pyarrow (pip install pyarrow)")
+        if not os.path.isdir(path):
+            return
+        dataset = pads.dataset(path, format="parquet")
+        names = dataset.schema.names
+        # diff_parsed isn't stored in parquet; the placement/content columns hold the same data
+        wanted = [c for c in columns if c in names]
+        if "diff_parsed" in columns:
+            wanted += [c for c in ("added_line_placement", "added_content", "deleted_line_placement",
+                                   "deleted_content") if c not in wanted]
+
+        expr = None
+        conditions = []
+        if hashes is not None:
+            hashes = list(hashes)
+            if not hashes:
+                return
+            conditions.append(pads.field(hash_column).isin(hashes))
+        if since:
+            conditions.append(pads.field("date") >= _utc_bound(since))
+        if until:
+            conditions.append(pads.field("date") < _utc_bound(until))
+        for condition in conditions:
+            expr = condition if expr is None else expr & condition
+
+        glob_column = "path" if "path" in names else "filename"
+        if path_glob and glob_column not in wanted:
+            wanted.append(glob_column)
+        for batch in dataset.to_batches(columns=wanted, filter=expr):
+            for row in batch.to_pylist():
+                if path_glob and not fnmatchcase(row[glob_column] or "", path_glob):
+                    continue
+                if "diff_parsed" in columns:
+                    row["diff_parsed"] = {
+                        "added": [list(p) for p in zip(row["added_line_placement"], row["added_content"])],
+                        "deleted": [list(p) for p in zip(row["deleted_line_placement"], row["deleted_content"])],
+                    }
+                if "path" in columns and "path" not in names:
+                    row["path"] = row["filename"]
+                yield {c: row.get(c) for c in columns}
+
+    def close(self):
+        if self._csv:
+            for source in self._csv:
+                if source is not None:
+                    source.close()
+        if self._index is not None:
+            self._index.close()
+
+
+def _cell(value):
+    if isinstance(value, (list, dict)):
+        return json.dumps(value)
+    return value
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Query the outputs of grab_commits.py")
+    sub = p.add_subparsers(dest="command", required=True)
+    s = sub.add_parser("index", help="Build or refresh the sidecar index of a csv dataset")
+    s.add_argument("--name", required=True, help="The --saveas name the outputs were mined with")
+    s.add_argument("--data-dir", default=DATA_DIR)
+    for command in ("commits", "files"):
+        s = sub.add_parser(command, help=f"Write matching {command} rows to stdout as csv")
+        s.add_argument("--name", required=True, help="The --saveas name the outputs were mined with")
+        s.add_argument("--data-dir", default=DATA_DIR)
+        s.add_argument("--columns", default=None, help="Comma-separated columns (default: all)")
+        s.add_argument("--hash", nargs="+", default=None, help="Only these commits")
+        s.add_argument("--since", default=None, help="YYYY-MM-DD (UTC)")
+        s.add_argument("--until", default=None, help="YYYY-MM-DD (UTC), exclusive")
+        s.add_argument("--limit", type=int, default=None)
+        if command == "files":
+            s.add_argument("--path", default=None, help='Glob over file paths, e.g. "ssl/*.c"')
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+    ds = Dataset(args.name, args.data_dir)
+    try:
+        if args.command == "index":
+            if ds.format != "csv":
+                print(f"[INFO] {args.name} is {ds.format}; only csv outputs need an index")
+                return
+            index = ds.index()
+            for table in ("commits", "files"):
+                print(f"{table + ':':10} {index._conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]:,} rows indexed")
+            return
+
+        columns = args.columns.split(",") if args.columns else None
+        filters = {"hashes": args.hash, "since": args.since, "until": args.until}
+        if args.command == "files":
+            rows = ds.files(columns, path=args.path, **filters)
+        else:
+            rows = ds.commits(columns, **filters)
+        writer = None
+        for i, row in enumerate(rows):
+            if args.limit is not None and i >= args.limit:
+                break
+            if writer is None:
+                writer = csv.DictWriter(sys.stdout, fieldnames=list(row))
+                writer.writeheader()
+            writer.writerow({k: _cell(v) for k, v in row.items()})
+    finally:
+        ds.close()
+
+
+if __name__ == "__main__":
+    main()
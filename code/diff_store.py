@@ -0,0 +1,473 @@
+#!/usr/bin/env python3
+"""Normalized storage for mined commits and their diffs.
+
+A `{name}_modified_file_info.csv` row repeats the commit message and stores
+every diff line three times (`diff_parsed`, the `*_content` strings and the
+`*_line_placement` lists). `--format store` in grab_commits.py writes one
+SQLite file per repo instead, with each fact stored once:
+
+- commits: one row per commit (the commit_info columns), plus `blob`, the
+  zlib-compressed text of every added and deleted line in the commit
+- files: one row per modified file, with its metrics and line counts
+- hunks: one row per run of consecutive added (`+`) or deleted (`-`)
+  lines: the first line number, the number of lines, and the offset and
+  length (in characters) of their text in the commit's decompressed blob.
+  The table is clustered on (file_id, kind, first_line), so a file's hunks
+  are adjacent on disk and need no separate index
+
+Readers get the old columns back on demand. `DiffStore.files()` yields
+`FileDiff` objects whose `diff_parsed`, `added_content`,
+`deleted_line_placement` etc. are only built when accessed, and the blob
+of a commit is only decompressed once per commit:
+
+    store = DiffStore("../data/curl_diffs.sqlite")
+    for f in store.files(commit_hash="3f2a..."):
+        print(f.filename, f.added_line_placement)
+
+`python diff_store.py export` writes the legacy csv files from a store, and
+`python diff_store.py stats` compares its size to the csv it replaces.
+"""
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import zlib
+from datetime import datetime, timezone
+from fnmatch import fnmatchcase
+
+# Blob text is one line per diff line; PyDriller splits diffs on "\n", so no line contains one
+LINE_END = "\n"
+# Level 3 is close to the default ratio at about half the cost
+COMPRESS_LEVEL = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS commits (
+    id INTEGER PRIMARY KEY,
+    hash TEXT NOT NULL UNIQUE,
+    date TEXT,
+    author TEXT,
+    message TEXT,
+    lines_added INTEGER,
+    lines_removed INTEGER,
+    in_main_branch INTEGER,
+    blob BLOB
+);
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    commit_id INTEGER NOT NULL REFERENCES commits(id),
+    filename TEXT,
+    path TEXT,
+    change_type TEXT,
+    changed_methods TEXT,
+    nloc INTEGER,
+    complexity INTEGER,
+    token_count INTEGER,
+    added_lines_count INTEGER,
+    deleted_lines_count INTEGER
+);
+CREATE INDEX IF NOT EXISTS files_commit ON files(commit_id);
+CREATE TABLE IF NOT EXISTS hunks (
+    file_id INTEGER NOT NULL REFERENCES files(id),
+    kind TEXT NOT NULL,
+    first_line INTEGER NOT NULL,
+    line_count INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    PRIMARY KEY (file_id, kind, first_line)
+) WITHOUT ROWID;
+"""
+
+COMMIT_COLUMNS = ["hash", "date", "author", "message", "lines_added", "lines_removed", "in_main_branch"]
+FILE_COLUMNS = ["filename", "path", "change_type", "changed_methods", "nloc", "complexity", "token_count",
+                "added_lines_count", "deleted_lines_count"]
+
+
+def _connect(path):
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    conn.create_function("utc_date", 1, utc_date, deterministic=True)
+    conn.create_function("fnmatch", 2, _fnmatch, deterministic=True)
+    return conn
+
+
+def is_store(path):
+    return path.endswith(".sqlite")
+
+
+def store_size(path):
+    """Commits stored so far; the checkpoint's unit for a store."""
+    conn = _connect(path)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM commits").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def truncate_store(path, size):
+    """Drop every commit after the first `size`, with its files and hunks."""
+    conn = _connect(path)
+    try:
+        with conn:
+            # Commits are only ever appended and cut from the end, so ids are 1..COUNT(*)
+            conn.execute("DELETE FROM hunks WHERE file_id IN (SELECT id FROM files WHERE commit_id > ?)", (size,))
+            conn.execute("DELETE FROM files WHERE commit_id > ?", (size,))
+            conn.execute("DELETE FROM commits WHERE id > ?", (size,))
+    finally:
+        conn.close()
+
+
+def _add_hunks(hunks, parts, pos, file_id, diff):
+    """Append a file's lines to the commit text in `parts` and its hunk rows to `hunks`.
+
+    `pos` is the length of the text so far; the new length is returned.
+    """
+    for kind, key in (("+", "added"), ("-", "deleted")):
+        first = prev = start = None
+        for number, content in diff[key]:
+            # Lines come sorted by number; a gap starts a new hunk
+            if first is None or number != prev + 1:
+                if first is not None:
+                    hunks.append((file_id, kind, first, prev - first + 1, start, pos - start))
+                first, start = number, pos
+            prev = number
+            parts.append(content)
+            pos += len(content) + 1
+        if first is not None:
+            hunks.append((file_id, kind, first, prev - first + 1, start, pos - start))
+    return pos
+
+
+def utc_date(value):
+    """A stored ISO date as a UTC "YYYY-MM-DDTHH:MM:SS" string, which sorts and compares as text."""
+    dt = datetime.fromisoformat(value)
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt.isoformat()
+
+
+def _where(hashes=None, since=None, until=None, path=None):
+    clauses, params = [], []
+    if hashes is not None:
+        hashes = list(hashes)
+        clauses.append(f"commits.hash IN ({', '.join('?' * len(hashes))})")
+        params += hashes
+    if since:
+        clauses.append("utc_date(commits.date) >= ?")
+        params.append(since)
+    if until:
+        clauses.append("utc_date(commits.date) < ?")
+        params.append(until)
+    if path:
+        clauses.append("fnmatch(files.path, ?)")
+        params.append(path)
+    return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+
+def _fnmatch(name, pattern):
+    return name is not None and fnmatchcase(name, pattern)
+
+
+def _change_type(value):
+    # PyDriller's ModificationType, or its name when the row came from elsewhere
+    return getattr(value, "name", value)
+
+
+class DiffStore:
+    """Writes mined rows into a store, and reads them back.
+
+    For writing, `commit_writer()` and `file_writer()` return objects with
+    the same interface as the writers in writers.py, so the mining loops
+    don't change. Rows are buffered until `flush()`, which writes every
+    buffered commit with its files and hunks in one transaction.
+    """
+
+    def __init__(self, path, append=True):
+        self.path = path
+        if not append:
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+        self._conn = _connect(path)
+        self._commits = []
+        self._files = {}
+        self._blob_cache = (None, None)
+        self.rows_written = 0
+
+    # -- writing --
+
+    def commit_writer(self):
+        return _StoreWriter(self, self._add_commit)
+
+    def file_writer(self):
+        return _StoreWriter(self, self._add_file)
+
+    def _add_commit(self, row):
+        self._commits.append(row)
+
+    def _add_file(self, row):
+        self._files.setdefault(row["commit_hash"], []).append(row)
+
+    def flush(self):
+        if not self._commits:
+            return
+        commits, files, hunks = [], [], []
+        with self._conn:
+            # Ids are assigned here so each table takes one executemany per flush
+            commit_id, file_id = self._conn.execute(
+                "SELECT (SELECT COALESCE(MAX(id), 0) FROM commits), (SELECT COALESCE(MAX(id), 0) FROM files)").fetchone()
+            for commit in self._commits:
+                commit_id += 1
+                parts = []
+                pos = 0
+                for f in self._files.pop(commit["hash"], []):
+                    file_id += 1
+                    methods = f["changed_methods"]
+                    files.append((file_id, commit_id, f["filename"], f["path"], _change_type(f["change_type"]),
+                                  json.dumps(methods) if methods is not None else None, f["nloc"],
+                                  f["complexity"], f["token_count"], f["added_lines_count"], f["deleted_lines_count"]))
+                    pos = _add_hunks(hunks, parts, pos, file_id, f["diff_parsed"])
+
+                date = commit["date"]
+                text = LINE_END.join(parts) + LINE_END if parts else ""
+                commits.append((commit_id, commit["hash"], date.isoformat() if isinstance(date, datetime) else date,
+                                commit["author"], commit["message"], commit["lines_added"], commit["lines_removed"],
+                                int(bool(commit["in_main_branch"])),
+                                zlib.compress(text.encode("utf-8"), COMPRESS_LEVEL)))
+
+            self._conn.executemany("INSERT INTO commits VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", commits)
+            self._conn.executemany("INSERT INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", files)
+            self._conn.executemany("INSERT INTO hunks VALUES (?, ?, ?, ?, ?, ?)", hunks)
+        self.rows_written += len(self._commits)
+        self._commits = []
+
+    def size(self):
+        return self._conn.execute("SELECT COUNT(*) FROM commits").fetchone()[0]
+
+    def close(self):
+        self.flush()
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # -- reading --
+
+    def commits(self, hashes=None, since=None, until=None):
+        """Commit rows in the commit_info schema, in mining order, optionally filtered like `files()`."""
+        where, params = _where(hashes, since, until)
+        for row in self._conn.execute(f"SELECT {', '.join(COMMIT_COLUMNS)} FROM commits{where} ORDER BY id", params):
+            commit = dict(zip(COMMIT_COLUMNS, row))
+            commit["date"] = datetime.fromisoformat(commit["date"])
+            commit["in_main_branch"] = bool(commit["in_main_branch"])
+            yield commit
+
+    def files(self, commit_hash=None, hashes=None, since=None, until=None, path=None):
+        """`FileDiff` for every modified file, in mining order.
+
+        Filters: one commit or a collection of commit `hashes`, a commit date
+        range (`since` <= UTC date < `until`, as YYYY-MM-DD) and a `path`
+        glob such as "ssl/*.c" (fnmatch rules; `*` also matches "/").
+        """
+        if commit_hash:
+            hashes = [commit_hash]
+        where, params = _where(hashes, since, until, path)
+        query = (f"SELECT files.id, files.commit_id, commits.hash, commits.message, "
+                 f"{', '.join('files.' + c for c in FILE_COLUMNS)} FROM files JOIN commits ON commits.id = files.commit_id")
+        # Hunks are read through separate cursors while this one is being iterated
+        for row in self._conn.execute(query + where + " ORDER BY files.id", params):
+            yield FileDiff(self, row[0], row[1], row[2], row[3], dict(zip(FILE_COLUMNS, row[4:])))
+
+    def _text(self, commit_id):
+        cached_id, text = self._blob_cache
+        if cached_id != commit_id:
+            blob = self._conn.execute("SELECT blob FROM commits WHERE id = ?", (commit_id,)).fetchone()[0]
+            text = zlib.decompress(blob).decode("utf-8")
+            self._blob_cache = (commit_id, text)
+        return text
+
+    def _lines(self, file_id, commit_id, kind):
+        hunks = self._conn.execute(
+            "SELECT first_line, line_count, offset, length FROM hunks WHERE file_id = ? AND kind = ? ORDER BY first_line",
+            (file_id, kind)).fetchall()
+        if not hunks:
+            return []
+        text = self._text(commit_id)
+        lines = []
+        for first_line, count, offset, length in hunks:
+            contents = text[offset:offset + length].split(LINE_END)[:-1]
+            # [line, content] lists, as diff_parsed comes back from the csv and parquet readers
+            lines.extend([n, c] for n, c in zip(range(first_line, first_line + count), contents))
+        return lines
+
+
+class _StoreWriter:
+    """One side (commits or files) of a DiffStore, shaped like the writers in writers.py."""
+
+    def __init__(self, store, add):
+        self.path = store.path
+        self._store = store
+        self._add = add
+
+    def writerow(self, row):
+        self._add(row)
+
+    def writerows(self, rows):
+        for r in rows:
+            self._add(r)
+
+    def flush(self):
+        self._store.flush()
+
+    def size(self):
+        return self._store.size()
+
+    def close(self):
+        self._store.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class FileDiff:
+    """A modified file from a store. The diff columns are rebuilt from the hunks on first access."""
+
+    def __init__(self, store, file_id, commit_id, commit_hash, commit_message, fields):
+        self._store = store
+        self._file_id = file_id
+        self._commit_id = commit_id
+        self.commit_hash = commit_hash
+        self.commit_message = commit_message
+        self.filename = fields["filename"]
+        self.path = fields["path"]
+        self.change_type = fields["change_type"]
+        methods = fields["changed_methods"]
+        self.changed_methods = json.loads(methods) if methods is not None else None
+        self.nloc = fields["nloc"]
+        self.complexity = fields["complexity"]
+        self.token_count = fields["token_count"]
+        self.added_lines_count = fields["added_lines_count"]
+        self.deleted_lines_count = fields["deleted_lines_count"]
+        self._added = None
+        self._deleted = None
+
+    @property
+    def added(self):
+        if self._added is None:
+            self._added = self._store._lines(self._file_id, self._commit_id, "+")
+        return self._added
+
+    @property
+    def deleted(self):
+        if self._deleted is None:
+            self._deleted = self._store._lines(self._file_id, self._commit_id, "-")
+        return self._deleted
+
+    @property
+    def diff_parsed(self):
+        return {"added": self.added, "deleted": self.deleted}
+
+    @property
+    def added_line_placement(self):
+        return [n for n, _ in self.added]
+
+    @property
+    def added_content(self):
+        return [c for _, c in self.added]
+
+    @property
+    def deleted_line_placement(self):
+        return [n for n, _ in self.deleted]
+
+    @property
+    def deleted_content(self):
+        return [c for _, c in self.deleted]
+
+    def row(self):
+        """The full modified_file_info row, with native lists like grab_commits.modified_file_rows."""
+        return {
+            "commit_hash": self.commit_hash,
+            "commit_message": self.commit_message,
+            "filename": self.filename,
+            "path": self.path,
+            "change_type": self.change_type,
+            "diff_parsed": self.diff_parsed,
+            "changed_methods": self.changed_methods,
+            "nloc": self.nloc,
+            "complexity": self.complexity,
+            "added_line_placement": self.added_line_placement,
+            "added_content": self.added_content,
+            "deleted_line_placement": self.deleted_line_placement,
+            "deleted_content": self.deleted_content,
+            "added_lines_count": self.added_lines_count,
+            "deleted_lines_count": self.deleted_lines_count,
+            "token_count": self.token_count,
+        }
+
+
+def export_csv(store, commit_path, file_path):
+    """Write the legacy commit_info and modified_file_info csv files from a store."""
+    from grab_commits import COMMIT_FIELDNAMES, MODIFIED_FILE_FIELDNAMES, csv_file_row
+
+    with open(commit_path, "w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=COMMIT_FIELDNAMES)
+        w.writeheader()
+        w.writerows(store.commits())
+
+    with open(file_path, "w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=MODIFIED_FILE_FIELDNAMES)
+        w.writeheader()
+        for diff in store.files():
+            row = csv_file_row(diff.row())
+            # The mining csv writes PyDriller's enum as is
+            row["change_type"] = f"ModificationType.{row['change_type']}"
+            w.writerow(row)
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Inspect or export a diff store written by grab_commits.py --format store")
+    sub = p.add_subparsers(dest="command", required=True)
+    s = sub.add_parser("export", help="Write the legacy commit_info / modified_file_info csv files")
+    s.add_argument("--store", required=True)
+    s.add_argument("--saveas", required=True, help="Output prefix under ../data")
+    s = sub.add_parser("stats", help="Row counts and sizes")
+    s.add_argument("--store", required=True)
+    s.add_argument("--csv", default=None, help="A modified_file_info csv of the same repo to compare against")
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+    if not os.path.exists(args.store):
+        raise SystemExit(f"[ERROR] No store at {args.store}")
+    store = DiffStore(args.store)
+
+    if args.command == "export":
+        commit_path = f"../data/{args.saveas}_commit_info.csv"
+        file_path = f"../data/{args.saveas}_modified_file_info.csv"
+        export_csv(store, commit_path, file_path)
+        print(f"[INFO] Wrote {commit_path} and {file_path}")
+    else:
+        conn = store._conn
+        for table in ("commits", "files", "hunks"):
+            print(f"{table + ':':22} {conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]:,}")
+        blob_bytes = conn.execute("SELECT COALESCE(SUM(LENGTH(blob)), 0) FROM commits").fetchone()[0]
+        print(f"{'Compressed diffs:':22} {blob_bytes / 1e6:,.1f} MB")
+        size = sum(os.path.getsize(args.store + s) for s in ("", "-wal") if os.path.exists(args.store + s))
+        print(f"{'Store size:':22} {size / 1e6:,.1f} MB")
+        if args.csv:
+            csv_size = os.path.getsize(args.csv)
+            print(f"{'CSV size:':22} {csv_size / 1e6:,.1f} MB ({csv_size / max(size, 1):.1f}x the store)")
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
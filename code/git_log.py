@@ -0,0 +1,126 @@
+"""Commit metadata straight from `git log`, without PyDriller.
+
+PyDriller builds GitPython objects for every commit and runs a separate
+`git diff --numstat` for its insertions/deletions. The commit-level fields
+don't need any of that: one `git log --numstat` subprocess returns them
+all. Its output is parsed as it streams in, so memory stays flat on long
+histories.
+
+`iter_commits` yields rows in the same schema as `grab_commits.commit_row`
+(plus `merge`), in the same order as PyDriller (oldest first), with the same
+since/until/branch semantics:
+
+- lines_added / lines_removed: numstat against the first parent with
+  rename detection off, as GitPython's `Commit.stats`; binary files count 0
+- in_main_branch: whether the commit is reachable from the checked-out
+  branch. That set comes from one `git rev-list` instead of a
+  `git branch --contains` per commit.
+"""
+import shutil
+import subprocess
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime
+
+# Record and field separators; neither can appear in git's output otherwise
+RS = "\x1e"
+FS = "\x1f"
+LOG_FORMAT = f"{RS}%H{FS}%P{FS}%aI{FS}%an, <%ae>{FS}%B{FS}"
+
+
+def is_remote(repo):
+    return repo.startswith(("http://", "https://", "git@", "ssh://", "git://"))
+
+
+@contextmanager
+def local_repo(repo):
+    """A path git can read: the repo itself, or a temporary bare clone of a remote one."""
+    if not is_remote(repo):
+        yield repo
+        return
+    tmp_dir = tempfile.mkdtemp(prefix="git_log_")
+    try:
+        print(f"[INFO] Cloning {repo} into {tmp_dir}")
+        subprocess.run(["git", "clone", "--bare", "--quiet", repo, tmp_dir], check=True)
+        yield tmp_dir
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def _git(path, *args):
+    return subprocess.run(["git", "-C", path, *args], capture_output=True, text=True, check=True).stdout
+
+
+def main_branch_commits(path):
+    """Hashes reachable from the checked-out branch (empty on a detached HEAD, like PyDriller)."""
+    try:
+        branch = _git(path, "symbolic-ref", "--quiet", "--short", "HEAD").strip()
+        return set(_git(path, "rev-list", branch).split())
+    except subprocess.CalledProcessError:
+        # Detached HEAD, or a branch without commits yet
+        return set()
+
+
+def _parse_record(record, main_commits):
+    header, _, numstat = record.rpartition(FS)
+    commit_hash, parents, date, author, message = header.split(FS, 4)
+    added = removed = 0
+    for line in numstat.splitlines():
+        parts = line.split("\t", 2)
+        if len(parts) == 3:
+            # Binary files show "-" for both counts
+            added += int(parts[0]) if parts[0] != "-" else 0
+            removed += int(parts[1]) if parts[1] != "-" else 0
+    return {
+        "hash": commit_hash,
+        "date": datetime.fromisoformat(date),
+        "author": author,
+        "message": " ".join(message.split()),
+        "lines_added": added,
+        "lines_removed": removed,
+        "in_main_branch": commit_hash in main_commits,
+        "merge": len(parents.split()) > 1,
+    }
+
+
+def iter_commits(repo, since=None, until=None, branch=None, read_size=1 << 16):
+    """Yield one commit-row dict per commit, oldest first, including merges (flagged by `merge`)."""
+    with local_repo(repo) as path:
+        rev = branch or "HEAD"
+        try:
+            _git(path, "rev-parse", "--verify", "--quiet", f"{rev}^{{commit}}")
+        except subprocess.CalledProcessError:
+            if branch:
+                raise RuntimeError(f"No branch {branch} in {path}")
+            # An empty repository has no HEAD yet, and no commits to yield
+            return
+        main_commits = main_branch_commits(path)
+        cmd = ["git", "-C", path, "-c", "core.quotepath=off", "log", rev, "--reverse",
+               "--numstat", "--no-renames", "--diff-merges=first-parent", f"--format={LOG_FORMAT}"]
+        if since:
+            cmd.append(f"--since={since}")
+        if until:
+            cmd.append(f"--until={until}")
+
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        # Bytes are decoded per record, so a multi-byte character is never split between reads
+        buffer = b""
+        try:
+            while True:
+                chunk = proc.stdout.read(read_size)
+                if not chunk:
+                    break
+                buffer += chunk
+                *records, buffer = buffer.split(RS.encode())
+                for record in records:
+                    if record:
+                        yield _parse_record(record.decode("utf-8", errors="replace"), main_commits)
+            if buffer:
+                yield _parse_record(buffer.decode("utf-8", errors="replace"), main_commits)
+        finally:
+            proc.stdout.close()
+            stderr = proc.stderr.read().decode("utf-8", errors="replace")
+            proc.stderr.close()
+            code = proc.wait()
+        if code != 0:
+            raise RuntimeError(f"git log failed in {path}: {stderr.strip()}")
@@ -1,8 +1,24 @@
 #!/usr/bin/env python3
 import re, csv, argparse, sys
 from datetime import datetime
-from pydriller import Repository, __version__ as pydriller_version
+from pydriller import Repository, Git, __version__ as pydriller_version
+from git import Repo as GitRepo
 import json
+import multiprocessing
+import shutil
+import tempfile
+import time
+from contextlib import ExitStack
+from writers import open_writer
+from diff_store import DiffStore
+from checkpoint import Checkpoint
+from git_log import iter_commits
+from profiling import Profiler, add_arguments as add_profile_argument
+
+# Per-file fields that make PyDriller run lizard over the file source.
+# nloc, complexity and token_count share one pass over the new source;
+# changed_methods also parses the old source.
+METRIC_FIELDS = ["nloc", "complexity", "token_count", "changed_methods"]
 
 def parse_args():
     p = argparse.ArgumentParser(description="Get commit information and store as csv")
@@ -11,31 +27,271 @@ def parse_args():
     p.add_argument("--until", default=None, help="YYYY-MM-DD")
     p.add_argument("--branch", default=None, help="Branch")
     p.add_argument("--saveas", default="name", help="Output CSV")
-    return p.parse_args()
+    p.add_argument("--workers", type=int, default=1,
+                   help="Number of processes to mine with (1 = serial)")
+    p.add_argument("--chunk-size", type=int, default=50,
+                   help="Commits per work unit handed to a worker process")
+    p.add_argument("--format", choices=["csv", "parquet", "store"], default="csv",
+                   help="Output format (parquet needs pyarrow; store is one normalized SQLite file, see diff_store.py)")
+    p.add_argument("--flush-every", type=int, default=None,
+                   help="Flush outputs to disk and checkpoint every N commits (default 100 for csv, 1000 otherwise)")
+    p.add_argument("--fresh", action="store_true",
+                   help="Ignore any checkpoint and re-mine the whole history")
+    p.add_argument("--metrics", default="all",
+                   help=f"Comma-separated lizard metrics to compute: {','.join(METRIC_FIELDS)}, 'all' or 'none'")
+    p.add_argument("--diff-only", action="store_true",
+                   help="Skip source parsing entirely (same as --metrics none)")
+    p.add_argument("--commits-only", action="store_true",
+                   help="Write only the commit csv, read with one streamed git log instead of PyDriller")
+    add_profile_argument(p)
+    args = p.parse_args()
+    args.metrics = [] if args.diff_only else parse_metrics(p, args.metrics)
+    if args.flush_every is None:
+        # Every parquet flush writes a new part file and every store flush a transaction, so flush less often
+        args.flush_every = 100 if args.format == "csv" else 1000
+    return args
+
+def parse_metrics(parser, value):
+    if value == "all":
+        return list(METRIC_FIELDS)
+    if value in ("none", ""):
+        return []
+    metrics = [m.strip() for m in value.split(",") if m.strip()]
+    unknown = [m for m in metrics if m not in METRIC_FIELDS]
+    if unknown:
+        parser.error(f"unknown metrics: {', '.join(unknown)} (choose from {', '.join(METRIC_FIELDS)})")
+    # Keep the canonical order so the shared lizard pass is always timed on the same field
+    return [m for m in METRIC_FIELDS if m in metrics]
 
 def to_dt(s):
     return datetime.strptime(s, "%Y-%m-%d") if s else None
 
-def main():
-    args = parse_args()
-    since, until = to_dt(args.since), to_dt(args.until)
+def commit_row(commit):
+    return {
+        "hash": commit.hash,
+        "date": commit.author_date,
+        "author": str(commit.author),
+        "message": " ".join(commit.msg.split()),
+        # "branches": commit.branches,
+        "lines_added": commit.insertions,
+        "lines_removed": commit.deletions,
+        "in_main_branch": commit.in_main_branch
+    }
 
-    name = args.saveas
-    commit_saveas = f'../data/{name}_commit_info.csv'
-    modified_file_saveas = f'../data/{name}_modified_file_info.csv'
+def timed(timings, field, fn):
+    start = time.perf_counter()
+    value = fn()
+    timings[field] = timings.get(field, 0.0) + time.perf_counter() - start
+    return value
 
-    print(f"[INFO] PyDriller version: {pydriller_version}")
-    print(f"[INFO] Mining repo: {args.repo}")
-    if since or until:
-        print(f"[INFO] Date filter: since={args.since} until={args.until}")
-    if args.branch:
-        print(f"[INFO] Branch: {args.branch}")
-    print(f"[INFO] Commit Info Output CSV: {commit_saveas}")
-    print(f"[INFO] Modified Files Output CSV: {modified_file_saveas}\n")
+def modified_file_rows(commit, metrics=METRIC_FIELDS, timings=None):
+    if timings is None:
+        timings = {}
+    rows = []
+    # PyDriller runs the git diff for the whole commit on first access
+    modified_files = timed(timings, "git_diff", lambda: commit.modified_files)
+    for mf in modified_files:
+        diff_parsed = timed(timings, "diff_parsed", lambda: mf.diff_parsed)
 
-    commits_analyzed = 0
+        values = {}
+        for field in metrics:
+            if field == "changed_methods":
+                values[field] = timed(timings, field, lambda: sorted(method.name for method in mf.changed_methods))
+            else:
+                values[field] = timed(timings, field, lambda: getattr(mf, field))
+
+        # Rows keep native lists here; csv_file_row / parquet_file_row encode them per format
+        rows.append({
+            "commit_hash": commit.hash,
+            "commit_message": " ".join(commit.msg.split()),
+            "filename": mf.filename,
+            # Path in the repo after the change (before it, for deleted files)
+            "path": mf.new_path or mf.old_path,
+            "change_type": mf.change_type,
+            "diff_parsed": diff_parsed,
+            "changed_methods": values.get("changed_methods"),
+            "nloc": values.get("nloc"),
+            "complexity": values.get("complexity"),
+            "added_line_placement": [line_num for line_num, content in diff_parsed['added']],
+            "added_content": [content for line_num, content in diff_parsed['added']],
+
+            "deleted_line_placement": [line_num for line_num, content in diff_parsed['deleted']],
+            "deleted_content": [content for line_num, content in diff_parsed['deleted']],
+
+            "added_lines_count": mf.added_lines,
+            "deleted_lines_count": mf.deleted_lines,
+            "token_count": values.get("token_count")
+        })
+    return rows
+
+def csv_file_row(row):
+    row = dict(row)
+    row["diff_parsed"] = json.dumps(row["diff_parsed"]) # convert to actual csv
+    if row["changed_methods"] is not None:
+        row["changed_methods"] = ", ".join(row["changed_methods"])
+    row["added_line_placement"] = ",".join(str(n) for n in row["added_line_placement"])
+    row["added_content"] = "|".join(row["added_content"])
+    row["deleted_line_placement"] = ",".join(str(n) for n in row["deleted_line_placement"])
+    row["deleted_content"] = "|".join(row["deleted_content"])
+    return row
+
+def parquet_file_row(row):
+    # diff_parsed is not stored: the placement/content list columns hold the same data
+    row = dict(row)
+    row["change_type"] = row["change_type"].name
+    return row
+
+def is_remote(repo):
+    return repo.startswith(("git@", "https://", "http://", "git://"))
+
+def list_commit_hashes(repo_path, since, until, branch):
+    """Hashes in traversal order, using the same filters as a serial run."""
+    repo = Repository(
+        path_to_repo=repo_path,
+        since=since,
+        to=until,
+        only_in_branch=branch
+    )
+    return [commit.hash for commit in repo.traverse_commits()]
+
+def chunked(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+# Each worker process opens the repository once and reuses it for every chunk
+_worker_git = None
+_worker_metrics = METRIC_FIELDS
+
+def _init_worker(repo_path, metrics):
+    global _worker_git, _worker_metrics
+    _worker_metrics = metrics
+    # Opening a Repo writes to .git/config, so concurrent workers can race on the lock
+    for attempt in range(10):
+        try:
+            _worker_git = Git(repo_path)
+            return
+        except Exception:
+            if attempt == 9:
+                raise
+            time.sleep(0.1 * (attempt + 1))
+
+def _mine_chunk(hashes):
     commit_info = []
     modified_files_info = []
+    timings = {}
+    for h in hashes:
+        commit = timed(timings, "git_traversal", lambda: _worker_git.get_commit(h))
+        # Skip merges
+        if getattr(commit, "merge", False):
+            continue
+        commit_info.append(timed(timings, "commit_metadata", lambda: commit_row(commit)))
+        modified_files_info.extend(modified_file_rows(commit, _worker_metrics, timings))
+    return commit_info, modified_files_info, timings
+
+COMMIT_FIELDNAMES = ["hash", "date", "author", "message", "branches", "lines_added", "lines_removed", "in_main_branch"]
+MODIFIED_FILE_FIELDNAMES = ["commit_hash", "commit_message", "filename", "change_type", "diff_parsed", "changed_methods", "nloc", "complexity", "added_line_placement", "added_content", "deleted_line_placement", "deleted_content", "added_lines_count", "deleted_lines_count", "token_count", "path"]
+
+# Column types for --format parquet
+COMMIT_COLUMNS = {
+    "hash": "string",
+    "date": "timestamp",
+    "author": "string",
+    "message": "string",
+    "lines_added": "int64",
+    "lines_removed": "int64",
+    "in_main_branch": "bool",
+}
+MODIFIED_FILE_COLUMNS = {
+    "commit_hash": "string",
+    "commit_message": "string",
+    "filename": "string",
+    "change_type": "string",
+    "changed_methods": "list<string>",
+    "nloc": "int64",
+    "complexity": "int64",
+    "added_line_placement": "list<int64>",
+    "added_content": "list<string>",
+    "deleted_line_placement": "list<int64>",
+    "deleted_content": "list<string>",
+    "added_lines_count": "int64",
+    "deleted_lines_count": "int64",
+    "token_count": "int64",
+    # Added after the other columns, so outputs mined before it can still be appended to
+    "path": "string",
+}
+
+def open_outputs(args, name, append):
+    """Writers for the commit and modified file outputs (just the commit one with --commits-only)."""
+    if args.format == "store":
+        store = DiffStore(f'../data/{name}_diffs.sqlite', append=append)
+        writers = [store.commit_writer(), store.file_writer()]
+        return writers[:1] if args.commits_only else writers
+    writers = [open_writer(args.format, f'../data/{name}_commit_info', COMMIT_FIELDNAMES, COMMIT_COLUMNS,
+                           append=append)]
+    if not args.commits_only:
+        writers.append(open_writer(args.format, f'../data/{name}_modified_file_info', MODIFIED_FILE_FIELDNAMES,
+                                   MODIFIED_FILE_COLUMNS, append=append,
+                                   encode_csv=csv_file_row, encode_parquet=parquet_file_row))
+    return writers
+
+def save_checkpoint(args, checkpoint, writers):
+    checkpoint.save(writers, repo=args.repo, since=args.since, until=args.until, branch=args.branch,
+                    metrics=args.metrics, commits_only=args.commits_only, format=args.format)
+
+def output_paths(args, name):
+    """The files (or parquet directories) a run with these arguments writes to."""
+    if args.format == "store":
+        return [f'../data/{name}_diffs.sqlite']
+    paths = [f'../data/{name}_commit_info.{args.format}']
+    if not args.commits_only:
+        paths.append(f'../data/{name}_modified_file_info.{args.format}')
+    return paths
+
+def checkpoint_mismatch(args, name, state):
+    """Why a checkpoint can't be resumed with these arguments, or None if it can."""
+    # The outputs of the other mode can't be continued
+    if state.get("commits_only", False) != args.commits_only:
+        return "--commits-only differs"
+    # Its hashes were written to other outputs; resuming would leave these ones empty
+    if state.get("format", args.format) != args.format or sorted(state.get("outputs", {})) != output_paths(args, name):
+        return "--format differs"
+    if state.get("repo") != args.repo or state.get("branch") != args.branch:
+        return "--repo or --branch differs"
+    if to_dt(state.get("since")) != to_dt(args.since):
+        return "--since differs"
+    # Only extending the range is a resume; an earlier --until would keep rows outside it
+    old_until, new_until = to_dt(state.get("until")), to_dt(args.until)
+    if new_until and (old_until is None or new_until < old_until):
+        return "--until is earlier than before"
+    if not args.commits_only and state.get("metrics") != args.metrics:
+        return "--metrics differs"
+    return None
+
+def report_timings(timings, metrics):
+    print("Per-file field timings (seconds):")
+    for field in ["diff_parsed"] + METRIC_FIELDS:
+        if field in timings:
+            print(f"  {field:16} {timings[field]:10.2f}")
+        else:
+            print(f"  {field:16} {'skipped':>10}")
+    if any(m in metrics for m in ("nloc", "complexity", "token_count")):
+        print("  (nloc/complexity/token_count share one lizard pass, charged to the first one computed)")
+
+def report_profile(args, profiler, commits_analyzed):
+    if not args.profile:
+        return
+    report = profiler.report(commits_analyzed, repo=args.repo, saveas=args.saveas, format=args.format,
+                             workers=args.workers, metrics=args.metrics, commits_only=args.commits_only)
+    if args.workers > 1 and not args.commits_only:
+        report["note"] = "stages other than list_commits and write are summed over worker processes"
+    for line in profiler.summary(report):
+        print(line)
+    profiler.write(args.profile, report)
+
+def mine_serial(args, since, until, writers, checkpoint, profiler):
+    commit_writer, file_writer = writers
+    timings = profiler.stages
+    commits_analyzed = 0
+    skipped = 0
 
     repo = Repository(
         path_to_repo=args.repo,
@@ -44,81 +300,174 @@ def main():
         only_in_branch=args.branch
     )
 
-    for commit in repo.traverse_commits():
+    for commit in profiler.iterate("git_traversal", repo.traverse_commits()):
+        # Already mined by a previous run
+        if commit.hash in checkpoint.mined:
+            skipped += 1
+            continue
+
         commits_analyzed += 1
         if commits_analyzed % 100 == 0:
-            print(f"[DEBUG] Scanned {commits_analyzed} commits... last={commit.hash[:8]}")
+            print(f"[DEBUG] Scanned {commits_analyzed} commits... last={commit.hash[:8]} ({profiler.throughput(commits_analyzed)})")
+
+        checkpoint.mark(commit.hash)
 
         # Skip merges
-        if getattr(commit, "merge", False):
+        if not getattr(commit, "merge", False):
+            row = timed(timings, "commit_metadata", lambda: commit_row(commit))
+            file_rows = modified_file_rows(commit, args.metrics, timings)
+            with profiler.stage("write"):
+                commit_writer.writerow(row)
+                file_writer.writerows(file_rows)
+
+        if commits_analyzed % args.flush_every == 0:
+            with profiler.stage("write"):
+                save_checkpoint(args, checkpoint, writers)
+
+    return commits_analyzed, skipped
+
+def mine_commits_only(args, since, until, writers, checkpoint, profiler):
+    """Commit rows only, from git log; no per-file work, so there is nothing to parallelize."""
+    commit_writer, = writers
+    commits_analyzed = 0
+    skipped = 0
+
+    for row in profiler.iterate("git_log", iter_commits(args.repo, since, until, args.branch)):
+        if row["hash"] in checkpoint.mined:
+            skipped += 1
             continue
 
-        commit_info.append({
-            "hash": commit.hash,
-            "date": commit.author_date,
-            "author": commit.author,
-            "message": " ".join(commit.msg.split()),
-            # "branches": commit.branches,
-            "lines_added": commit.insertions,
-            "lines_removed": commit.deletions,
-            "in_main_branch": commit.in_main_branch
-        })
+        commits_analyzed += 1
+        if commits_analyzed % 1000 == 0:
+            print(f"[DEBUG] Scanned {commits_analyzed} commits... last={row['hash'][:8]} ({profiler.throughput(commits_analyzed)})")
+
+        checkpoint.mark(row["hash"])
+
+        with profiler.stage("write"):
+            # Skip merges
+            if not row.pop("merge"):
+                commit_writer.writerow(row)
+
+            if commits_analyzed % args.flush_every == 0:
+                save_checkpoint(args, checkpoint, writers)
+
+    return commits_analyzed, skipped
+
+def mine_parallel(args, since, until, writers, checkpoint, profiler):
+    commit_writer, file_writer = writers
+    tmp_dir = None
+    repo_path = args.repo
+    if is_remote(repo_path):
+        # Clone once up front instead of once per worker
+        tmp_dir = tempfile.mkdtemp(prefix="grab_commits_")
+        print(f"[INFO] Cloning {args.repo} into {tmp_dir}")
+        GitRepo.clone_from(url=args.repo, to_path=tmp_dir)
+        repo_path = tmp_dir
+
+    try:
+        with profiler.stage("list_commits"):
+            all_hashes = list_commit_hashes(repo_path, since, until, args.branch)
+        hashes = [h for h in all_hashes if h not in checkpoint.mined]
+        chunks = chunked(hashes, args.chunk_size)
+        print(f"[INFO] {len(hashes)} commits in {len(chunks)} chunks across {args.workers} workers")
+
+        commits_done = 0
+        last_flush = 0
+        with multiprocessing.Pool(args.workers, initializer=_init_worker, initargs=(repo_path, args.metrics)) as pool:
+            # imap keeps chunk order, so rows are written in traversal order
+            for chunk, (chunk_commits, chunk_files, chunk_timings) in zip(chunks, pool.imap(_mine_chunk, chunks)):
+                with profiler.stage("write"):
+                    commit_writer.writerows(chunk_commits)
+                    file_writer.writerows(chunk_files)
+                # Summed across workers, so this is CPU time rather than wall time
+                profiler.add_stages(chunk_timings)
+                for h in chunk:
+                    checkpoint.mark(h)
+                commits_done += len(chunk)
+                if commits_done - last_flush >= args.flush_every:
+                    with profiler.stage("write"):
+                        save_checkpoint(args, checkpoint, writers)
+                    last_flush = commits_done
+                print(f"[DEBUG] Scanned {commits_done}/{len(hashes)} commits... last={chunk[-1][:8]} ({profiler.throughput(commits_done)})")
+    finally:
+        if tmp_dir:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    return len(hashes), len(all_hashes) - len(hashes)
+
+def main():
+    args = parse_args()
+    since, until = to_dt(args.since), to_dt(args.until)
+
+    name = args.saveas
+    commit_saveas = f'../data/{name}_commit_info.{args.format}'
+    modified_file_saveas = f'../data/{name}_modified_file_info.{args.format}'
+
+    if not args.commits_only:
+        print(f"[INFO] PyDriller version: {pydriller_version}")
+    print(f"[INFO] Mining repo: {args.repo}")
+    if since or until:
+        print(f"[INFO] Date filter: since={args.since} until={args.until}")
+    if args.branch:
+        print(f"[INFO] Branch: {args.branch}")
+    if args.commits_only:
+        print("[INFO] Commits only: reading commit metadata with git log")
+        if args.workers > 1:
+            print("[WARN] --workers is ignored with --commits-only")
+    else:
+        if args.workers > 1:
+            print(f"[INFO] Workers: {args.workers}")
+        print(f"[INFO] Metrics: {', '.join(args.metrics) if args.metrics else 'none (diff only)'}")
+    if args.format == "store":
+        print(f"[INFO] Output: ../data/{name}_diffs.sqlite")
+    else:
+        print(f"[INFO] Commit Info Output: {commit_saveas}")
+        if not args.commits_only:
+            print(f"[INFO] Modified Files Output: {modified_file_saveas}")
+    print()
+
+    checkpoint = Checkpoint(name)
+    resuming = False
+    if not args.fresh and checkpoint.load():
+        mismatch = checkpoint_mismatch(args, name, checkpoint.state)
+        if mismatch:
+            print(f"[WARN] Checkpoint can't be resumed ({mismatch}), starting over")
+        else:
+            checkpoint.restore_outputs()
+            resuming = True
+            print(f"[INFO] Resuming from checkpoint: {len(checkpoint.mined)} commits already mined")
+    if not resuming:
+        checkpoint.reset()
+
+    profiler = Profiler("grab_commits")
+    if args.commits_only:
+        with ExitStack() as outputs:
+            writers = [outputs.enter_context(w) for w in open_outputs(args, name, resuming)]
+            commits_analyzed, skipped = mine_commits_only(args, since, until, writers, checkpoint, profiler)
+            with profiler.stage("write"):
+                save_checkpoint(args, checkpoint, writers)
 
+        print(f"Commits scanned:       {commits_analyzed}")
+        if resuming:
+            print(f"Already mined:         {skipped}")
+        report_profile(args, profiler, commits_analyzed)
+        return
 
-        for mf in commit.modified_files:
-            method_names = [method.name for method in mf.changed_methods]
-
-            added_lines = [str(line_num) for line_num, content in mf.diff_parsed['added']]
-            added_content = [content for line_num, content in mf.diff_parsed['added']]
-
-            deleted_lines = [str(line_num) for line_num, content in mf.diff_parsed['deleted']]
-            deleted_content = [content for line_num, content in mf.diff_parsed['deleted']]
-
-            modified_files_info.append({
-                "commit_hash": commit.hash,
-                "commit_message": " ".join(commit.msg.split()),
-                "filename": mf.filename,
-                "change_type": mf.change_type,
-                "diff_parsed": json.dumps(mf.diff_parsed), # convert to actual csv
-                "changed_methods": ", ".join(method_names),
-                "nloc": mf.nloc,
-                "complexity": mf.complexity,
-                "added_line_placement":",".join(added_lines),
-                "added_content": "|".join(added_content),
-
-                "deleted_line_placement":",".join(deleted_lines),
-                "deleted_content": "|".join(deleted_content),
-
-                "added_lines_count": mf.added_lines,
-                "deleted_lines_count": mf.deleted_lines,
-                "token_count": mf.token_count
-            })
-
-        # print(dir(mf.changed_methods))
-        # print(type(mf.changed_methods))
-        # print(mf.diff_parsed.keys())
-        # print(mf.diff_parsed['added'])
-        # return
-
-    # print(commit.branches)
-    # print(" ".join(commit.branches.split()))
-
-    # Write CSV
-    fieldnames = ["hash", "date", "author", "message", "branches", "lines_added", "lines_removed", "in_main_branch"]
-    with open(commit_saveas, "w", newline="", encoding="utf-8") as f:
-        w = csv.DictWriter(f, fieldnames=fieldnames)
-        w.writeheader()
-        for r in commit_info:
-            w.writerow(r)
-
-    fieldnames = ["commit_hash", "commit_message", "filename", "change_type", "diff_parsed", "changed_methods", "nloc", "complexity", "added_line_placement", "added_content", "deleted_line_placement", "deleted_content", "added_lines_count", "deleted_lines_count", "token_count"]
-    with open(modified_file_saveas, "w", newline="", encoding="utf-8") as f:
-        w = csv.DictWriter(f, fieldnames=fieldnames)
-        w.writeheader()
-        for r in modified_files_info:
-            w.writerow(r)
+    # Rows are streamed to the outputs as each commit is mined
+    with ExitStack() as outputs:
+        writers = [outputs.enter_context(w) for w in open_outputs(args, name, resuming)]
+        if args.workers > 1:
+            commits_analyzed, skipped = mine_parallel(args, since, until, writers, checkpoint, profiler)
+        else:
+            commits_analyzed, skipped = mine_serial(args, since, until, writers, checkpoint, profiler)
+        with profiler.stage("write"):
+            save_checkpoint(args, checkpoint, writers)
 
     print(f"Commits scanned:       {commits_analyzed}")
+    if resuming:
+        print(f"Already mined:         {skipped}")
+    report_timings(profiler.stages, args.metrics)
+    report_profile(args, profiler, commits_analyzed)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,310 @@
+"""SQLite-backed LLM label cache.
+
+Replaces the append-only `label_cache.jsonl`. Entries are keyed on
+(commit hash, model, prompt version), so changing the model or the
+classifier prompt misses the cache instead of reusing stale labels. The
+database runs in WAL mode, so several labeling processes can share one
+cache file. Writes are batched into one transaction per `commit()`.
+
+Every entry also stores `msg_key`, a hash of the normalized commit message.
+Commits with the same message text (dependabot bumps, "Fix typo",
+cherry-picks) can then reuse one label via `get_many_by_message`.
+
+Existing JSONL caches are imported once with `import_jsonl`; each imported
+path is recorded so later runs skip it.
+
+`PRLabelCache` does the same for the PR classifiers. It keeps one result per
+(repo, PR number, model, prompt version) along with the PR's `updated_at`, and
+a lookup only hits when `updated_at` still matches. A PR that was edited since
+it was labeled is sent to the LLM again, and its new result replaces the old one.
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+
+COLUMNS = ["hash", "model", "prompt_version", "label", "confidence", "rationale", "msg", "msg_key", "api_call_id", "cost", "created_at"]
+
+# Parts of a message that differ between commits without changing what the commit is
+_TRAILER_RE = re.compile(
+    r"\b(signed-off-by|co-authored-by|reviewed-by|acked-by|tested-by|reported-by|suggested-by|cc):\s*[^<\n]*<[^>\n]*>",
+    re.IGNORECASE)
+_CHERRY_PICK_RE = re.compile(r"\(cherry picked from commit [0-9a-f]{7,40}\)", re.IGNORECASE)
+_CHANGE_ID_RE = re.compile(r"\bchange-id:\s*i[0-9a-f]{8,40}\b", re.IGNORECASE)
+_SHA_RE = re.compile(r"\b[0-9a-f]{7,40}\b")
+_VERSION_RE = re.compile(r"\bv?\d+(\.\d+)+([-+.][0-9a-z.]+)?\b", re.IGNORECASE)
+
+
+def normalize_message(message):
+    """Message text with trailers, commit ids and version numbers stripped, for deduplication."""
+    text = message or ""
+    text = _TRAILER_RE.sub(" ", text)
+    text = _CHERRY_PICK_RE.sub(" ", text)
+    text = _CHANGE_ID_RE.sub(" ", text)
+    text = _SHA_RE.sub("<sha>", text)
+    text = _VERSION_RE.sub("<version>", text)
+    return " ".join(text.casefold().split())
+
+
+def message_key(message):
+    return hashlib.sha256(normalize_message(message).encode("utf-8")).hexdigest()[:24]
+
+
+def prompt_version(*prompts):
+    """Short stable hash of the prompt text that produced a label."""
+    h = hashlib.sha256()
+    for p in prompts:
+        h.update(p.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()[:12]
+
+
+class LabelCache:
+    def __init__(self, path, model, prompt_version, batch_size=500):
+        self.path = path
+        self.model = model
+        self.prompt_version = prompt_version
+        self.batch_size = batch_size
+        self._pending = []
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Other processes may hold the write lock for a moment; wait instead of failing
+        self._db = sqlite3.connect(path, timeout=60)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS labels (
+                hash TEXT NOT NULL,
+                model TEXT NOT NULL,
+                prompt_version TEXT NOT NULL,
+                label TEXT,
+                confidence,
+                rationale TEXT,
+                msg TEXT,
+                msg_key TEXT,
+                api_call_id TEXT,
+                cost REAL,
+                created_at REAL,
+                PRIMARY KEY (hash, model, prompt_version)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS imports (
+                source TEXT PRIMARY KEY,
+                imported_at REAL,
+                records INTEGER
+            );
+        """)
+        self._migrate()
+        self._db.execute("CREATE INDEX IF NOT EXISTS labels_by_message ON labels (model, prompt_version, msg_key)")
+        self._db.commit()
+
+    def _migrate(self):
+        """Add msg_key to caches created before message deduplication and backfill it."""
+        columns = [row[1] for row in self._db.execute("PRAGMA table_info(labels)")]
+        if "msg_key" in columns:
+            return
+        self._db.execute("ALTER TABLE labels ADD COLUMN msg_key TEXT")
+        rows = self._db.execute("SELECT hash, model, prompt_version, msg FROM labels WHERE msg IS NOT NULL").fetchall()
+        self._db.executemany(
+            "UPDATE labels SET msg_key = ? WHERE hash = ? AND model = ? AND prompt_version = ?",
+            [(message_key(msg), h, model, pv) for h, model, pv, msg in rows],
+        )
+
+    def get(self, commit_hash):
+        return self.get_many([commit_hash]).get(commit_hash)
+
+    def get_many(self, hashes):
+        """{hash: record} for every hash that has a label under this model and prompt."""
+        found = {}
+        hashes = list(hashes)
+        # Stay well under SQLite's bound-parameter limit
+        for i in range(0, len(hashes), 500):
+            chunk = hashes[i:i + 500]
+            rows = self._db.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM labels "
+                f"WHERE model = ? AND prompt_version = ? AND hash IN ({', '.join('?' * len(chunk))})",
+                [self.model, self.prompt_version, *chunk],
+            )
+            for row in rows:
+                found[row[0]] = dict(zip(COLUMNS, row))
+        # Records not yet committed are visible too
+        wanted = set(hashes)
+        for record in self._pending:
+            if record["hash"] in wanted:
+                found[record["hash"]] = record
+        return found
+
+    def get_many_by_message(self, keys):
+        """{msg_key: record} with one labeled record for each message key that has one."""
+        found = {}
+        keys = list(set(keys))
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            rows = self._db.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM labels "
+                f"WHERE model = ? AND prompt_version = ? AND label IS NOT NULL AND msg_key IN ({', '.join('?' * len(chunk))})",
+                [self.model, self.prompt_version, *chunk],
+            )
+            for row in rows:
+                record = dict(zip(COLUMNS, row))
+                found.setdefault(record["msg_key"], record)
+        wanted = set(keys)
+        for record in self._pending:
+            if record.get("msg_key") in wanted and record.get("label") is not None:
+                found.setdefault(record["msg_key"], record)
+        return found
+
+    def __contains__(self, commit_hash):
+        return self.get(commit_hash) is not None
+
+    def put(self, record):
+        record = dict(record, model=self.model, prompt_version=self.prompt_version,
+                      created_at=record.get("created_at") or time.time())
+        if not record.get("msg_key") and record.get("msg") is not None:
+            record["msg_key"] = message_key(record["msg"])
+        self._pending.append(record)
+        if len(self._pending) >= self.batch_size:
+            self.commit()
+
+    def commit(self):
+        if not self._pending:
+            return
+        with self._db:
+            self._db.executemany(
+                f"INSERT OR REPLACE INTO labels ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                [[r.get(c) for c in COLUMNS] for r in self._pending],
+            )
+        self._pending = []
+
+    def __len__(self):
+        self.commit()
+        return self._db.execute("SELECT COUNT(*) FROM labels").fetchone()[0]
+
+    def import_jsonl(self, path):
+        """One-time import of a legacy JSONL cache under this cache's model and prompt version.
+
+        Returns the number of records imported (0 if this file was imported before).
+        """
+        source = os.path.abspath(path)
+        if self._db.execute("SELECT 1 FROM imports WHERE source = ?", [source]).fetchone():
+            return 0
+
+        count = 0
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    obj = json.loads(line)
+                    obj["hash"]
+                except Exception:
+                    continue
+                self.put(obj)
+                count += 1
+        self.commit()
+        with self._db:
+            self._db.execute("INSERT INTO imports VALUES (?, ?, ?)", [source, time.time(), count])
+        return count
+
+    def close(self):
+        self.commit()
+        self._db.close()
+
+
+PR_COLUMNS = ["repo", "number", "model", "prompt_version", "updated_at", "label", "output", "cost", "created_at"]
+
+
+def _revision(updated_at):
+    return updated_at.isoformat() if hasattr(updated_at, "isoformat") else updated_at
+
+
+class PRLabelCache:
+    """LLM results for PRs, shared by classify_pr.py and compare_llm_classify.py.
+
+    `output` is the classifier's whole result dict ({"classification", "cost",
+    "api_call_id"}), stored as JSON. One cache holds results for several models,
+    so `model` is passed per call.
+    """
+
+    def __init__(self, path, prompt_version, batch_size=200):
+        self.path = path
+        self.prompt_version = prompt_version
+        self.batch_size = batch_size
+        self._pending = {}
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=60)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS pr_labels (
+                repo TEXT NOT NULL,
+                number INTEGER NOT NULL,
+                model TEXT NOT NULL,
+                prompt_version TEXT NOT NULL,
+                updated_at TEXT,
+                label TEXT,
+                output TEXT,
+                cost REAL,
+                created_at REAL,
+                PRIMARY KEY (repo, number, model, prompt_version)
+            ) WITHOUT ROWID;
+        """)
+        self._db.commit()
+
+    def get_many(self, repo, prs, model):
+        """{number: output} for every PR labeled by `model` at its current `updated_at`."""
+        revisions = {pr.number: _revision(pr.updated_at) for pr in prs}
+        numbers = list(revisions)
+        found = {}
+        for i in range(0, len(numbers), 500):
+            chunk = numbers[i:i + 500]
+            rows = self._db.execute(
+                f"SELECT number, updated_at, output FROM pr_labels "
+                f"WHERE repo = ? AND model = ? AND prompt_version = ? AND number IN ({', '.join('?' * len(chunk))})",
+                [repo, model, self.prompt_version, *chunk],
+            )
+            for number, updated_at, output in rows:
+                if updated_at == revisions[number]:
+                    found[number] = json.loads(output)
+        for (r, number, m), record in self._pending.items():
+            if r == repo and m == model and revisions.get(number) == record["updated_at"]:
+                found[number] = json.loads(record["output"])
+        return found
+
+    def get(self, repo, pr, model):
+        return self.get_many(repo, [pr], model).get(pr.number)
+
+    def put(self, repo, pr, model, output):
+        self._pending[(repo, pr.number, model)] = {
+            "repo": repo,
+            "number": pr.number,
+            "model": model,
+            "prompt_version": self.prompt_version,
+            "updated_at": _revision(pr.updated_at),
+            "label": output["classification"].get("label"),
+            "output": json.dumps(output),
+            "cost": output.get("cost"),
+            "created_at": time.time(),
+        }
+        if len(self._pending) >= self.batch_size:
+            self.commit()
+
+    def commit(self):
+        if not self._pending:
+            return
+        with self._db:
+            self._db.executemany(
+                f"INSERT OR REPLACE INTO pr_labels ({', '.join(PR_COLUMNS)}) VALUES ({', '.join('?' * len(PR_COLUMNS))})",
+                [[r[c] for c in PR_COLUMNS] for r in self._pending.values()],
+            )
+        self._pending = {}
+
+    def __len__(self):
+        self.commit()
+        return self._db.execute("SELECT COUNT(*) FROM pr_labels").fetchone()[0]
+
+    def close(self):
+        self.commit()
+        self._db.close()
@@ -3,14 +3,33 @@ import re, csv, argparse, sys
 from datetime import datetime
 from pydriller import Repository, __version__ as pydriller_version
 import json
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI, RateLimitError, APIConnectionError, InternalServerError
 import os
+import asyncio
+import time
 import statistics as stats
+from collections import Counter
+from writers import open_writer
+from rate_limit import RateLimiter, call_with_backoff
+from label_cache import LabelCache, prompt_version, message_key
+from rules import RuleEngine, COMMIT_RULES
+from path_rules import PathTier
+from git_log import iter_commits
+from profiling import Profiler, add_arguments as add_profile_argument
+from grab_commits import commit_row
 
 INPUT_COST_PER_MILLION_TOKENS = 0.25
 OUTPUT_COST_PER_MILLION_TOKENS = 2.00
 
+MODEL = "gpt-5-mini"
+
+# The Batch API is billed at half the real-time price and caps each input file at 50,000 requests
+BATCH_DISCOUNT = 0.5
+BATCH_MAX_REQUESTS = 50_000
+
 client = OpenAI()
+# Retries are handled by call_with_backoff so they go through the rate limiter
+async_client = AsyncOpenAI(max_retries=0)
 
 CLASSIFIER_SYSTEM = """You are a precise commit classifier.
 Return strict JSON with keys:
@@ -26,7 +45,26 @@ Heuristics:
 - other: anything else
 """
 
-def classify_commit_llm(message: str, diff_hint: str = "") -> dict:
+LABELS = ["feature", "fix", "refactor", "docs", "test", "other"]
+
+# Same taxonomy and heuristics as CLASSIFIER_SYSTEM, so packed labels share its cache entries
+PACKED_SYSTEM = """You are a precise commit classifier.
+You get several commit messages, each prefixed with its index in brackets.
+Return strict JSON: {"labels": [{"index": int, "label": str, "confidence": float, "rationale": str}, ...]}
+with exactly one entry per commit message:
+- label: one of ["feature","fix","refactor","docs","test","other"]
+- confidence: float in [0,1]
+- rationale: 1 sentence max (no code blocks).
+""" + CLASSIFIER_SYSTEM[CLASSIFIER_SYSTEM.index("Heuristics:"):]
+
+# Packed items that fail validation are resent this many times before falling back to one request each
+PACK_RETRIES = 2
+
+# Requests and tokens across the run, for the tokens-per-commit summary
+token_usage = Counter()
+profiler = Profiler("label_commits_llm")
+
+def build_messages(message: str) -> list:
     user = f"""Classify this commit.
 
 Commit message:
@@ -34,41 +72,191 @@ Commit message:
 {message.strip()}
 ---
 """
+    return [
+        {"role": "system", "content": CLASSIFIER_SYSTEM},
+        {"role": "user", "content": user},
+    ]
 
-    resp = client.chat.completions.create(
-        model="gpt-5-mini",
-        # temperature=0,
-        response_format={"type":"json_object"},
-        messages=[
-            {"role": "system", "content": CLASSIFIER_SYSTEM},
-            {"role": "user", "content": user},
-        ],
-        #reasoning={"effort": "low"}
-        #max_completion_tokens=200
-    )
-
-    if resp.usage:
-        input_cost = (resp.usage.prompt_tokens / 1_000_000) * INPUT_COST_PER_MILLION_TOKENS
-        output_cost = (resp.usage.completion_tokens / 1_000_000) * OUTPUT_COST_PER_MILLION_TOKENS
-        total_cost = input_cost + output_cost
-    else:
-        total_cost = 0.0
+def build_packed_messages(messages) -> list:
+    commits = "\n".join(f"[{i}] {m.strip()}" for i, m in enumerate(messages))
+    user = f"""Classify these {len(messages)} commits.
 
+Commit messages:
+---
+{commits}
+---
+"""
+    return [
+        {"role": "system", "content": PACKED_SYSTEM},
+        {"role": "user", "content": user},
+    ]
+
+def token_cost(prompt_tokens, completion_tokens) -> float:
+    input_cost = (prompt_tokens / 1_000_000) * INPUT_COST_PER_MILLION_TOKENS
+    output_cost = (completion_tokens / 1_000_000) * OUTPUT_COST_PER_MILLION_TOKENS
+    return input_cost + output_cost
+
+def usage_cost(usage) -> float:
+    token_usage["requests"] += 1
+    if not usage:
+        return 0.0
+    token_usage["prompt_tokens"] += usage.prompt_tokens
+    token_usage["completion_tokens"] += usage.completion_tokens
+    return token_cost(usage.prompt_tokens, usage.completion_tokens)
+
+def parse_response(resp) -> dict:
     # Return a dictionary with classification and cost
     classification = json.loads(resp.choices[0].message.content)
-
-    print(f"classification: {classification.get('label')}\nrationale: {classification.get('rationale')}\nconfidence:{classification.get('confidence')}\n")
-
     return {
         "classification": classification,
-        "cost": total_cost,
+        "cost": usage_cost(resp.usage),
         "api_call_id": resp.id
     }
 
-    # print(resp)
-    # print(resp.choices[0].message.content)
+def valid_classification(item) -> bool:
+    if not isinstance(item, dict) or item.get("label") not in LABELS:
+        return False
+    try:
+        return 0.0 <= float(item.get("confidence")) <= 1.0
+    except (TypeError, ValueError):
+        return False
+
+def parse_packed_response(resp, count) -> dict:
+    """{index: classification} for the entries of a packed response that are well formed.
+
+    Entries with a bad index, an unknown label or a missing confidence are
+    dropped, as is everything if the content is not the expected JSON.
+    """
+    try:
+        entries = json.loads(resp.choices[0].message.content).get("labels")
+    except (TypeError, ValueError, AttributeError):
+        return {}
+    parsed = {}
+    for entry in entries if isinstance(entries, list) else []:
+        if not valid_classification(entry):
+            continue
+        index = entry.get("index")
+        if isinstance(index, int) and 0 <= index < count and index not in parsed:
+            parsed[index] = {k: entry.get(k) for k in ("label", "confidence", "rationale")}
+    return parsed
+
+def print_classification(classification):
+    print(f"classification: {classification.get('label')}\nrationale: {classification.get('rationale')}\nconfidence:{classification.get('confidence')}\n")
+
+def classify_commit_llm(message: str, diff_hint: str = "") -> dict:
+    resp = client.chat.completions.create(
+        model=MODEL,
+        # temperature=0,
+        response_format={"type":"json_object"},
+        messages=build_messages(message),
+        #reasoning={"effort": "low"}
+        #max_completion_tokens=200
+    )
 
-    # return json.loads(resp.choices[0].message.content)
+    result = parse_response(resp)
+    print_classification(result["classification"])
+    return result
+
+def estimate_tokens(messages, output_tokens) -> int:
+    # ~4 characters per token is close enough for budgeting
+    return sum(len(m["content"]) for m in messages) // 4 + output_tokens
+
+def retry_after_seconds(e):
+    try:
+        return float(e.response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+async def chat_with_backoff(messages, limiter, estimate):
+    async def request():
+        start = time.perf_counter()
+        await limiter.acquire(estimate)
+        sent = time.perf_counter()
+        profiler.observe("rate_limit_wait", sent - start)
+        try:
+            return await async_client.chat.completions.create(
+                model=MODEL,
+                response_format={"type":"json_object"},
+                messages=messages,
+            )
+        finally:
+            # Every attempt, including the ones that end in a retry
+            profiler.observe("llm_request", time.perf_counter() - sent)
+
+    resp = await call_with_backoff(
+        request, limiter,
+        is_retryable=lambda e: isinstance(e, (RateLimitError, APIConnectionError, InternalServerError)),
+        retry_after=retry_after_seconds,
+    )
+    if resp.usage:
+        limiter.settle(estimate, resp.usage.total_tokens)
+    return resp
+
+async def classify_commit_llm_async(message: str, limiter: RateLimiter, output_tokens: int) -> dict:
+    messages = build_messages(message)
+    resp = await chat_with_backoff(messages, limiter, estimate_tokens(messages, output_tokens))
+    return parse_response(resp)
+
+async def classify_pack_async(messages, limiter, output_tokens) -> list:
+    """Classify several messages per request. Results (or exceptions) come back in input order.
+
+    Only the items missing from or malformed in a response are resent. Each
+    request's cost is split over the items it labeled; the cost of requests
+    that labeled nothing is carried over to the next items labeled.
+    """
+    results = [None] * len(messages)
+    todo = list(range(len(messages)))
+    carry = 0.0
+    for _ in range(1 + PACK_RETRIES):
+        if not todo:
+            break
+        packed = build_packed_messages([messages[i] for i in todo])
+        resp = await chat_with_backoff(packed, limiter, estimate_tokens(packed, output_tokens * len(todo)))
+        parsed = parse_packed_response(resp, len(todo))
+        cost = usage_cost(resp.usage) + carry
+        carry = 0.0 if parsed else cost
+        for local_index, classification in parsed.items():
+            results[todo[local_index]] = {
+                "classification": classification,
+                "cost": cost / len(parsed),
+                "api_call_id": resp.id,
+            }
+        todo = [i for n, i in enumerate(todo) if n not in parsed]
+
+    # Whatever the packed requests could not label is asked about on its own
+    for i in todo:
+        try:
+            results[i] = await classify_commit_llm_async(messages[i], limiter, output_tokens)
+            results[i]["cost"] += carry
+            carry = 0.0
+        except Exception as e:
+            results[i] = e
+    return results
+
+async def classify_many(messages, limiter, concurrency, output_tokens):
+    """Classify messages concurrently. Results (or exceptions) come back in input order."""
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(message):
+        async with sem:
+            return await classify_commit_llm_async(message, limiter, output_tokens)
+
+    return await asyncio.gather(*(one(m) for m in messages), return_exceptions=True)
+
+async def classify_many_packed(messages, limiter, concurrency, output_tokens, pack):
+    """Like classify_many, with `pack` messages per request."""
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(chunk):
+        async with sem:
+            try:
+                return await classify_pack_async(chunk, limiter, output_tokens)
+            except Exception as e:
+                return [e] * len(chunk)
+
+    packs = [messages[i:i + pack] for i in range(0, len(messages), pack)]
+    results = await asyncio.gather(*(one(chunk) for chunk in packs))
+    return [r for chunk in results for r in chunk]
 
 def parse_args():
     p = argparse.ArgumentParser(description="Get commit information and store as csv")
@@ -77,150 +265,557 @@ def parse_args():
     p.add_argument("--until", default=None, help="YYYY-MM-DD")
     p.add_argument("--branch", default=None, help="Branch")
     p.add_argument("--saveas", default="name", help="Output CSV")
+    p.add_argument("--extractor", choices=["git", "pydriller"], default="git",
+                   help="Read commits with one streamed git log (fast) or through PyDriller")
     p.add_argument("--label", action="store_true",
                    help="If set, call LLM to classify each commit")
     p.add_argument("--label-limit", type=int, default=None,
                    help="Max number of commits to label (for testing/cost control)")
-    p.add_argument("--label-cache", default="../data/label_cache.jsonl",
-                   help="Path to JSONL cache to avoid re-labeling")
-    return p.parse_args()
+    p.add_argument("--label-cache", default="../data/label_cache.sqlite",
+                   help="Path to SQLite label cache to avoid re-labeling (a .jsonl path is imported into a sibling .sqlite)")
+    p.add_argument("--import-cache", default="../data/label_cache.jsonl",
+                   help="Legacy JSONL cache to import once into --label-cache, if it exists")
+    p.add_argument("--concurrency", type=int, default=16,
+                   help="Max LLM requests in flight at once")
+    p.add_argument("--rpm", type=int, default=500,
+                   help="Requests-per-minute budget for the LLM provider")
+    p.add_argument("--tpm", type=int, default=200_000,
+                   help="Tokens-per-minute budget for the LLM provider")
+    p.add_argument("--est-output-tokens", type=int, default=300,
+                   help="Completion tokens to reserve per commit when budgeting --tpm")
+    p.add_argument("--pack", type=int, default=1,
+                   help="Commit messages per LLM request (1 sends each message on its own)")
+    p.add_argument("--window", type=int, default=None,
+                   help="Commits labeled together before being written (default 4x --concurrency x --pack)")
+    p.add_argument("--regex-threshold", type=float, default=0.8,
+                   help="Minimum rule confidence for the regex tier to label a commit without the LLM")
+    p.add_argument("--no-regex", action="store_true",
+                   help="Send every uncached commit to the LLM, skipping the regex tier")
+    p.add_argument("--files", default=None, metavar="NAME",
+                   help="grab_commits.py --saveas name whose modified files feed the path tier (default: --saveas)")
+    p.add_argument("--no-path-rules", action="store_true",
+                   help="Skip the path tier (docs-, tests-, CI- and lockfile-only commits)")
+    p.add_argument("--local-model", default=None,
+                   help="Model from local_classifier.py train; confident predictions skip the LLM")
+    p.add_argument("--local-threshold", type=float, default=0.9,
+                   help="Minimum local-model confidence to label a commit without the LLM")
+    p.add_argument("--batch", action="store_true",
+                   help="Label uncached commits through the Batch API before writing the csv")
+    p.add_argument("--batch-poll", type=float, default=60.0,
+                   help="Seconds between batch status checks")
+    p.add_argument("--format", choices=["csv", "parquet"], default="csv",
+                   help="Output format (parquet needs pyarrow)")
+    p.add_argument("--flush-every", type=int, default=None,
+                   help="Flush the output to disk every N commits (default 100 for csv, 1000 for parquet)")
+    add_profile_argument(p)
+    args = p.parse_args()
+    if args.flush_every is None:
+        # Every parquet flush writes a new part file, so flush less often
+        args.flush_every = 1000 if args.format == "parquet" else 100
+    if args.pack < 1:
+        p.error("--pack must be at least 1")
+    if args.window is None:
+        args.window = 4 * args.concurrency * args.pack
+    return args
 
 def to_dt(s):
     return datetime.strptime(s, "%Y-%m-%d") if s else None
 
-def load_cache(path):
-    cache = {}
-    if os.path.exists(path):
-        with open(path, "r", encoding="utf-8") as f:
-            for line in f:
-                try:
-                    obj = json.loads(line)
-                    cache[obj["hash"]] = obj
-                except Exception:
-                    pass
+FIELDNAMES = ["hash", "date", "author", "message", "lines_added", "lines_removed", "in_main_branch", "llm_label", "llm_confidence", "llm_rationale", "api_call_id"]
+
+# Column types for --format parquet
+COLUMNS = {
+    "hash": "string",
+    "date": "timestamp",
+    "author": "string",
+    "message": "string",
+    "lines_added": "int64",
+    "lines_removed": "int64",
+    "in_main_branch": "bool",
+    "llm_label": "string",
+    "llm_confidence": "float64",
+    "llm_rationale": "string",
+    "api_call_id": "string",
+}
+
+def parquet_row(row):
+    # The model occasionally returns confidence as a string
+    row = dict(row)
+    try:
+        row["llm_confidence"] = float(row["llm_confidence"]) if row["llm_confidence"] is not None else None
+    except (TypeError, ValueError):
+        row["llm_confidence"] = None
+    return row
+
+def open_cache(args):
+    path = args.label_cache
+    imports = [args.import_cache]
+    if path.endswith(".jsonl"):
+        imports.append(path)
+        path = path[:-len(".jsonl")] + ".sqlite"
+
+    cache = LabelCache(path, MODEL, prompt_version(CLASSIFIER_SYSTEM, build_messages("")[1]["content"]))
+    for legacy in imports:
+        if legacy and os.path.exists(legacy):
+            count = cache.import_jsonl(legacy)
+            if count:
+                print(f"[INFO] Imported {count} labels from {legacy} into {path}")
+    print(f"[INFO] Label cache: {path} (model={cache.model}, prompt={cache.prompt_version})")
     return cache
 
-def append_cache(path, record):
-    os.makedirs(os.path.dirname(path), exist_ok=True)
-    with open(path, "a", encoding="utf-8") as f:
-        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+def batch_request(commit_hash, message):
+    return {
+        "custom_id": commit_hash,
+        "method": "POST",
+        "url": "/v1/chat/completions",
+        "body": {
+            "model": MODEL,
+            "response_format": {"type": "json_object"},
+            "messages": build_messages(message),
+        },
+    }
+
+def commit_rows(args, since, until):
+    """Commit-level rows plus a `merge` flag, oldest first, from the --extractor backend."""
+    if args.extractor == "git":
+        return iter_commits(args.repo, since, until, args.branch)
+    repo = Repository(
+        path_to_repo=args.repo,
+        since=since,
+        to=until,
+        only_in_branch=args.branch
+    )
+    return ({**commit_row(commit), "merge": commit.merge} for commit in repo.traverse_commits())
+
+def collect_uncached(args, since, until, cache, rules=None, local=None, paths=None):
+    """(hash, message) for every commit that the labeling pass would send to the LLM."""
+    selected = []
+    for commit in commit_rows(args, since, until):
+        if commit["merge"]:
+            continue
+        if args.label_limit is not None and len(selected) >= args.label_limit:
+            break
+        selected.append((commit["hash"], commit["message"]))
+
+    cached = cache.get_many(h for h, _ in selected)
+    misses = [(h, msg) for h, msg in selected
+              if h not in cached and not (rules and rules.classify(msg)) and not (paths and paths.classify(h))]
+    if local is not None and misses:
+        _, confidence = local.predict([msg for _, msg in misses])
+        misses = [m for m, c in zip(misses, confidence) if c < args.local_threshold]
+
+    # One request per normalized message; the labeling pass fans results out to the other commits
+    keys = {h: message_key(msg) for h, msg in misses}
+    shared = cache.get_many_by_message(keys.values())
+    todo = {}
+    for h, msg in misses:
+        if keys[h] not in shared:
+            todo.setdefault(keys[h], (h, msg))
+    return list(todo.values())
+
+def submit_batches(name, todo):
+    batch_ids = []
+    for i in range(0, len(todo), BATCH_MAX_REQUESTS):
+        path = f'../data/{name}_batch_requests_{i // BATCH_MAX_REQUESTS:03d}.jsonl'
+        with open(path, "w", encoding="utf-8") as f:
+            for commit_hash, message in todo[i:i + BATCH_MAX_REQUESTS]:
+                f.write(json.dumps(batch_request(commit_hash, message), ensure_ascii=False) + "\n")
+        with open(path, "rb") as f:
+            uploaded = client.files.create(file=f, purpose="batch")
+        batch = client.batches.create(
+            input_file_id=uploaded.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h",
+        )
+        print(f"[INFO] Submitted {path} as batch {batch.id}")
+        batch_ids.append(batch.id)
+    return batch_ids
+
+def wait_for_batch(batch_id, poll_seconds):
+    while True:
+        batch = client.batches.retrieve(batch_id)
+        counts = batch.request_counts
+        done = f"{counts.completed}/{counts.total}" if counts else "?"
+        print(f"[INFO] Batch {batch_id}: {batch.status} ({done} done)")
+        if batch.status in ("completed", "failed", "expired", "cancelled"):
+            return batch
+        time.sleep(poll_seconds)
+
+def merge_batch_output(batch, messages, cache, args, totals):
+    """Add every successful result of a finished batch to the label cache."""
+    if not batch.output_file_id:
+        print(f"[WARN] Batch {batch.id} ended as {batch.status} with no output")
+        return
+    merged = 0
+    for line in client.files.content(batch.output_file_id).text.splitlines():
+        if not line.strip():
+            continue
+        obj = json.loads(line)
+        commit_hash = obj["custom_id"]
+        response = obj.get("response") or {}
+        if obj.get("error") or response.get("status_code") != 200:
+            print(f"[WARN] Batch request failed for {commit_hash[:8]}: {obj.get('error')}")
+            continue
+        body = response["body"]
+        try:
+            classification = json.loads(body["choices"][0]["message"]["content"])
+        except (KeyError, IndexError, ValueError) as e:
+            print(f"[WARN] Could not parse batch result for {commit_hash[:8]}: {e}")
+            continue
+        usage = body.get("usage") or {}
+        cost = token_cost(usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)) * BATCH_DISCOUNT
+
+        record = {
+            "hash": commit_hash,
+            "label": classification.get("label"),
+            "confidence": classification.get("confidence"),
+            "rationale": classification.get("rationale"),
+            "msg": messages.get(commit_hash),
+            "api_call_id": body.get("id"),
+            "cost": cost
+        }
+        cache.put(record)
+        totals["api_cost"] += cost
+        totals["token_prices"].append(cost)
+        merged += 1
+    cache.commit()
+    print(f"[INFO] Merged {merged} labels from batch {batch.id}")
+
+def run_batch(args, since, until, cache, totals, local=None, paths=None):
+    """Label every uncached commit through the Batch API so the main pass only reads the cache.
+
+    Submitted batch ids are kept in `{name}_batch_state.json`, so an interrupted
+    run resumes polling the same batches instead of paying for them again.
+    """
+    state_path = f'../data/{args.saveas}_batch_state.json'
+    # A throwaway engine, so the batch pre-pass doesn't count towards the run's rule hits
+    rules = None if args.no_regex else RuleEngine(COMMIT_RULES, args.regex_threshold)
+    # Same for the path tier
+    path_tier = paths and PathTier(paths.matches)
+    todo = collect_uncached(args, since, until, cache, rules, local, path_tier)
+    messages = dict(todo)
+
+    if os.path.exists(state_path):
+        with open(state_path, "r", encoding="utf-8") as f:
+            batch_ids = json.load(f)["batch_ids"]
+        print(f"[INFO] Resuming {len(batch_ids)} submitted batches from {state_path}")
+    elif todo:
+        print(f"[INFO] Submitting {len(todo)} uncached commits to the Batch API")
+        batch_ids = submit_batches(args.saveas, todo)
+        with open(state_path, "w", encoding="utf-8") as f:
+            json.dump({"batch_ids": batch_ids}, f)
+    else:
+        print("[INFO] Every commit is already cached, nothing to batch")
+        return
+
+    for batch_id in batch_ids:
+        batch = wait_for_batch(batch_id, args.batch_poll)
+        merge_batch_output(batch, messages, cache, args, totals)
+    os.remove(state_path)
+
+def apply_label(row, record):
+    row["llm_label"] = record["label"]
+    row["llm_confidence"] = record["confidence"]
+    row["llm_rationale"] = record.get("rationale")
+    row["api_call_id"] = record.get("api_call_id")
+
+def shared_label(row, record):
+    """Cache record for a commit that reuses the label of an identical message, at no extra cost."""
+    return {
+        "hash": row["hash"],
+        "label": record["label"],
+        "confidence": record["confidence"],
+        "rationale": record.get("rationale"),
+        "msg": row["message"],
+        "api_call_id": record.get("api_call_id"),
+        "cost": 0.0
+    }
+
+def apply_rules(rows, rules):
+    """Label rows that a regex rule classifies confidently. Returns the rows still unlabeled."""
+    if rules is None:
+        return rows
+    remaining = []
+    for row in rows:
+        match = rules.classify(row["message"])
+        if match:
+            row["llm_label"] = match.label
+            row["llm_confidence"] = match.confidence
+            row["llm_rationale"] = f"regex rule: {match.rule}"
+        else:
+            remaining.append(row)
+    return remaining
+
+def apply_paths(rows, paths):
+    """Label rows whose modified files all fall in one path class. Returns the rows still unlabeled."""
+    if paths is None:
+        return rows
+    remaining = []
+    for row in rows:
+        match = paths.classify(row["hash"])
+        if match:
+            row["llm_label"] = match.label
+            row["llm_confidence"] = match.confidence
+            row["llm_rationale"] = f"path rule: {match.rule}"
+        else:
+            remaining.append(row)
+    return remaining
+
+def apply_local(rows, local, threshold, totals):
+    """Label rows the local model is confident about, in one batched prediction. Returns the rest."""
+    if local is None or not rows:
+        return rows
+    labels, confidence = local.predict([row["message"] for row in rows])
+    totals["local_checked"] += len(rows)
+    remaining = []
+    for row, label, conf in zip(rows, labels, confidence):
+        if conf >= threshold:
+            row["llm_label"] = str(label)
+            row["llm_confidence"] = round(float(conf), 3)
+            row["llm_rationale"] = "local model"
+            totals["local_labeled"] += 1
+        else:
+            remaining.append(row)
+    return remaining
+
+def label_window(window, cache, args, loop, limiter, totals, rules=None, local=None, paths=None):
+    """Fill in llm_* fields for one window of rows, calling the LLM concurrently for cache misses.
+
+    Misses first go through the regex tier, then the path tier, then the local model. Whatever is left is grouped by
+    normalized message: a message already labeled for another commit reuses
+    that label, and each new message is sent once.
+    """
+    rows = [row for row, wants_label in window if wants_label]
+    if not rows:
+        return
+    with profiler.stage("cache"):
+        found = cache.get_many(row["hash"] for row in rows)
+    profiler.count("cache_lookups", len(rows))
+    profiler.count("cache_hits", len(found))
+    misses = []
+    for row in rows:
+        if row["hash"] in found:
+            apply_label(row, found[row["hash"]])
+        else:
+            misses.append(row)
+    # Rule labels are not cached, so editing a rule takes effect on the next run
+    with profiler.stage("regex"):
+        misses = apply_rules(misses, rules)
+    with profiler.stage("path_rules"):
+        misses = apply_paths(misses, paths)
+    with profiler.stage("local_model"):
+        misses = apply_local(misses, local, args.local_threshold, totals)
+    totals["cache_misses"] += len(misses)
+
+    keys = {row["hash"]: message_key(row["message"]) for row in misses}
+    with profiler.stage("cache"):
+        shared = cache.get_many_by_message(keys.values())
+    groups = {}
+    for row in misses:
+        key = keys[row["hash"]]
+        if key in shared:
+            apply_label(row, shared[key])
+            cache.put(shared_label(row, shared[key]))
+            totals["dedup_hits"] += 1
+        else:
+            groups.setdefault(key, []).append(row)
+
+    if groups:
+        firsts = [group[0] for group in groups.values()]
+        texts = [r["message"] for r in firsts]
+        with profiler.stage("llm"):
+            if args.pack > 1:
+                results = loop.run_until_complete(
+                    classify_many_packed(texts, limiter, args.concurrency, args.est_output_tokens, args.pack))
+            else:
+                results = loop.run_until_complete(
+                    classify_many(texts, limiter, args.concurrency, args.est_output_tokens))
+        for group, result in zip(groups.values(), results):
+            first = group[0]
+            if isinstance(result, Exception):
+                print(f"[WARN] LLM classify failed for {first['hash'][:8]}: {result}")
+                continue
+
+            classification = result["classification"]
+            cost = result["cost"] # Get the cost
+            print(f'commit hash:{first["hash"]}')
+            print_classification(classification)
+
+            record = {
+                "hash": first["hash"],
+                "label": classification.get("label"),
+                "confidence": classification.get("confidence"),
+                "rationale": classification.get("rationale"),
+                "msg": first["message"],
+                "api_call_id": result["api_call_id"],
+                "cost": cost
+            }
+            cache.put(record)
+            apply_label(first, record)
+            for row in group[1:]:
+                apply_label(row, record)
+                cache.put(shared_label(row, record))
+            totals["dedup_hits"] += len(group) - 1
+            totals["llm_labeled"] += 1
+            totals["api_cost"] += cost
+            totals["token_prices"].append(cost)
+
+    # One transaction per window rather than one write per label
+    with profiler.stage("cache"):
+        cache.commit()
+
+    for row in rows:
+        if row["llm_label"] is not None:
+            totals["labeled"] += 1
 
 def main():
     args = parse_args()
     since, until = to_dt(args.since), to_dt(args.until)
 
-    token_prices = []
-
     name = args.saveas
-    commit_saveas = f'../data/{name}_commit_info.csv'
-    modified_file_saveas = f'../data/{name}_modified_file_info.csv'
+    commit_saveas = f'../data/{name}_commit_info.{args.format}'
 
-    print(f"[INFO] PyDriller version: {pydriller_version}")
-    print(f"[INFO] Mining repo: {args.repo}")
+    if args.extractor == "pydriller":
+        print(f"[INFO] PyDriller version: {pydriller_version}")
+    print(f"[INFO] Mining repo: {args.repo} (extractor: {args.extractor})")
     if since or until:
         print(f"[INFO] Date filter: since={args.since} until={args.until}")
     if args.branch:
         print(f"[INFO] Branch: {args.branch}")
-    print(f"[INFO] Commit Info Output CSV: {commit_saveas}")
-    print(f"[INFO] Modified Files Output CSV: {modified_file_saveas}\n")
+    if args.label:
+        print(f"[INFO] Labeling with {MODEL}: concurrency={args.concurrency} rpm={args.rpm} tpm={args.tpm}")
+    print(f"[INFO] Commit Info Output: {commit_saveas}\n")
 
     commits_analyzed = 0
-    commit_info = []
-    modified_files_info = []
-
-    cache = load_cache(args.label_cache) if args.label else {}
-
-    repo = Repository(
-        path_to_repo=args.repo,
-        since=since,
-        to=until,
-        only_in_branch=args.branch
-    )
-
-    labeled_count = 0
-    total_api_cost = 0.0
 
-
-    for commit in repo.traverse_commits():
-        msg_one_line = " ".join(commit.msg.split())
+    cache = open_cache(args) if args.label else None
+
+    rules = None if args.no_regex else RuleEngine(COMMIT_RULES, args.regex_threshold)
+    local = None
+    if args.label and args.local_model:
+        from local_classifier import LocalClassifier
+        local = LocalClassifier.load(args.local_model)
+        print(f"[INFO] Local model: {args.local_model} (trained on {local.trained_on} messages, threshold {args.local_threshold})")
+    paths = None
+    if args.label and not args.no_path_rules:
+        # Read before the commit writer opens, which may truncate the same files
+        with profiler.stage("path_rules"):
+            paths = PathTier.from_dataset(args.files or args.saveas)
+        if paths is None:
+            print(f"[INFO] No modified-file data for {args.files or args.saveas}, path tier off")
+    totals = {"labeled": 0, "api_cost": 0.0, "token_prices": [], "cache_misses": 0, "dedup_hits": 0,
+              "local_checked": 0, "local_labeled": 0, "llm_labeled": 0}
+    if args.label and args.batch:
+        # Anything the batch could not label is labeled in real time below
+        run_batch(args, since, until, cache, totals, local, paths)
+    selected = 0
+    loop = asyncio.new_event_loop()
+    limiter = RateLimiter(args.rpm, args.tpm)
+
+    commit_writer = open_writer(args.format, f'../data/{name}_commit_info', FIELDNAMES, COLUMNS,
+                                encode_parquet=parquet_row)
+
+    # Rows are labeled a window at a time and written in commit order
+    window = []
+    unflushed = 0
+
+    def write_window():
+        nonlocal window, unflushed
+        label_window(window, cache, args, loop, limiter, totals, rules, local, paths)
+        with profiler.stage("write"):
+            commit_writer.writerows(row for row, _ in window)
+            unflushed += len(window)
+            window = []
+            if unflushed >= args.flush_every:
+                commit_writer.flush()
+                unflushed = 0
+
+    for commit in profiler.iterate("git_traversal", commit_rows(args, since, until)):
         commits_analyzed += 1
         if commits_analyzed % 100 == 0:
-            print(f"[DEBUG] Scanned {commits_analyzed} commits... last={commit.hash[:8]}")
+            cost = totals["api_cost"] if args.label else None
+            print(f"[DEBUG] Scanned {commits_analyzed} commits... last={commit['hash'][:8]} "
+                  f"({profiler.throughput(commits_analyzed, cost)})")
 
         # Skip merges
-        if getattr(commit, "merge", False):
+        if commit.pop("merge"):
             continue
 
-        label, confidence, rationale = None, None, None
-        if args.label and (args.label_limit is None or labeled_count < args.label_limit):
-            if commit.hash in cache:
-                label = cache[commit.hash]["label"]
-                confidence = cache[commit.hash]["confidence"]
-                rationale = cache[commit.hash].get("rationale")
-                cost = cache.get("cost", 0.0)
-                api_call_id = cache.get("api_call_id")
-            else:
-                try:
-                    print(f'commit hash:{commit.hash}')
-                    result = classify_commit_llm(msg_one_line)
-                    classification = result["classification"]
-                    cost = result["cost"] # Get the cost
-                    api_call_id = result["api_call_id"]
-
-                    label = classification.get("label")
-                    confidence = classification.get("confidence")
-                    rationale = classification.get("rationale")
-
-                    total_api_cost += cost
-                    token_prices.append(cost)
-                    append_cache(args.label_cache, {
-                        "hash": commit.hash,
-                        "label": label,
-                        "confidence": confidence,
-                        "rationale": rationale,
-                        "msg": msg_one_line,
-                        "api_call_id": api_call_id,
-                        "cost": cost
-                    })
-
-                except Exception as e:
-                    print(f"[WARN] LLM classify failed for {commit.hash[:8]}: {e}")
-
-            if label is not None:
-                labeled_count += 1
-
-        commit_info.append({
-            "hash": commit.hash,
-            "date": commit.author_date,
-            "author": commit.author,
-            "message": msg_one_line,
-            # "branches": commit.branches,
-            "lines_added": commit.insertions,
-            "lines_removed": commit.deletions,
-            "in_main_branch": commit.in_main_branch,
-            "llm_label": label,
-            "llm_confidence": confidence,
-            "llm_rationale": rationale,
-            "api_call_id": api_call_id
-        })
-
-    # Write CSV
-    fieldnames = ["hash", "date", "author", "message", "lines_added", "lines_removed", "in_main_branch", "llm_label", "llm_confidence", "llm_rationale", "api_call_id"]
-    with open(commit_saveas, "w", newline="", encoding="utf-8") as f:
-        w = csv.DictWriter(f, fieldnames=fieldnames)
-        w.writeheader()
-        for r in commit_info:
-            w.writerow(r)
+        wants_label = args.label and (args.label_limit is None or selected < args.label_limit)
+        if wants_label:
+            selected += 1
+
+        window.append(({
+            **commit,
+            "llm_label": None,
+            "llm_confidence": None,
+            "llm_rationale": None,
+            "api_call_id": None
+        }, wants_label))
+
+        if len(window) >= args.window:
+            write_window()
+
+    write_window()
+    with profiler.stage("write"):
+        commit_writer.close()
+    loop.close()
+    if cache is not None:
+        cache.close()
 
     print(f"Commits scanned:       {commits_analyzed}")
 
     if args.label:
-        print(f"Commits labeled:        {labeled_count}")
-        print(f"Total API cost: ${total_api_cost:.6f}")
+        token_prices = totals["token_prices"]
+        print(f"Commits labeled:        {totals['labeled']}")
+        print(f"Total API cost: ${totals['api_cost']:.6f}")
+        if rules is not None:
+            for line in rules.report():
+                print(line)
+        if paths is not None:
+            for line in paths.report():
+                print(line)
+            if paths.matched:
+                print(f"LLM calls avoided by the path tier: ~{(paths.matched + args.pack - 1) // args.pack}")
+        if local is not None:
+            local_rate = totals["local_labeled"] / totals["local_checked"] if totals["local_checked"] else 0.0
+            print(f"Local model: {totals['local_labeled']} of {totals['local_checked']} labeled without the LLM ({100 * local_rate:.1f}%)")
+        if totals["cache_misses"]:
+            dedup_ratio = totals["dedup_hits"] / totals["cache_misses"]
+            print(f"Deduplicated: {totals['dedup_hits']} of {totals['cache_misses']} uncached commits shared a message ({100 * dedup_ratio:.1f}%)")
+            if token_prices:
+                print(f"Saved by dedup: ~${totals['dedup_hits'] * stats.mean(token_prices):.6f}")
+        if token_usage["requests"]:
+            llm_commits = totals["llm_labeled"]
+            print(f"LLM requests: {token_usage['requests']} for {llm_commits} commits "
+                  f"({llm_commits / token_usage['requests']:.1f} per request)")
+            if llm_commits:
+                print(f"Tokens per commit: {token_usage['prompt_tokens'] / llm_commits:.1f} prompt + "
+                      f"{token_usage['completion_tokens'] / llm_commits:.1f} completion")
         if token_prices:
             print(f"Median API cost: ${stats.median(token_prices):.6f}")
             print(f"Average API cost: ${stats.mean(token_prices):.6f}")
 
+    if args.profile:
+        requests = token_usage["requests"]
+        lookups = profiler.counters["cache_lookups"]
+        report = profiler.report(
+            commits_analyzed, totals["api_cost"] if args.label else None,
+            repo=args.repo, saveas=args.saveas, extractor=args.extractor, model=MODEL,
+            concurrency=args.concurrency, pack=args.pack,
+            labeled=totals["labeled"], llm_labeled=totals["llm_labeled"],
+            path_labeled=paths.matched if paths is not None else None,
+            cache_hit_rate=round(profiler.counters["cache_hits"] / lookups, 4) if lookups else None,
+            tokens=dict(token_usage),
+            tokens_per_call={
+                "prompt": round(token_usage["prompt_tokens"] / requests, 1),
+                "completion": round(token_usage["completion_tokens"] / requests, 1),
+            } if requests else None,
+        )
+        for line in profiler.summary(report):
+            print(line)
+        profiler.write(args.profile, report)
+
 if __name__ == "__main__":
     main()
 
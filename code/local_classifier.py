@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""Local commit-message classifier trained on the LLM label cache.
+
+The model hashes word n-grams (no vocabulary to store), applies TF-IDF
+weighting and fits a multinomial logistic regression. Inference is one
+sparse matrix product, so it labels thousands of messages per second on a
+CPU. The labeler uses it as a tier after the regex rules: predictions at or
+above the confidence threshold are kept, the rest go to the LLM.
+
+Training data comes from the SQLite label cache. Commits that share a
+normalized message count once, so copied labels don't inflate the score.
+Each label is weighted by the LLM's own confidence.
+
+    python local_classifier.py train --label-cache ../data/label_cache.sqlite
+    python local_classifier.py evaluate --model ../data/local_classifier.pkl
+"""
+import argparse
+import os
+import pickle
+import sqlite3
+import sys
+import time
+
+import numpy as np
+
+LABELS = ["feature", "fix", "refactor", "docs", "test", "other"]
+
+
+def require_sklearn():
+    try:
+        import sklearn  # noqa: F401
+    except ImportError:
+        raise SystemExit("[ERROR] The local classifier needs scikit-learn (pip install scikit-learn)")
+
+
+def load_examples(cache_path, model=None):
+    """(keys, messages, labels, weights) from the label cache, one example per normalized message.
+
+    Each example's key is its msg_key (its hash for rows without one), so a
+    saved model can find its held-out examples again.
+    """
+    if not os.path.exists(cache_path):
+        raise SystemExit(f"[ERROR] Label cache not found: {cache_path}")
+    db = sqlite3.connect(cache_path)
+    query = ("SELECT hash, msg_key, msg, label, confidence FROM labels "
+             "WHERE msg IS NOT NULL AND label IS NOT NULL")
+    params = []
+    if model:
+        query += " AND model = ?"
+        params.append(model)
+    # A fixed order, so the same cache always gives the same examples and split
+    query += " ORDER BY msg_key, hash, model, prompt_version"
+    keys, messages, labels, weights = [], [], [], []
+    seen = set()
+    for commit_hash, msg_key, msg, label, confidence in db.execute(query, params):
+        if label not in LABELS or (msg_key and msg_key in seen):
+            continue
+        seen.add(msg_key)
+        try:
+            weight = min(max(float(confidence), 0.05), 1.0)
+        except (TypeError, ValueError):
+            weight = 0.5
+        keys.append(msg_key or commit_hash)
+        messages.append(msg)
+        labels.append(label)
+        weights.append(weight)
+    db.close()
+    return keys, messages, np.array(labels), np.array(weights)
+
+
+class LocalClassifier:
+    def __init__(self, pipeline, trained_on=0, holdout_keys=None):
+        self.pipeline = pipeline
+        self.trained_on = trained_on
+        # Keys of the examples held out from training, for `evaluate`
+        self.holdout_keys = holdout_keys
+
+    @classmethod
+    def train(cls, messages, labels, weights=None):
+        require_sklearn()
+        from sklearn.feature_extraction.text import HashingVectorizer, TfidfTransformer
+        from sklearn.linear_model import LogisticRegression
+        from sklearn.pipeline import make_pipeline
+
+        pipeline = make_pipeline(
+            HashingVectorizer(ngram_range=(1, 2), n_features=2 ** 18, alternate_sign=False, norm=None),
+            TfidfTransformer(sublinear_tf=True),
+            LogisticRegression(max_iter=1000, C=4.0),
+        )
+        pipeline.fit(messages, labels, logisticregression__sample_weight=weights)
+        return cls(pipeline, trained_on=len(messages))
+
+    @classmethod
+    def load(cls, path):
+        require_sklearn()
+        with open(path, "rb") as f:
+            state = pickle.load(f)
+        return cls(state["pipeline"], state["trained_on"], state.get("holdout_keys"))
+
+    def save(self, path):
+        # A plain dict, so the file loads no matter which script pickled it
+        with open(path, "wb") as f:
+            pickle.dump({"pipeline": self.pipeline, "trained_on": self.trained_on,
+                         "holdout_keys": self.holdout_keys}, f)
+
+    def predict(self, messages):
+        """(labels, confidences) arrays for a batch of messages."""
+        if not messages:
+            return np.array([], dtype=object), np.array([])
+        proba = self.pipeline.predict_proba(messages)
+        best = proba.argmax(axis=1)
+        return self.pipeline.classes_[best], proba[np.arange(len(best)), best]
+
+
+def evaluation_report(classifier, messages, labels, thresholds=(0.5, 0.6, 0.7, 0.8, 0.9, 0.95)):
+    from sklearn.metrics import classification_report
+
+    start = time.perf_counter()
+    predicted, confidence = classifier.predict(messages)
+    elapsed = time.perf_counter() - start
+
+    lines = [
+        f"Held-out examples: {len(messages)}",
+        f"Accuracy: {np.mean(predicted == labels):.3f}",
+        f"Throughput: {len(messages) / elapsed if elapsed else float('inf'):,.0f} messages/sec",
+        "",
+        classification_report(labels, predicted, zero_division=0),
+        "Coverage at confidence threshold (share kept locally, accuracy on those):",
+    ]
+    for t in thresholds:
+        kept = confidence >= t
+        acc = np.mean(predicted[kept] == labels[kept]) if kept.any() else float("nan")
+        lines.append(f"  >= {t:.2f}: coverage {kept.mean():6.1%}  accuracy {acc:.3f}")
+    return "\n".join(lines)
+
+
+def pick(idx, keys, messages, labels, weights):
+    idx = np.asarray(idx, dtype=int)
+    return [keys[i] for i in idx], [messages[i] for i in idx], labels[idx], weights[idx]
+
+
+def split(examples, holdout, seed):
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(len(examples[0]))
+    n_test = int(len(order) * holdout)
+    test, train = order[:n_test], order[n_test:]
+    return pick(train, *examples), pick(test, *examples)
+
+
+def held_out(examples, holdout_keys):
+    """The examples a saved model was evaluated on at training time that are still in the cache."""
+    wanted = set(holdout_keys)
+    return pick([i for i, key in enumerate(examples[0]) if key in wanted], *examples)
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Train and evaluate the local commit classifier")
+    sub = p.add_subparsers(dest="command", required=True)
+
+    train = sub.add_parser("train", help="Train on the label cache and report on a held-out split")
+    train.add_argument("--label-cache", default="../data/label_cache.sqlite")
+    train.add_argument("--model-name", default=None, help="Only use labels produced by this LLM")
+    train.add_argument("--out", default="../data/local_classifier.pkl")
+    train.add_argument("--holdout", type=float, default=0.2, help="Share of examples held out for evaluation")
+    train.add_argument("--seed", type=int, default=0)
+
+    evaluate = sub.add_parser("evaluate", help="Report a saved model's accuracy against the label cache")
+    evaluate.add_argument("--label-cache", default="../data/label_cache.sqlite")
+    evaluate.add_argument("--model-name", default=None)
+    evaluate.add_argument("--model", default="../data/local_classifier.pkl")
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+    require_sklearn()
+    examples = load_examples(args.label_cache, args.model_name)
+    print(f"[INFO] {len(examples[0])} distinct labeled messages in {args.label_cache}")
+
+    if args.command == "train":
+        if len(set(examples[2])) < 2:
+            raise SystemExit("[ERROR] Need labels from at least two classes to train")
+        (_, train_msgs, train_labels, train_weights), (test_keys, test_msgs, test_labels, _) = split(
+            examples, args.holdout, args.seed)
+        start = time.perf_counter()
+        classifier = LocalClassifier.train(train_msgs, train_labels, train_weights)
+        classifier.holdout_keys = test_keys
+        print(f"[INFO] Trained on {len(train_msgs)} messages in {time.perf_counter() - start:.1f}s")
+        classifier.save(args.out)
+        print(f"[INFO] Saved model to {args.out}\n")
+    else:
+        classifier = LocalClassifier.load(args.model)
+        if classifier.holdout_keys is None:
+            raise SystemExit(f"[ERROR] {args.model} doesn't record its held-out examples; retrain it to evaluate")
+        _, test_msgs, test_labels, _ = held_out(examples, classifier.holdout_keys)
+        missing = len(classifier.holdout_keys) - len(test_msgs)
+        if missing:
+            print(f"[WARN] {missing} of {len(classifier.holdout_keys)} held-out examples are no longer in the cache")
+
+    if test_msgs:
+        print(evaluation_report(classifier, test_msgs, test_labels))
+    else:
+        print("[WARN] No held-out examples to evaluate on")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""Local stand-in for the GitHub API, for exercising the PR scripts offline.
+
+Implements just enough of the API for pr_store.py:
+
+- GET /repos/{owner}/{name}/pulls (state=closed, sort=updated, paged), with
+  ETag / Last-Modified and 304 answers to conditional requests
+- POST /graphql, answering the pull request query of pr_store.py with
+  cursor pagination and a rateLimit block
+
+Every repository has the same number of synthetic closed PRs (seeded by the
+repository name, so results are deterministic), spread over --days. Point
+the scripts at it with:
+
+    python mock_github_server.py --port 8780
+    GITHUB_TOKEN=mock python classify_pr.py --github-url http://127.0.0.1:8780 --repo serde-rs/json [--graphql]
+"""
+import argparse
+import base64
+import hashlib
+import json
+import random
+import threading
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+TITLES = [
+    "Fix crash when parsing empty input", "Add support for {}", "Update docs for {}",
+    "Refactor {} module", "Bump {} from 1.2.3 to 1.2.4", "Add tests for {}",
+    "Improve {} performance", "Fix #{} regression in {}", "CI: build on nightly", "Simplify {} handling",
+]
+WORDS = ["serializer", "tokenizer", "buffer", "client", "handshake", "decoder", "parser", "allocator"]
+LABELS = ["bug", "enhancement", "documentation", "dependencies", "performance"]
+
+OPTIONS = {"prs": 500, "days": 365, "points": 5000}
+_lock = threading.Lock()
+_repos = {}
+_rate = {"remaining": 0}
+
+
+def iso(dt):
+    return dt.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def repo_pulls(repo):
+    """Synthetic closed PRs of a repository, most recently updated first."""
+    with _lock:
+        if repo not in _repos:
+            rng = random.Random(repo)
+            now = datetime.now(timezone.utc).replace(microsecond=0)
+            pulls = []
+            for i in range(OPTIONS["prs"]):
+                updated = now - timedelta(seconds=int(i * OPTIONS["days"] * 86400 / OPTIONS["prs"]) + rng.randint(0, 600))
+                merged = None if rng.random() < 0.15 else updated - timedelta(hours=rng.randint(0, 48))
+                template = rng.choice(TITLES)
+                issue = [rng.randint(1, 999)] if "#{}" in template else []
+                title = template.format(*issue, rng.choice(WORDS))
+                pulls.append({
+                    "number": OPTIONS["prs"] - i,
+                    "title": title,
+                    "body": f"This PR changes the {rng.choice(WORDS)}." if rng.random() < 0.8 else None,
+                    "updated_at": iso(updated),
+                    "merged_at": iso(merged) if merged else None,
+                    "labels": [{"name": name} for name in rng.sample(LABELS, rng.randint(0, 2))],
+                    "additions": rng.randint(1, 800),
+                    "deletions": rng.randint(0, 400),
+                    "changed_files": rng.randint(1, 30),
+                })
+            _repos[repo] = pulls
+        return _repos[repo]
+
+
+def graphql_node(pr):
+    return {
+        "number": pr["number"], "title": pr["title"], "body": pr["body"],
+        "updatedAt": pr["updated_at"], "mergedAt": pr["merged_at"],
+        "additions": pr["additions"], "deletions": pr["deletions"], "changedFiles": pr["changed_files"],
+        "labels": {"nodes": pr["labels"]},
+    }
+
+
+def encode_cursor(offset):
+    return base64.b64encode(f"cursor:{offset}".encode()).decode()
+
+
+def decode_cursor(cursor):
+    return int(base64.b64decode(cursor).decode().split(":")[1]) if cursor else 0
+
+
+class Handler(BaseHTTPRequestHandler):
+    server_version = "MockGitHub/1.0"
+
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, status, obj, headers=None):
+        data = json.dumps(obj).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def rate_headers(self, spend):
+        with _lock:
+            _rate["remaining"] = max(0, _rate["remaining"] - spend)
+            return {"X-RateLimit-Remaining": str(_rate["remaining"]), "X-RateLimit-Limit": str(OPTIONS["points"])}
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        parts = url.path.strip("/").split("/")
+        if len(parts) != 4 or parts[0] != "repos" or parts[3] != "pulls":
+            self.send_json(404, {"message": "Not Found"})
+            return
+        query = parse_qs(url.query)
+        page = int(query.get("page", ["1"])[0])
+        per_page = min(int(query.get("per_page", ["30"])[0]), 100)
+        pulls = repo_pulls(f"{parts[1]}/{parts[2]}")[(page - 1) * per_page:page * per_page]
+
+        body = json.dumps(pulls).encode("utf-8")
+        etag = f'W/"{hashlib.sha1(body).hexdigest()}"'
+        newest = max((p["updated_at"] for p in pulls), default=iso(datetime(2000, 1, 1, tzinfo=timezone.utc)))
+        last_modified = format_datetime(datetime.fromisoformat(newest.replace("Z", "+00:00")), usegmt=True)
+
+        # Conditional hits don't count against the rate limit, as on GitHub
+        since = self.headers.get("If-Modified-Since")
+        if self.headers.get("If-None-Match") == etag or (
+                since and "If-None-Match" not in self.headers and parsedate_to_datetime(since) >= parsedate_to_datetime(last_modified)):
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            for key, value in self.rate_headers(0).items():
+                self.send_header(key, value)
+            self.end_headers()
+            return
+        self.send_json(200, pulls, {"ETag": etag, "Last-Modified": last_modified, **self.rate_headers(1)})
+
+    def do_POST(self):
+        if urlparse(self.path).path.rstrip("/") != "/graphql":
+            self.send_json(404, {"message": "Not Found"})
+            return
+        if not self.headers.get("Authorization"):
+            self.send_json(401, {"message": "This endpoint requires you to be authenticated."})
+            return
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        variables = request.get("variables") or {}
+        merged = [p for p in repo_pulls(f"{variables['owner']}/{variables['name']}") if p["merged_at"]]
+        offset = decode_cursor(variables.get("cursor"))
+        page = merged[offset:offset + 100]
+        rate = self.rate_headers(1)
+        self.send_json(200, {"data": {
+            "repository": {"pullRequests": {
+                "pageInfo": {"hasNextPage": offset + 100 < len(merged), "endCursor": encode_cursor(offset + len(page))},
+                "nodes": [graphql_node(p) for p in page],
+            }},
+            "rateLimit": {"cost": 1, "remaining": int(rate["X-RateLimit-Remaining"]), "limit": OPTIONS["points"],
+                          "resetAt": iso(datetime.now(timezone.utc) + timedelta(hours=1))},
+        }})
+
+
+def main():
+    p = argparse.ArgumentParser(description="Local stand-in for the GitHub API")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8780)
+    p.add_argument("--prs", type=int, default=500, help="Closed PRs per repository")
+    p.add_argument("--days", type=int, default=365, help="Days the PRs' update times are spread over")
+    p.add_argument("--points", type=int, default=5000, help="Rate limit per hour (requests or GraphQL points)")
+    args = p.parse_args()
+    OPTIONS.update(prs=args.prs, days=args.days, points=args.points)
+    _rate["remaining"] = args.points
+
+    server = ThreadingHTTPServer((args.host, args.port), Handler)
+    print(f"[INFO] Mock GitHub API on http://{args.host}:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
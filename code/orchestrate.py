@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+"""Mine and label every repository in a manifest in one run.
+
+The manifest (`repos.toml`) lists each repository with its language and the
+pair it belongs to. Every repository becomes a mining job (grab_commits.py)
+and, for `label`/`run`, a labeling job (label_commits_llm.py) that starts
+once its mining job is done. Jobs run as subprocesses, sharing `--jobs`
+slots:
+
+- commit counts are estimated up front (`git rev-list --count` on local
+  clones, the manifest's `commits` otherwise)
+- the largest jobs start first, and a mining job gets grab_commits workers,
+  and slots, in proportion to its share of all commits. openssl mines
+  with several workers while the small repositories share the rest.
+- each job's output goes to `../data/logs/{name}_{stage}.log`; the
+  orchestrator reads the "Scanned N commits" lines for aggregate progress
+
+When everything has finished, the per-repository outputs of the whole
+manifest (not just the `--only` repos) are concatenated into
+`../data/combined_*` with repo, language and pair columns added. Outputs of
+jobs that failed in this run are left out.
+
+`fetch` clones or updates the repositories themselves into ../data/{name},
+sharing one object store (see repo_fetch.py).
+
+    python orchestrate.py fetch --jobs 8
+    python orchestrate.py plan
+    python orchestrate.py run --jobs 16
+    python orchestrate.py mine --only openssl rustls
+    python orchestrate.py combine
+"""
+import argparse
+import csv
+import glob
+import os
+import re
+import subprocess
+import sys
+import time
+import tomllib
+
+from repo_fetch import STORE_PATH, fetch_all
+
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = "../data"
+DEFAULT_ESTIMATE = 2000
+REQUIRED_KEYS = ["name", "url", "language", "pair"]
+PROGRESS_RE = re.compile(rb"Scanned (\d+)")
+
+# Outputs of each stage that get combined: (combined name, per-repo suffix)
+OUTPUTS = {
+    "mine": [("commit_info", "commit_info"), ("modified_file_info", "modified_file_info")],
+    "label": [("labeled_commit_info", "labeled_commit_info")],
+}
+
+
+def load_manifest(path):
+    """(defaults, repos) from a TOML manifest; every repo dict has the defaults filled in."""
+    with open(path, "rb") as f:
+        manifest = tomllib.load(f)
+    defaults = manifest.get("defaults", {})
+    repos = []
+    for entry in manifest.get("repo", []):
+        missing = [k for k in REQUIRED_KEYS if k not in entry]
+        if missing:
+            raise SystemExit(f"[ERROR] {path}: repo {entry.get('name', '?')} is missing {', '.join(missing)}")
+        repos.append({**defaults, **entry})
+    names = [r["name"] for r in repos]
+    if len(set(names)) != len(names):
+        raise SystemExit(f"[ERROR] {path}: repo names must be unique")
+    return defaults, repos
+
+
+def repo_path(repo):
+    """Local clone if there is one, else the url (grab_commits clones remote repos itself)."""
+    if repo.get("path"):
+        return repo["path"]
+    local = os.path.join(DATA_DIR, repo["name"])
+    return local if os.path.isdir(os.path.join(local, ".git")) or os.path.isfile(os.path.join(local, "HEAD")) else repo["url"]
+
+
+def estimate_commits(repo):
+    path = repo_path(repo)
+    if os.path.isdir(path):
+        cmd = ["git", "-C", path, "rev-list", "--count", repo.get("branch") or "HEAD"]
+        if repo.get("since"):
+            cmd.append(f"--since={repo['since']}")
+        if repo.get("until"):
+            cmd.append(f"--until={repo['until']}")
+        try:
+            return int(subprocess.run(cmd, capture_output=True, text=True, check=True).stdout.strip())
+        except (subprocess.CalledProcessError, ValueError):
+            pass
+    return int(repo.get("commits", DEFAULT_ESTIMATE))
+
+
+def date_args(repo):
+    args = []
+    for key in ("since", "until", "branch"):
+        if repo.get(key):
+            args += [f"--{key}", str(repo[key])]
+    return args
+
+
+class Job:
+    def __init__(self, repo, stage, cmd, slots, estimate, after=None):
+        self.repo = repo
+        self.stage = stage
+        self.cmd = cmd
+        self.slots = slots
+        self.estimate = estimate
+        self.after = after  # job that must succeed first
+        self.log_path = os.path.join(DATA_DIR, "logs", f"{repo['name']}_{stage}.log")
+        self.proc = None
+        self.log = None
+        self.status = "pending"
+        self.progress = 0
+        self.started = None
+        self.elapsed = None
+
+    @property
+    def label(self):
+        return f"{self.repo['name']}:{self.stage}"
+
+    def ready(self):
+        return self.after is None or self.after.status == "done"
+
+    def start(self):
+        os.makedirs(os.path.dirname(self.log_path), exist_ok=True)
+        self.log = open(self.log_path, "wb")
+        self.proc = subprocess.Popen(self.cmd, cwd=CODE_DIR, stdout=self.log, stderr=subprocess.STDOUT)
+        self.status = "running"
+        self.started = time.time()
+
+    def poll(self):
+        """Update progress from the log; returns True once the process has exited."""
+        with open(self.log_path, "rb") as f:
+            counts = PROGRESS_RE.findall(f.read())
+        if counts:
+            self.progress = int(counts[-1])
+        code = self.proc.poll()
+        if code is None:
+            return False
+        self.log.close()
+        self.elapsed = time.time() - self.started
+        self.status = "done" if code == 0 else "failed"
+        if code == 0:
+            self.progress = self.estimate
+        return True
+
+
+def output_format(repo, stage):
+    """Format of a repo's outputs for a stage: csv, parquet or store."""
+    fmt = repo.get("format", "csv")
+    # Labels are commit-level only, so a repo mined into a diff store gets labeled csv
+    if stage == "label" and fmt == "store":
+        return "csv"
+    return fmt
+
+
+def plan_jobs(repos, stages, slots, args):
+    """Jobs for every repo and stage, with mining workers sized by commit share."""
+    estimates = {r["name"]: estimate_commits(r) for r in repos}
+    total = sum(estimates.values()) or 1
+    jobs = []
+    for repo in repos:
+        estimate = estimates[repo["name"]]
+        path = repo_path(repo)
+        mine = None
+        if "mine" in stages:
+            workers = max(1, min(slots, round(slots * estimate / total)))
+            cmd = [sys.executable, "grab_commits.py", "--repo", path, "--saveas", repo["name"],
+                   "--workers", str(workers), "--format", output_format(repo, "mine"),
+                   "--metrics", str(repo.get("metrics", "all")), *date_args(repo), *repo.get("mine_args", [])]
+            if args.fresh:
+                cmd.append("--fresh")
+            mine = Job(repo, "mine", cmd, workers, estimate)
+            jobs.append(mine)
+        if "label" in stages:
+            cmd = [sys.executable, "label_commits_llm.py", "--repo", path, "--saveas", f"{repo['name']}_labeled",
+                   "--label", "--format", output_format(repo, "label"), "--files", repo["name"], *date_args(repo),
+                   *repo.get("label_args", [])]
+            # Labeling is network bound, so it takes a single slot
+            jobs.append(Job(repo, "label", cmd, 1, estimate, after=mine))
+    # Largest first, so the long jobs aren't left to run alone at the end
+    jobs.sort(key=lambda j: (j.estimate, j.stage == "mine"), reverse=True)
+    return jobs
+
+
+def progress_line(jobs):
+    done = sum(j.status == "done" for j in jobs)
+    running = [j for j in jobs if j.status == "running"]
+    commits = sum(min(j.progress, j.estimate) for j in jobs)
+    total = sum(j.estimate for j in jobs) or 1
+    line = (f"[PROGRESS] {done}/{len(jobs)} jobs done, {len(running)} running | "
+            f"{commits:,}/{total:,} commits ({100 * commits / total:.1f}%)")
+    if running:
+        line += " | " + ", ".join(f"{j.label} {j.progress:,}/{j.estimate:,}" for j in running)
+    return line
+
+
+def run_jobs(jobs, slots, poll_seconds=2.0, report_every=30.0):
+    """Run jobs within `slots`, starting the largest ready job that fits. Returns the failed jobs."""
+    free = slots
+    last_report = 0.0
+    while any(j.status in ("pending", "running") for j in jobs):
+        for job in jobs:
+            if job.status != "pending":
+                continue
+            if job.after is not None and job.after.status in ("failed", "skipped"):
+                job.status = "skipped"
+                print(f"[WARN] Skipping {job.label}: {job.after.label} {job.after.status}")
+                continue
+            # A job wider than the whole pool still runs, alone
+            if job.ready() and (job.slots <= free or free == slots):
+                job.start()
+                free -= job.slots
+                print(f"[INFO] Started {job.label} ({job.slots} slot{'s' if job.slots > 1 else ''}, ~{job.estimate:,} commits)")
+
+        time.sleep(poll_seconds)
+        for job in jobs:
+            if job.status == "running" and job.poll():
+                free += job.slots
+                level = "INFO" if job.status == "done" else "ERROR"
+                print(f"[{level}] {job.label} {job.status} in {job.elapsed:.0f}s (log: {job.log_path})")
+
+        if time.time() - last_report >= report_every:
+            print(progress_line(jobs))
+            last_report = time.time()
+
+    print(progress_line(jobs))
+    return [j for j in jobs if j.status != "done"]
+
+
+def _combine_csv(sources, out_path):
+    csv.field_size_limit(sys.maxsize)
+    # Outputs written before a column was added lack it, so take the union of the headers
+    fieldnames = {}
+    for _, path in sources:
+        with open(path, newline="", encoding="utf-8") as f:
+            fieldnames.update(dict.fromkeys(next(csv.reader(f), [])))
+    rows = 0
+    with open(out_path, "w", newline="", encoding="utf-8") as out:
+        writer = csv.DictWriter(out, fieldnames=["repo", "language", "pair", *fieldnames])
+        writer.writeheader()
+        for repo, path in sources:
+            with open(path, newline="", encoding="utf-8") as f:
+                extra = {"repo": repo["name"], "language": repo["language"], "pair": repo["pair"]}
+                for row in csv.DictReader(f):
+                    writer.writerow({**extra, **row})
+                    rows += 1
+    return rows
+
+
+def _combine_parquet(sources, out_path):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise SystemExit("[ERROR] Combining parquet outputs needs pyarrow (pip install pyarrow)")
+    parts = [(repo, source) for repo, path in sources
+             for source in sorted(glob.glob(os.path.join(path, "part-*.parquet")))]
+    try:
+        schema = pa.unify_schemas([pq.read_schema(source) for _, source in parts])
+    except pa.ArrowInvalid as e:
+        raise SystemExit(f"[ERROR] Can't combine into {out_path}, the outputs disagree on a column type: {e}")
+    os.makedirs(out_path, exist_ok=True)
+    for old in glob.glob(os.path.join(out_path, "part-*.parquet")):
+        os.remove(old)
+    rows = 0
+    # Part by part, so memory is bounded by the writer's --flush-every
+    for part, (repo, source) in enumerate(parts):
+        table = pq.read_table(source)
+        columns = [table.column(f.name) if f.name in table.schema.names else pa.nulls(table.num_rows, f.type)
+                   for f in schema]
+        table = pa.table(columns, schema=schema)
+        extra = {"repo": repo["name"], "language": repo["language"], "pair": repo["pair"]}
+        for i, (key, value) in enumerate(extra.items()):
+            table = table.add_column(i, key, pa.array([value] * table.num_rows, pa.string()))
+        tmp = os.path.join(out_path, f".part-{part:05d}.parquet.tmp")
+        pq.write_table(table, tmp, compression="zstd")
+        os.replace(tmp, os.path.join(out_path, f"part-{part:05d}.parquet"))
+        rows += table.num_rows
+    return rows
+
+
+def combine(repos, stages, failed=()):
+    """Concatenate per-repo outputs into ../data/combined_*.
+
+    Repos without an output are left out, and so are the outputs of `failed`
+    jobs, which may be partial. Diff stores aren't combined.
+    """
+    failed = {(j.repo["name"], j.stage): j.status for j in failed}
+    for stage in stages:
+        stores = [r["name"] for r in repos if output_format(r, stage) == "store"]
+        if stores:
+            print(f"[WARN] Diff stores are not combined, leaving out the {stage} outputs of {', '.join(stores)}")
+        for combined_name, suffix in OUTPUTS[stage]:
+            for fmt in ("csv", "parquet"):
+                sources = [(r, os.path.join(DATA_DIR, f"{r['name']}_{suffix}.{fmt}")) for r in repos
+                           if output_format(r, stage) == fmt]
+                sources = [(r, p) for r, p in sources if os.path.exists(p)]
+                for r, p in sources:
+                    if (r["name"], stage) in failed:
+                        print(f"[WARN] Leaving {p} out of combined_{combined_name}: "
+                              f"{r['name']}:{stage} {failed[r['name'], stage]}")
+                sources = [(r, p) for r, p in sources if (r["name"], stage) not in failed]
+                if not sources:
+                    continue
+                out_path = os.path.join(DATA_DIR, f"combined_{combined_name}.{fmt}")
+                combine_fn = _combine_parquet if fmt == "parquet" else _combine_csv
+                rows = combine_fn(sources, out_path)
+                print(f"[INFO] Combined {len(sources)} repos into {out_path} ({rows:,} rows)")
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Mine and label the repositories in a manifest")
+    sub = p.add_subparsers(dest="command", required=True)
+    for name, help_text in [("fetch", "Clone or update every repository under ../data"),
+                            ("plan", "Show commit estimates and the job plan without running anything"),
+                            ("mine", "Mine every repository with grab_commits.py"),
+                            ("label", "Label every repository with label_commits_llm.py"),
+                            ("run", "Mine, then label, every repository"),
+                            ("combine", "Only rebuild the combined datasets from existing outputs")]:
+        s = sub.add_parser(name, help=help_text)
+        s.add_argument("--manifest", default="repos.toml")
+        s.add_argument("--only", nargs="+", default=None, help="Limit the run to these repo names")
+        s.add_argument("--jobs", type=int, default=os.cpu_count() or 4,
+                       help="Slots shared by all jobs (a mining job uses one per worker)")
+        s.add_argument("--fresh", action="store_true", help="Ignore mining checkpoints")
+        s.add_argument("--progress-every", type=float, default=30.0, help="Seconds between progress lines")
+        if name == "fetch":
+            s.add_argument("--blobless", action="store_true",
+                           help="Partial clones without file contents, for commit metadata only")
+            s.add_argument("--store", default=STORE_PATH,
+                           help="Shared object store the clones borrow from (default ../data/objects.git)")
+            s.add_argument("--no-store", action="store_true", help="Clone each repository on its own")
+            s.add_argument("--mirror", default=None, metavar="DIR",
+                           help="Fetch from local mirrors DIR/{name}.git instead of the manifest urls")
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+    _, manifest_repos = load_manifest(os.path.join(CODE_DIR, args.manifest) if not os.path.isabs(args.manifest) else args.manifest)
+    repos = manifest_repos
+    if args.only:
+        unknown = set(args.only) - {r["name"] for r in repos}
+        if unknown:
+            raise SystemExit(f"[ERROR] Not in the manifest: {', '.join(sorted(unknown))}")
+        repos = [r for r in repos if r["name"] in args.only]
+
+    if args.command == "fetch":
+        failed = fetch_all(repos, lambda r: r.get("path") or os.path.join(DATA_DIR, r["name"]), args.jobs,
+                           args.blobless, None if args.no_store else args.store, args.mirror)
+        if failed:
+            print(f"[ERROR] {len(failed)} repos could not be fetched: {', '.join(failed)}")
+            sys.exit(1)
+        return
+
+    stages = {"plan": ["mine", "label"], "mine": ["mine"], "label": ["label"],
+              "run": ["mine", "label"], "combine": ["mine", "label"]}[args.command]
+    # The combined datasets always cover the whole manifest, not just the --only repos
+    if args.command == "combine":
+        combine(manifest_repos, stages)
+        return
+
+    jobs = plan_jobs(repos, stages, args.jobs, args)
+    print(f"[INFO] {len(repos)} repos, {len(jobs)} jobs, {args.jobs} slots")
+    for job in jobs:
+        print(f"  {job.label:28} ~{job.estimate:>8,} commits  {job.slots:>2} slot(s)  {repo_path(job.repo)}")
+    if args.command == "plan":
+        return
+
+    start = time.time()
+    failed = run_jobs(jobs, args.jobs, report_every=args.progress_every)
+    print(f"[INFO] Finished in {time.time() - start:.0f}s")
+    combine(manifest_repos, stages, failed)
+    if failed:
+        print(f"[ERROR] {len(failed)} jobs did not finish: {', '.join(j.label for j in failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""Path tier: label commits from the files they touch, before any model call.
+
+A commit whose modified files are all documentation, all tests, all CI
+configuration or all lockfiles doesn't need an LLM to tell what it is. The
+tier reads the modified-file rows that grab_commits.py wrote for the same
+repository (any format `dataset_reader.Dataset` opens) into one pandas
+frame, matches every path against each class's pattern in one vectorized
+pass, and reduces per commit with a group-by `all()`. The first class that
+covers every file of a commit labels it:
+
+- docs_only: `docs/`, `*.md`, `*.rst`, README, CHANGES, LICENSE, ... -> docs
+- tests_only: `tests/`, `test_*`, `*_test.c`, fuzz corpora, ... -> test
+- ci_only: `.github/`, `.travis.yml`, appveyor, GitLab CI, ... -> other
+- lockfile_only: `Cargo.lock`, `package-lock.json`, ... -> other
+
+Commits with no modified-file rows (not mined yet, or mined with
+--commits-only) are left to the next tier. Outputs mined before the
+`path` column existed only have file names, so directory patterns can't
+match and fewer commits qualify.
+"""
+import time
+from collections import Counter, namedtuple
+
+from rules import Match
+
+PathClass = namedtuple("PathClass", ["name", "label", "confidence", "pattern"])
+
+# In priority order: a commit that only touches tests/README.md is docs_only
+PATH_CLASSES = [
+    PathClass("docs_only", "docs", 0.95,
+              r"(?:^|/)docs?/|\.(?:md|markdown|rst|adoc|asciidoc)$"
+              r"|(?:^|/)(?:README|CHANGES|CHANGELOG|NEWS|AUTHORS|CONTRIBUTORS|THANKS|COPYING|LICEN[CS]E|RELEASE-NOTES)[^/]*$"),
+    PathClass("tests_only", "test", 0.9,
+              r"(?:^|/)(?:tests?|testing|testsuite|testdata|fuzz|fuzzing)/"
+              r"|(?:^|/)test_[^/]*$|_tests?\.(?:c|h|rs|py|go|sh)$"),
+    PathClass("ci_only", "other", 0.9,
+              r"^\.(?:github|circleci|buildkite|azure-pipelines|cirrus)/"
+              r"|(?:^|/)(?:\.travis\.yml|\.gitlab-ci\.yml|appveyor\.yml|\.appveyor\.yml|azure-pipelines\.yml"
+              r"|\.cirrus\.yml|Jenkinsfile)$"),
+    PathClass("lockfile_only", "other", 0.9,
+              r"(?:^|/)(?:Cargo\.lock|package-lock\.json|yarn\.lock|pnpm-lock\.yaml|Pipfile\.lock|poetry\.lock"
+              r"|go\.sum|Gemfile\.lock)$"),
+]
+
+
+def require_pandas():
+    try:
+        import pandas  # noqa: F401
+    except ImportError:
+        raise SystemExit("[ERROR] The path tier needs pandas (pip install pandas)")
+
+
+def classify_paths(frame, classes=PATH_CLASSES):
+    """Label every commit in a (commit_hash, path) frame whose files all fall in one class.
+
+    Returns {commit hash: Match}. Commits that mix classes, or touch anything
+    else, are left out.
+    """
+    import pandas as pd
+
+    if frame.empty:
+        return {}
+    paths = frame["path"].fillna("").astype(str)
+    flags = pd.DataFrame({c.name: paths.str.contains(c.pattern, case=False, regex=True) for c in classes})
+    flags["commit_hash"] = frame["commit_hash"].to_numpy()
+
+    covered = flags.groupby("commit_hash", sort=False).all()
+    matrix = covered.to_numpy()
+    hit = matrix.any(axis=1)
+    first = matrix.argmax(axis=1)[hit]
+    matches = [Match(c.label, c.confidence, c.name) for c in classes]
+    return dict(zip(covered.index[hit], (matches[i] for i in first)))
+
+
+class PathTier:
+    """Path-class labels for the commits of one mined repository, looked up by hash."""
+
+    def __init__(self, matches):
+        self.matches = matches
+        self.hits = Counter()
+        self.checked = 0
+
+    @classmethod
+    def from_dataset(cls, name, data_dir="../data"):
+        """Build the tier from `grab_commits.py --saveas name` outputs, or None if there are none."""
+        require_pandas()
+        import pandas as pd
+        from dataset_reader import Dataset
+
+        try:
+            dataset = Dataset(name, data_dir)
+        except FileNotFoundError:
+            return None
+        start = time.perf_counter()
+        try:
+            frame = pd.DataFrame.from_records(dataset.files(columns=["commit_hash", "path"]),
+                                              columns=["commit_hash", "path"])
+        finally:
+            dataset.close()
+        if frame.empty:
+            return None
+        tier = cls(classify_paths(frame))
+        print(f"[INFO] Path tier: {len(frame):,} modified files of {frame['commit_hash'].nunique():,} commits from {name}, "
+              f"{len(tier.matches):,} commits labeled by path ({time.perf_counter() - start:.1f}s)")
+        return tier
+
+    def classify(self, commit_hash):
+        """The path-class Match for a commit, else None."""
+        self.checked += 1
+        match = self.matches.get(commit_hash)
+        if match:
+            self.hits[match.rule] += 1
+        return match
+
+    @property
+    def matched(self):
+        return sum(self.hits.values())
+
+    def report(self):
+        """Summary lines for the end of a run."""
+        rate = self.matched / self.checked if self.checked else 0.0
+        lines = [f"Path tier: {self.matched} of {self.checked} classified by modified files ({100 * rate:.1f}%)"]
+        for name, count in self.hits.most_common():
+            lines.append(f"  {name:24} {count:6}")
+        return lines
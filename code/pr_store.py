@@ -0,0 +1,290 @@
+"""Local store of GitHub pull requests for the PR classifiers.
+
+Pages of `GET /repos/{owner}/{repo}/pulls` are fetched with `requests` and kept in
+a SQLite file together with their ETag and Last-Modified headers. Later
+runs send these back as If-None-Match / If-Modified-Since. GitHub answers an
+unchanged page with 304 Not Modified, which doesn't count against the rate
+limit, and the stored page is used instead.
+
+Pages are listed by last update, newest first. They are fetched a few at a
+time concurrently, and fetching stops at the first page that reaches past
+the start of the date window. Every PR seen is also stored on its own row, so
+`--offline` runs can classify from the store without touching the network.
+
+With `graphql=True`, PRs are read through the GraphQL API instead: 100
+merged PRs per query, with only the fields the classifiers use (title,
+body, dates, labels, changed files, additions and deletions). Queries
+follow the `endCursor` one after another, since a cursor only comes with
+the previous page. Each query asks for its `rateLimit` cost. The store adds
+up the points spent and waits for the reset if the next query would go
+over the budget.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+API_URL = "https://api.github.com"
+PER_PAGE = 100
+
+# The repositories from the README, C first then Rust, by topic
+README_REPOS = [
+    "json-c/json-c", "serde-rs/json",
+    "curl/curl", "seanmonstar/reqwest",
+    "nginx/nginx", "hyperium/hyper",
+    "openssl/openssl", "rustls/rustls",
+    "madler/zlib", "rust-lang/flate2-rs",
+    "PhilipHazel/pcre2", "rust-lang/regex",
+]
+
+PullRequest = namedtuple("PullRequest", ["number", "title", "body", "updated_at", "merged_at",
+                                         "labels", "additions", "deletions", "changed_files", "raw"])
+
+PULLS_QUERY = """
+query($owner: String!, $name: String!, $cursor: String) {
+  repository(owner: $owner, name: $name) {
+    pullRequests(states: MERGED, first: 100, after: $cursor, orderBy: {field: UPDATED_AT, direction: DESC}) {
+      pageInfo { hasNextPage endCursor }
+      nodes {
+        number title body updatedAt mergedAt additions deletions changedFiles
+        labels(first: 20) { nodes { name } }
+      }
+    }
+  }
+  rateLimit { cost remaining limit resetAt }
+}
+"""
+
+
+def parse_time(value):
+    return datetime.fromisoformat(value.replace("Z", "+00:00")) if value else None
+
+
+def to_pull_request(raw):
+    # The REST list has no line or file counts; GraphQL records do
+    return PullRequest(raw["number"], raw.get("title") or "", raw.get("body"),
+                       parse_time(raw.get("updated_at")), parse_time(raw.get("merged_at")),
+                       [label["name"] for label in raw.get("labels") or []],
+                       raw.get("additions"), raw.get("deletions"), raw.get("changed_files"), raw)
+
+
+def from_graphql(node):
+    """A GraphQL pull request node in the shape of a REST list entry."""
+    return {
+        "number": node["number"],
+        "title": node["title"],
+        "body": node["body"],
+        "updated_at": node["updatedAt"],
+        "merged_at": node["mergedAt"],
+        "labels": node["labels"]["nodes"],
+        "additions": node["additions"],
+        "deletions": node["deletions"],
+        "changed_files": node["changedFiles"],
+    }
+
+
+class PRStore:
+    def __init__(self, path="../data/pr_store.sqlite", token=None, api_url=API_URL, concurrency=4, offline=False,
+                 graphql=False):
+        self.path = path
+        self.api_url = api_url.rstrip("/")
+        self.concurrency = concurrency
+        self.offline = offline
+        self.graphql = graphql
+        self.stats = {"requests": 0, "not_modified": 0, "pages": 0, "queries": 0, "points": 0}
+        self.rate_limit = None  # (remaining, limit) from the last response
+        self.rate_reset = None
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS pages (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                body TEXT,
+                fetched_at REAL
+            );
+            CREATE TABLE IF NOT EXISTS pulls (
+                repo TEXT NOT NULL,
+                number INTEGER NOT NULL,
+                updated_at TEXT,
+                merged_at TEXT,
+                raw TEXT,
+                PRIMARY KEY (repo, number)
+            );
+            CREATE INDEX IF NOT EXISTS pulls_by_update ON pulls (repo, updated_at);
+        """)
+        self._db.commit()
+
+        if not offline:
+            import requests
+            self._session = requests.Session()
+            self._session.headers["Accept"] = "application/vnd.github+json"
+            if token:
+                self._session.headers["Authorization"] = f"Bearer {token}"
+
+    def page_url(self, repo, page):
+        return (f"{self.api_url}/repos/{repo}/pulls?state=closed&sort=updated&direction=desc"
+                f"&per_page={PER_PAGE}&page={page}")
+
+    def fetch_page(self, url):
+        """The JSON list for one page, revalidated against the stored copy."""
+        with self._lock:
+            stored = self._db.execute("SELECT etag, last_modified, body FROM pages WHERE url = ?", [url]).fetchone()
+        headers = {}
+        if stored:
+            if stored[0]:
+                headers["If-None-Match"] = stored[0]
+            if stored[1]:
+                headers["If-Modified-Since"] = stored[1]
+
+        resp = self._session.get(url, headers=headers, timeout=60)
+        with self._lock:
+            self.stats["requests"] += 1
+            if "X-RateLimit-Remaining" in resp.headers:
+                self.rate_limit = (int(resp.headers["X-RateLimit-Remaining"]), int(resp.headers["X-RateLimit-Limit"]))
+            if resp.status_code == 304 and stored:
+                self.stats["not_modified"] += 1
+                return json.loads(stored[2])
+        resp.raise_for_status()
+
+        with self._lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?)",
+                             [url, resp.headers.get("ETag"), resp.headers.get("Last-Modified"), resp.text, time.time()])
+        return resp.json()
+
+    def save_pulls(self, repo, pulls):
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO pulls VALUES (?, ?, ?, ?, ?)",
+                [(repo, p["number"], p.get("updated_at"), p.get("merged_at"), json.dumps(p)) for p in pulls],
+            )
+
+    def fetch(self, repo, since):
+        """Fetch every closed PR of `repo` updated at or after `since`, newest first."""
+        pulls = []
+        page = 1
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            while True:
+                urls = [self.page_url(repo, n) for n in range(page, page + self.concurrency)]
+                done = False
+                for batch in pool.map(self.fetch_page, urls):
+                    self.stats["pages"] += 1
+                    self.save_pulls(repo, batch)
+                    pulls.extend(batch)
+                    # A short page is the last one; a page reaching before the window ends the backfill
+                    if len(batch) < PER_PAGE or (batch and parse_time(batch[-1]["updated_at"]) < since):
+                        done = True
+                        break
+                if done:
+                    break
+                page += self.concurrency
+        return [to_pull_request(p) for p in pulls if parse_time(p["updated_at"]) >= since]
+
+    def graphql_query(self, query, variables):
+        resp = self._session.post(f"{self.api_url}/graphql", json={"query": query, "variables": variables}, timeout=60)
+        resp.raise_for_status()
+        result = resp.json()
+        if result.get("errors"):
+            raise RuntimeError(f"GraphQL error: {result['errors'][0].get('message')}")
+        return result["data"]
+
+    def fetch_graphql(self, repo, since):
+        """Like fetch, through GraphQL: merged PRs only, 100 per query."""
+        owner, name = repo.split("/", 1)
+        pulls = []
+        cursor = None
+        last_cost = 1
+        while True:
+            # Wait for the reset rather than fail mid-backfill when the point budget runs out
+            if self.rate_limit and self.rate_limit[0] < last_cost and self.rate_reset:
+                wait = max(0.0, (self.rate_reset - datetime.now(timezone.utc)).total_seconds()) + 1
+                print(f"[WARN] GraphQL budget spent; waiting {wait:.0f}s for the reset")
+                time.sleep(wait)
+
+            data = self.graphql_query(PULLS_QUERY, {"owner": owner, "name": name, "cursor": cursor})
+            rate = data["rateLimit"]
+            last_cost = rate["cost"]
+            self.stats["queries"] += 1
+            self.stats["points"] += rate["cost"]
+            self.rate_limit = (rate["remaining"], rate["limit"])
+            self.rate_reset = parse_time(rate["resetAt"])
+
+            page = data["repository"]["pullRequests"]
+            batch = [from_graphql(node) for node in page["nodes"]]
+            self.save_pulls(repo, batch)
+            pulls.extend(batch)
+            if not page["pageInfo"]["hasNextPage"] or (batch and parse_time(batch[-1]["updated_at"]) < since):
+                break
+            cursor = page["pageInfo"]["endCursor"]
+        return [to_pull_request(p) for p in pulls if parse_time(p["updated_at"]) >= since]
+
+    def stored(self, repo, since):
+        """PRs of `repo` updated at or after `since` from the store alone, newest first."""
+        rows = self._db.execute(
+            "SELECT raw FROM pulls WHERE repo = ? ORDER BY updated_at DESC", [repo]).fetchall()
+        pulls = [to_pull_request(json.loads(raw)) for (raw,) in rows]
+        return [p for p in pulls if p.updated_at >= since]
+
+    def pulls(self, repo, since):
+        if self.offline:
+            return self.stored(repo, since)
+        return self.fetch_graphql(repo, since) if self.graphql else self.fetch(repo, since)
+
+    def report(self):
+        if self.graphql:
+            lines = [f"GitHub GraphQL: {self.stats['queries']} queries, {self.stats['points']} points"]
+        else:
+            lines = [f"GitHub pages: {self.stats['pages']} read, {self.stats['requests']} requests, "
+                     f"{self.stats['not_modified']} not modified (no rate-limit cost)"]
+        if self.rate_limit:
+            unit = "points" if self.graphql else "requests"
+            lines.append(f"GitHub API {unit} remaining: {self.rate_limit[0]}/{self.rate_limit[1]}")
+        return lines
+
+    def close(self):
+        self._db.close()
+
+
+def merged_in_window(pulls, start_date, end_date, limit=None):
+    """Merged PRs from `pulls` whose merge date falls in the window, at most `limit` of them."""
+    selected = [p for p in pulls if p.merged_at and start_date <= p.merged_at <= end_date]
+    return selected[:limit] if limit is not None else selected
+
+
+def add_arguments(p, days):
+    """Options shared by the PR scripts."""
+    p.add_argument("--repo", nargs="+", default=["serde-rs/json"], help="One or more owner/name repositories")
+    p.add_argument("--all-repos", action="store_true", help="Use every repository from the README")
+    p.add_argument("--days", type=int, default=days, help="Classify PRs merged in the last N days")
+    p.add_argument("--limit", type=int, default=None, help="Classify at most N PRs per repository")
+    p.add_argument("--offline", action="store_true", help="Read PRs from --pr-store only, without calling GitHub")
+    p.add_argument("--pr-store", default="../data/pr_store.sqlite", help="SQLite store for fetched PR pages")
+    p.add_argument("--page-concurrency", type=int, default=4, help="PR list pages fetched at once")
+    p.add_argument("--graphql", action="store_true",
+                   help="Fetch through the GraphQL API, 100 merged PRs with line and file counts per query")
+    p.add_argument("--github-url", default=API_URL, help="GitHub API base URL (e.g. a mock_github_server.py)")
+    p.add_argument("--label-cache", default="../data/pr_label_cache.sqlite",
+                   help="SQLite cache of LLM results per PR revision, shared by the PR scripts")
+    p.add_argument("--relabel", action="store_true",
+                   help="Send every PR to the LLM even if it has a cached result (results still update the cache)")
+
+
+def open_store(args):
+    # Unauthenticated requests get 60 per hour; set GITHUB_TOKEN for real backfills
+    token = os.environ.get("GITHUB_TOKEN")
+    if not token and not args.offline:
+        if args.graphql:
+            print("[WARN] GITHUB_TOKEN is not set; the GraphQL API will reject requests")
+        else:
+            print("[WARN] GITHUB_TOKEN is not set; using the unauthenticated rate limit")
+    return PRStore(args.pr_store, token=token, api_url=args.github_url, concurrency=args.page_concurrency,
+                   offline=args.offline, graphql=args.graphql)
@@ -0,0 +1,141 @@
+"""Where a run's wall-clock time goes: stage timers, latencies and throughput.
+
+Each script keeps one `Profiler`:
+
+- `stage(name)` / `add(name, seconds)` / `iterate(name, iterable)`: total
+  seconds per pipeline stage (git traversal, diff parsing, lizard metrics,
+  LLM calls, writing, ...)
+- `observe(name, seconds)`: individual latencies, reported as
+  p50/p95/p99, e.g. one per LLM request
+- `count(name, n)`: plain counters (cache hits, tokens, requests)
+- `throughput(done, cost)`: "85.3 commits/s, $0.412/1k commits" so far,
+  for the live progress lines
+
+With `--profile PATH` a script writes `report()` to PATH as JSON at the end
+of the run.
+"""
+import json
+import math
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+
+def add_arguments(p):
+    p.add_argument("--profile", default=None, metavar="PATH",
+                   help="Write a JSON run report (stage times, latency percentiles, throughput) to PATH")
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(q / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def latency_summary(values):
+    values = sorted(values)
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values) if values else None,
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": values[-1] if values else None,
+    }
+
+
+class Profiler:
+    def __init__(self, script, unit="commits"):
+        self.script = script
+        self.unit = unit
+        self.started_at = datetime.now(timezone.utc)
+        self._start = time.perf_counter()
+        self.stages = {}
+        self.latencies = {}
+        self.counters = Counter()
+
+    def elapsed(self):
+        return time.perf_counter() - self._start
+
+    def add(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def add_stages(self, timings):
+        for name, seconds in timings.items():
+            self.add(name, seconds)
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def iterate(self, name, iterable):
+        """Yield from `iterable`, charging the time spent producing each item to `name`."""
+        it = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(it)
+            except StopIteration:
+                self.add(name, time.perf_counter() - start)
+                return
+            self.add(name, time.perf_counter() - start)
+            yield item
+
+    def observe(self, name, seconds):
+        self.latencies.setdefault(name, []).append(seconds)
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    def throughput(self, done, cost=None):
+        elapsed = self.elapsed()
+        line = f"{done / elapsed if elapsed else 0.0:.1f} {self.unit}/s"
+        if cost is not None and done:
+            line += f", ${1000 * cost / done:.3f}/1k {self.unit}"
+        return line
+
+    def report(self, done=0, cost=None, **extra):
+        """The run as a JSON-serializable dict. Stage shares are of wall time; stages summed
+        over worker processes or concurrent requests can add up to more than 100%."""
+        wall = self.elapsed()
+        report = {
+            "script": self.script,
+            "started_at": self.started_at.isoformat(),
+            "wall_seconds": round(wall, 3),
+            self.unit: done,
+            f"{self.unit}_per_second": round(done / wall, 3) if wall else None,
+        }
+        if cost is not None:
+            report["cost"] = round(cost, 6)
+            report[f"cost_per_1k_{self.unit}"] = round(1000 * cost / done, 6) if done else None
+        report["stages"] = {name: {"seconds": round(seconds, 3), "share": round(seconds / wall, 4) if wall else None}
+                            for name, seconds in sorted(self.stages.items(), key=lambda kv: -kv[1])}
+        report["latency"] = {name: {k: round(v, 4) if isinstance(v, float) else v
+                                    for k, v in latency_summary(values).items()}
+                             for name, values in self.latencies.items()}
+        report["counters"] = dict(self.counters)
+        report.update(extra)
+        return report
+
+    def summary(self, report):
+        """Printable lines for the end-of-run summary."""
+        lines = [f"Stage timings (seconds, {report['wall_seconds']:.1f}s wall):"]
+        for name, stage in report["stages"].items():
+            lines.append(f"  {name:22} {stage['seconds']:10.2f}  {100 * (stage['share'] or 0):5.1f}%")
+        for name, lat in report["latency"].items():
+            if lat["count"]:
+                lines.append(f"  {name} latency: p50 {lat['p50']:.3f}s  p95 {lat['p95']:.3f}s  "
+                             f"p99 {lat['p99']:.3f}s  ({lat['count']} samples)")
+        return lines
+
+    def write(self, path, report):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, default=str)
+        print(f"[INFO] Profile written to {path}")
@@ -0,0 +1,84 @@
+"""Asyncio rate limiting for LLM calls.
+
+`RateLimiter` combines two token buckets, one for requests per minute and
+one for tokens per minute, so concurrent callers stay inside provider
+quotas. `call_with_backoff` retries on 429s with exponential backoff,
+honouring the provider's retry-after hint when there is one, and pauses the
+whole limiter so other in-flight callers back off too.
+"""
+import asyncio
+import random
+import time
+
+
+class TokenBucket:
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        """Seconds until `amount` can be taken (0 if it can be taken now)."""
+        self._refill()
+        # Requests bigger than the whole bucket are let through once it is full
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount):
+        self._refill()
+        self.tokens -= amount
+
+
+class RateLimiter:
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self._lock = asyncio.Lock()
+        self._paused_until = 0.0
+
+    async def acquire(self, estimated_tokens):
+        # One caller at a time waits for capacity, so requests are granted in arrival order
+        async with self._lock:
+            while True:
+                wait = max(
+                    self._paused_until - time.monotonic(),
+                    self.requests.wait_time(1),
+                    self.tokens.wait_time(estimated_tokens),
+                )
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+            self.requests.take(1)
+            self.tokens.take(estimated_tokens)
+
+    def settle(self, estimated_tokens, actual_tokens):
+        """Correct the token bucket once the real usage of a request is known."""
+        self.tokens.take(actual_tokens - estimated_tokens)
+
+    def pause(self, seconds):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+async def call_with_backoff(fn, limiter, is_retryable, retry_after=None,
+                            max_retries=6, base_delay=1.0, max_delay=60.0):
+    """Await `fn()`, retrying with exponential backoff while it raises a retryable error (429s, 5xx)."""
+    for attempt in range(max_retries + 1):
+        try:
+            return await fn()
+        except Exception as e:
+            if not is_retryable(e) or attempt == max_retries:
+                raise
+            delay = retry_after(e) if retry_after else None
+            if delay is None:
+                delay = min(max_delay, base_delay * 2 ** attempt) * (0.5 + random.random() / 2)
+            print(f"[WARN] {type(e).__name__}, retrying in {delay:.1f}s (attempt {attempt + 1}/{max_retries})")
+            limiter.pause(delay)
+            await asyncio.sleep(delay)
@@ -0,0 +1,193 @@
+"""Clone and update the manifest's repositories, sharing one object store.
+
+`orchestrate.py fetch` calls `fetch_all`. Every repository is fetched into
+one bare repository, `../data/objects.git`, as a remote of its own (tags
+off, since tag names clash between projects). Git fetches those remotes in
+parallel with `fetch --multiple --jobs`, so each object crosses the network
+once, and later runs only download what's new. The working clones in
+`../data/{name}` are then made with `--reference` to the store: they borrow
+its objects instead of copying them. A clone that already exists is updated
+with `fetch` and a fast-forward of its branch.
+
+A repository with `clone = "blobless"` in the manifest (or every
+repository, with `--blobless`) is cloned with `--filter=blob:none`: commits
+and trees only, with file contents fetched on demand. That suits
+commit-level work (`orchestrate.py plan` estimates, commit messages).
+grab_commits.py and `git log --numstat` read every diff, so they would
+fetch the blobs one commit at a time; clone those repositories in full.
+
+The store never prunes anything, since clones rely on its objects. A
+repository first stored blobless stays blobless in the store, so a full
+clone of it is made without the store rather than borrowing a copy that
+lacks blobs.
+
+`--mirror DIR` replaces each url with `file://DIR/{name}.git` (or
+`DIR/{name}`), for offline runs against local mirrors. Partial clones from
+a local mirror need `uploadpack.allowFilter` set in the mirror.
+"""
+import os
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+STORE_PATH = "../data/objects.git"
+
+
+class GitError(Exception):
+    pass
+
+
+def _git(*args):
+    result = subprocess.run(["git", *args], capture_output=True, text=True)
+    if result.returncode != 0:
+        lines = (result.stderr or result.stdout).strip().splitlines()
+        raise GitError(f"git {args[0] if args[0] != '-C' else args[2]}: {lines[-1] if lines else 'failed'}")
+    return result.stdout.strip()
+
+
+def is_clone(path):
+    return os.path.isdir(os.path.join(path, ".git")) or os.path.isfile(os.path.join(path, "HEAD"))
+
+
+def mirror_url(name, mirror):
+    """file:// url of a repository's local mirror, or None if there isn't one."""
+    for candidate in (f"{name}.git", name):
+        path = os.path.abspath(os.path.join(mirror, candidate))
+        if os.path.isdir(path):
+            return "file://" + path
+    return None
+
+
+class ObjectStore:
+    """A bare repository holding the objects of every manifest repository, one remote each."""
+
+    def __init__(self, path=STORE_PATH):
+        self.path = path
+        if not is_clone(path):
+            _git("init", "--quiet", "--bare", path)
+            # Clones borrow objects from here, so even unreachable ones must stay
+            _git("-C", path, "config", "gc.pruneExpire", "never")
+        self.fetched = set()
+
+    def _config(self, key):
+        try:
+            return _git("-C", self.path, "config", "--get", key)
+        except GitError:
+            return None
+
+    def is_partial(self, name):
+        return self._config(f"remote.{name}.promisor") == "true"
+
+    def add(self, name, url, blobless):
+        if self._config(f"remote.{name}.url") is None:
+            _git("-C", self.path, "remote", "add", name, url)
+            _git("-C", self.path, "config", f"remote.{name}.tagOpt", "--no-tags")
+            if blobless:
+                _git("-C", self.path, "config", f"remote.{name}.promisor", "true")
+                _git("-C", self.path, "config", f"remote.{name}.partialclonefilter", "blob:none")
+        else:
+            _git("-C", self.path, "remote", "set-url", name, url)
+
+    def fetch(self, names, jobs):
+        """Fetch the remotes in parallel; returns the error, if any. Remotes that failed are left out of `fetched`."""
+        error = None
+        try:
+            # No --prune: a ref deleted upstream may still hold objects a clone borrowed
+            _git("-C", self.path, "fetch", "--quiet", "--multiple", f"--jobs={jobs}", *names)
+        except GitError as e:
+            error = e
+        for name in names:
+            if _git("-C", self.path, "for-each-ref", "--count=1", f"refs/remotes/{name}/"):
+                self.fetched.add(name)
+        return error
+
+    def usable_for(self, name, blobless):
+        # A full clone can't borrow from a blobless copy: the server would assume it has the blobs
+        return name in self.fetched and (blobless or not self.is_partial(name))
+
+    def size(self):
+        stats = dict(line.split(": ", 1) for line in _git("-C", self.path, "count-objects", "-v").splitlines())
+        return (int(stats.get("size-pack", 0)) + int(stats.get("size", 0))) * 1024
+
+
+def update_clone(path, url):
+    """Fetch and fast-forward an existing clone. Returns the number of new commits on its branch."""
+    before = _git("-C", path, "rev-parse", "HEAD")
+    _git("-C", path, "remote", "set-url", "origin", url)
+    _git("-C", path, "fetch", "--quiet", "--prune", "--tags", "origin")
+    try:
+        _git("-C", path, "rev-parse", "--abbrev-ref", "@{upstream}")
+    except GitError:
+        # Detached or without an upstream: nothing to fast-forward
+        return 0
+    _git("-C", path, "merge", "--quiet", "--ff-only", "@{upstream}")
+    return int(_git("-C", path, "rev-list", "--count", f"{before}..HEAD"))
+
+
+def clone(path, url, blobless, reference=None, branch=None):
+    """Clone `url` into `path`. Returns the number of commits on the cloned branch."""
+    cmd = ["clone", "--quiet"]
+    if blobless:
+        cmd.append("--filter=blob:none")
+    if reference:
+        cmd += ["--reference-if-able", os.path.abspath(reference)]
+    if branch:
+        cmd += ["--branch", branch]
+    _git(*cmd, url, path)
+    return int(_git("-C", path, "rev-list", "--count", "HEAD"))
+
+
+def fetch_repo(repo, url, path, blobless, store):
+    """Clone or update one repository; returns a line for the log."""
+    start = time.time()
+    if is_clone(path):
+        new = update_clone(path, url)
+        return f"updated, {new:,} new commits ({time.time() - start:.1f}s)"
+    if os.path.exists(path) and os.listdir(path):
+        raise GitError(f"{path} exists and is not a git repository")
+    reference = store.path if store is not None and store.usable_for(repo["name"], blobless) else None
+    commits = clone(path, url, blobless, reference, repo.get("branch"))
+    how = ("blobless" if blobless else "full") + (", objects from the store" if reference else "")
+    return f"cloned ({how}), {commits:,} commits ({time.time() - start:.1f}s)"
+
+
+def fetch_all(repos, target_path, jobs, blobless=False, store_path=STORE_PATH, mirror=None):
+    """Bring every repository's clone up to date. Returns the names that failed."""
+    urls = {}
+    failed = []
+    for repo in repos:
+        url = mirror_url(repo["name"], mirror) if mirror else repo["url"]
+        if url is None:
+            print(f"[ERROR] {repo['name']}: no mirror in {mirror}")
+            failed.append(repo["name"])
+        else:
+            urls[repo["name"]] = url
+    repos = [r for r in repos if r["name"] in urls]
+    modes = {r["name"]: blobless or r.get("clone", "full") == "blobless" for r in repos}
+
+    store = None
+    if store_path and repos:
+        store = ObjectStore(store_path)
+        start = time.time()
+        for repo in repos:
+            store.add(repo["name"], urls[repo["name"]], modes[repo["name"]])
+        error = store.fetch([r["name"] for r in repos], jobs)
+        if error:
+            print(f"[WARN] Object store fetch: {error}; repositories it missed are cloned directly")
+        print(f"[INFO] Object store {store_path}: {len(store.fetched)} of {len(repos)} repos fetched "
+              f"in {time.time() - start:.0f}s ({store.size() / 2**20:,.1f} MiB)")
+
+    def one(repo):
+        try:
+            return repo, fetch_repo(repo, urls[repo["name"]], target_path(repo), modes[repo["name"]], store), None
+        except GitError as e:
+            return repo, None, e
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        for repo, result, error in pool.map(one, repos):
+            if error:
+                print(f"[ERROR] {repo['name']}: {error}")
+                failed.append(repo["name"])
+            else:
+                print(f"[INFO] {repo['name']}: {result}")
+    return failed
@@ -0,0 +1,109 @@
+"""Regex-first classification tier shared by the commit and PR classifiers.
+
+A `RuleEngine` holds an ordered list of `Rule`s. All patterns are compiled
+once, and they are also joined into a single alternation. Most messages match
+no rule at all, so that one combined search rejects them without trying each
+pattern. When the combined pattern does match, rules are tried in priority
+order and the first hit wins.
+
+Each rule has a confidence. A match below the engine's threshold is skipped
+and the remaining rules are tried; if none of them fires, the message is
+reported as a miss so the caller can fall back to the LLM. The engine counts
+hits per rule for the run summary.
+"""
+import re
+from collections import Counter, namedtuple
+
+Match = namedtuple("Match", ["label", "confidence", "rule"])
+
+
+class Rule:
+    def __init__(self, name, label, pattern, confidence, exclude=None):
+        self.name = name
+        self.label = label
+        self.pattern = pattern
+        self.confidence = confidence
+        self.regex = re.compile(pattern, re.IGNORECASE)
+        self.exclude = re.compile(exclude, re.IGNORECASE) if exclude else None
+
+    def matches(self, text):
+        return bool(self.regex.search(text)) and not (self.exclude and self.exclude.search(text))
+
+
+class RuleEngine:
+    def __init__(self, rules, threshold=0.0):
+        self.rules = list(rules)
+        self.threshold = threshold
+        self.combined = re.compile("|".join(f"(?:{r.pattern})" for r in self.rules), re.IGNORECASE)
+        self.hits = Counter()
+        self.checked = 0
+        self.below_threshold = 0
+
+    def classify(self, text):
+        """Return a Match for the first rule that fires with enough confidence, else None."""
+        self.checked += 1
+        text = text or ""
+        if not self.combined.search(text):
+            return None
+        below = False
+        for rule in self.rules:
+            if not rule.matches(text):
+                continue
+            if rule.confidence < self.threshold:
+                # A later, more confident rule may still fire
+                below = True
+                continue
+            self.hits[rule.name] += 1
+            return Match(rule.label, rule.confidence, rule.name)
+        if below:
+            self.below_threshold += 1
+        return None
+
+    @property
+    def matched(self):
+        return sum(self.hits.values())
+
+    def hit_rate(self):
+        return self.matched / self.checked if self.checked else 0.0
+
+    def report(self):
+        """Summary lines for the end of a run."""
+        lines = [f"Regex tier: {self.matched} of {self.checked} classified by rules ({100 * self.hit_rate():.1f}%)"]
+        if self.below_threshold:
+            lines.append(f"  {self.below_threshold} rule matches below threshold {self.threshold} sent to the LLM")
+        for name, count in self.hits.most_common():
+            lines.append(f"  {name:24} {count:6}")
+        return lines
+
+
+# Rules for one-line commit messages, in priority order. Labels follow the
+# LLM taxonomy: feature, fix, refactor, docs, test, other.
+COMMIT_RULES = [
+    # Conventional-commit prefixes say what the author meant
+    Rule("conventional_fix", "fix", r"^fix(\([^)]*\))?!?:", 0.95),
+    Rule("conventional_feat", "feature", r"^feat(\([^)]*\))?!?:", 0.95),
+    Rule("conventional_docs", "docs", r"^docs?(\([^)]*\))?:", 0.95),
+    Rule("conventional_test", "test", r"^tests?(\([^)]*\))?:", 0.95),
+    Rule("conventional_refactor", "refactor", r"^refactor(\([^)]*\))?:", 0.95),
+    Rule("conventional_chore", "other", r"^(chore|ci|build|style)(\([^)]*\))?:", 0.9),
+    Rule("dependency_update", "other", r"^(bump|update) \S+ (from|to) v?\d|\bdependabot\b|^update dependencies", 0.95),
+    Rule("release", "other", r"^(release|prepare (for )?release|version bump|bump version)\b", 0.85),
+    Rule("changelog_readme", "docs", r"^(update|add|fix)\s+(the\s+)?(changelog|readme|news|docs?|documentation)\b", 0.9),
+    # "Fix typo in parser causing crash" is a fix, not a docs change
+    Rule("typo", "docs", r"^(fix(es|ed)?\s+)?(a\s+)?typos?\b", 0.85,
+         exclude=r"\b(bug|crash(es|ed|ing)?|segfault|leak|regression|overflow|use[- ]after[- ]free|null pointer|double free|caus(e|es|ed|ing))\b"),
+    Rule("fix_reference", "fix", r"\bfix(es|ed)?\s+(a\s+)?(bug|issue|crash|leak|regression|#\d+)", 0.9),
+    Rule("memory_safety", "fix", r"\b(segfault|memory leak|use[- ]after[- ]free|null pointer dereference|buffer overflow|double free)\b", 0.85),
+]
+
+# Rules for PR titles. The names keep the categories of the original
+# classify_pr_regex; the labels map them onto the shared taxonomy.
+PR_RULES = [
+    Rule("dependency_update", "other", r"dependabot|bump|update dependencies", 0.9),
+    # "fix docs" is a fix, not a docs change
+    Rule("documentation", "docs", r"docs|documentation|readme|comment", 0.85, exclude=r"fix"),
+    Rule("bug_fix", "fix", r"\bfix(es|ed)?\s+(bug|issue|#\d+)|\b(bug|issue)\s*fix|^fix:|\bsegfault\b|\bcrash\b|\bmemory leak\b", 0.9),
+    Rule("refactor", "refactor", r"refactor|clean up|simplify|reorganize", 0.8),
+    Rule("ci_build", "other", r"ci |github actions|build", 0.8),
+    Rule("test", "test", r"test", 0.8),
+]
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""Local stand-in for the OpenAI API, for exercising the labeling scripts offline.
+
+Implements just enough of the API for label_commits_llm.py:
+
+- POST /v1/chat/completions
+- POST /v1/files (multipart upload), GET /v1/files/{id}/content
+- POST /v1/batches, GET /v1/batches/{id}
+
+Labels come from keyword heuristics on the last user message, so results
+are deterministic. Packed requests (lines like "[3] message") get one label
+per line; --pack-drop leaves some out to exercise the labeler's retries.
+
+For benchmarks, --latency/--jitter delay each chat completion and
+--rate-429 answers a share of them with 429 and a retry-after header.
+GET /v1/stats returns the request and 429 counts so far. Point a client at it with:
+
+    python stub_openai_server.py --port 8765
+    OPENAI_API_KEY=stub OPENAI_BASE_URL=http://127.0.0.1:8765/v1 python label_commits_llm.py ...
+"""
+import argparse
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from email.parser import BytesParser
+from email.policy import default as default_policy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+KEYWORD_LABELS = [
+    (r"\b(fix|bug|crash|regression|leak|overflow|error)", "fix"),
+    (r"\b(test|tests|fuzz)", "test"),
+    (r"\b(doc|docs|readme|typo|comment|changelog)", "docs"),
+    (r"\b(refactor|clean|cleanup|rename|simplify|move)", "refactor"),
+    (r"\b(add|adds|added|support|implement|new|introduce)", "feature"),
+]
+
+_ids = itertools.count(1)
+_lock = threading.Lock()
+FILES = {}
+BATCHES = {}
+PACKED_LINE = re.compile(r"^\[(\d+)\] (.*)$", re.MULTILINE)
+OPTIONS = {"pack_drop": 0.0, "latency": 0.0, "jitter": 0.0, "rate_429": 0.0, "retry_after": 1.0}
+STATS = {"chat_completions": 0, "rate_limited": 0}
+
+
+def next_id(prefix):
+    with _lock:
+        return f"{prefix}-{next(_ids)}"
+
+
+def classify(text):
+    for pattern, label in KEYWORD_LABELS:
+        if re.search(pattern, text, re.IGNORECASE):
+            return label
+    return "other"
+
+
+def chat_completion(body):
+    """Build a chat.completion response for a request body."""
+    user = next((m["content"] for m in reversed(body.get("messages", [])) if m["role"] == "user"), "")
+    packed = PACKED_LINE.findall(user)
+    if packed:
+        content = {"labels": [
+            {"index": int(i), "label": classify(text), "confidence": 0.9, "rationale": "Stub classification."}
+            for i, text in packed if random.random() >= OPTIONS["pack_drop"]
+        ]}
+    else:
+        content = {"label": classify(user), "confidence": 0.9, "rationale": "Stub classification from keywords."}
+    prompt_tokens = sum(len(m.get("content", "")) for m in body.get("messages", [])) // 4
+    completion_tokens = len(json.dumps(content)) // 4
+    return {
+        "id": next_id("chatcmpl"),
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "stub"),
+        "choices": [{
+            "index": 0,
+            "finish_reason": "stop",
+            "message": {"role": "assistant", "content": json.dumps(content)},
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+
+def file_object(file_id, f):
+    return {"id": file_id, "object": "file", "bytes": len(f["data"]), "created_at": f["created_at"],
+            "filename": f["filename"], "purpose": f["purpose"], "status": "processed"}
+
+
+def run_batch(batch):
+    """Answer every request in the batch's input file and store the output file."""
+    lines = []
+    for line in FILES[batch["input_file_id"]]["data"].decode("utf-8").splitlines():
+        if not line.strip():
+            continue
+        req = json.loads(line)
+        lines.append(json.dumps({
+            "id": next_id("batch_req"),
+            "custom_id": req["custom_id"],
+            "response": {"status_code": 200, "request_id": next_id("req"), "body": chat_completion(req["body"])},
+            "error": None,
+        }))
+    output_id = next_id("file")
+    FILES[output_id] = {"data": ("\n".join(lines) + "\n").encode("utf-8"), "filename": "batch_output.jsonl",
+                        "purpose": "batch_output", "created_at": int(time.time())}
+    batch.update({
+        "status": "completed",
+        "output_file_id": output_id,
+        "completed_at": int(time.time()),
+        "request_counts": {"total": len(lines), "completed": len(lines), "failed": 0},
+    })
+
+
+class Handler(BaseHTTPRequestHandler):
+    server_version = "StubOpenAI/1.0"
+
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, status, obj, headers=None):
+        data = json.dumps(obj).encode("utf-8")
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def read_body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def do_POST(self):
+        path = self.path.split("?")[0]
+        if path.endswith("/chat/completions"):
+            body = json.loads(self.read_body())
+            with _lock:
+                STATS["chat_completions"] += 1
+                limited = random.random() < OPTIONS["rate_429"]
+                if limited:
+                    STATS["rate_limited"] += 1
+            if limited:
+                self.send_json(429, {"error": {"message": "Rate limit reached (stub)", "type": "requests",
+                                               "code": "rate_limit_exceeded"}},
+                               headers={"retry-after": str(OPTIONS["retry_after"])})
+                return
+            # Sleeping here only holds this request's thread, so concurrent requests overlap
+            time.sleep(OPTIONS["latency"] + random.uniform(0, OPTIONS["jitter"]))
+            self.send_json(200, chat_completion(body))
+
+        elif path.endswith("/files"):
+            raw = self.read_body()
+            msg = BytesParser(policy=default_policy).parsebytes(
+                f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode() + raw)
+            fields = {part.get_param("name", header="content-disposition"): part for part in msg.iter_parts()}
+            upload = fields["file"]
+            file_id = next_id("file")
+            FILES[file_id] = {"data": upload.get_payload(decode=True), "filename": upload.get_filename() or "upload",
+                              "purpose": fields["purpose"].get_content().strip(), "created_at": int(time.time())}
+            self.send_json(200, file_object(file_id, FILES[file_id]))
+
+        elif path.endswith("/batches"):
+            body = json.loads(self.read_body())
+            if body.get("input_file_id") not in FILES:
+                self.send_json(404, {"error": {"message": "input file not found"}})
+                return
+            batch_id = next_id("batch")
+            BATCHES[batch_id] = {
+                "id": batch_id, "object": "batch", "endpoint": body["endpoint"],
+                "input_file_id": body["input_file_id"], "completion_window": body["completion_window"],
+                "status": "validating", "created_at": int(time.time()),
+                "output_file_id": None, "error_file_id": None,
+                "request_counts": {"total": 0, "completed": 0, "failed": 0},
+            }
+            self.send_json(200, BATCHES[batch_id])
+        else:
+            self.send_json(404, {"error": {"message": f"unknown endpoint {path}"}})
+
+    def do_GET(self):
+        path = self.path.split("?")[0].rstrip("/")
+        parts = path.split("/")
+        if parts[-1] == "stats":
+            with _lock:
+                self.send_json(200, dict(STATS))
+
+        elif "batches" in parts:
+            batch = BATCHES.get(parts[-1])
+            if batch is None:
+                self.send_json(404, {"error": {"message": "batch not found"}})
+                return
+            # Report in_progress once so pollers go through a real wait cycle
+            if batch["status"] == "validating":
+                batch["status"] = "in_progress"
+            elif batch["status"] == "in_progress":
+                run_batch(batch)
+            self.send_json(200, batch)
+
+        elif len(parts) >= 2 and parts[-1] == "content" and parts[-2] in FILES:
+            data = FILES[parts[-2]]["data"]
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        else:
+            self.send_json(404, {"error": {"message": f"unknown endpoint {path}"}})
+
+
+def main():
+    p = argparse.ArgumentParser(description="Local stand-in for the OpenAI API")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8765)
+    p.add_argument("--pack-drop", type=float, default=0.0,
+                   help="Share of packed items to leave out of responses")
+    p.add_argument("--latency", type=float, default=0.0,
+                   help="Seconds each chat completion takes")
+    p.add_argument("--jitter", type=float, default=0.0,
+                   help="Up to this many extra seconds, uniformly at random")
+    p.add_argument("--rate-429", type=float, default=0.0,
+                   help="Share of chat completions answered with 429 Too Many Requests")
+    p.add_argument("--retry-after", type=float, default=1.0,
+                   help="retry-after seconds sent with each 429")
+    p.add_argument("--seed", type=int, default=None, help="Seed for the latency, 429 and pack-drop draws")
+    args = p.parse_args()
+    random.seed(args.seed)
+    OPTIONS.update(pack_drop=args.pack_drop, latency=args.latency, jitter=args.jitter,
+                   rate_429=args.rate_429, retry_after=args.retry_after)
+
+    server = ThreadingHTTPServer((args.host, args.port), Handler)
+    print(f"[INFO] Stub OpenAI server on http://{args.host}:{args.port}/v1")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
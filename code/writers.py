@@ -0,0 +1,191 @@
+"""Streaming output writers shared by the mining and labeling scripts.
+
+Rows are written to disk as soon as they are produced instead of being
+collected in a list and dumped at the end, so memory stays flat on long
+histories and a crash only loses the rows since the last flush.
+
+Two formats are supported:
+
+- csv: one file, rows appended as they come
+- parquet: a directory of `part-NNNNN.parquet` files, one per flush, with
+  typed and zstd-compressed columns. Read it back with
+  `pandas.read_parquet(path, columns=[...])` or `pyarrow.dataset`.
+
+grab_commits.py can also write a normalized SQLite store (see diff_store.py);
+checkpoints roll it back through `output_size` / `truncate_output` as well.
+"""
+import csv
+import glob
+import os
+
+from diff_store import is_store, store_size, truncate_store
+
+
+def _csv_header(path):
+    with open(path, "r", newline="", encoding="utf-8") as f:
+        return next(csv.reader(f), [])
+
+
+def _appended_columns(path, existing, columns):
+    """Rows appended to an output keep the columns it was started with, so its earlier rows stay readable."""
+    existing, columns = list(existing), list(columns)
+    if existing != columns:
+        dropped = [c for c in columns if c not in existing]
+        print(f"[WARN] {path} was written with other columns; appending in its layout"
+              + (f", without {', '.join(dropped)}" if dropped else ""))
+    return existing
+
+
+class StreamingCSVWriter:
+    def __init__(self, path, fieldnames, append=False, encode=None):
+        self.path = path
+        self.rows_written = 0
+        self._encode = encode
+        # When appending to an existing file the header is already there
+        write_header = not (append and os.path.exists(path) and os.path.getsize(path) > 0)
+        if not write_header:
+            fieldnames = _appended_columns(path, _csv_header(path), fieldnames)
+        self._f = open(path, "a" if append else "w", newline="", encoding="utf-8")
+        self._w = csv.DictWriter(self._f, fieldnames=fieldnames, extrasaction="ignore")
+        if write_header:
+            self._w.writeheader()
+
+    def writerow(self, row):
+        self._w.writerow(self._encode(row) if self._encode else row)
+        self.rows_written += 1
+
+    def writerows(self, rows):
+        for r in rows:
+            self.writerow(r)
+
+    def flush(self):
+        """Push buffered rows to the OS and to disk."""
+        self._f.flush()
+        os.fsync(self._f.fileno())
+
+    def size(self):
+        """Bytes written so far, including the header."""
+        return self._f.tell()
+
+    def close(self):
+        if not self._f.closed:
+            self.flush()
+            self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _arrow_type(pa, name):
+    if name.startswith("list<"):
+        return pa.list_(_arrow_type(pa, name[len("list<"):-1]))
+    return {
+        "string": pa.string(),
+        "int64": pa.int64(),
+        "float64": pa.float64(),
+        "bool": pa.bool_(),
+        # Commit dates carry their own UTC offsets; store them normalized to UTC
+        "timestamp": pa.timestamp("us", tz="UTC"),
+    }[name]
+
+
+def _part_files(path):
+    return sorted(glob.glob(os.path.join(path, "part-*.parquet")))
+
+
+class StreamingParquetWriter:
+    """Buffers rows and writes them as a new part file on every flush.
+
+    `columns` maps column name to a type name: string, int64, float64, bool,
+    timestamp, or list<...> of those.
+    """
+
+    def __init__(self, path, columns, append=False, encode=None):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit("[ERROR] --format parquet needs pyarrow (pip install pyarrow)")
+        self._pa, self._pq = pa, pq
+
+        self.path = path
+        self.rows_written = 0
+        self._encode = encode
+        self._schema = pa.schema([(name, _arrow_type(pa, t)) for name, t in columns.items()])
+        self._buffer = []
+
+        os.makedirs(path, exist_ok=True)
+        if not append:
+            for part in _part_files(path):
+                os.remove(part)
+        parts = _part_files(path)
+        if parts:
+            existing = pq.read_schema(parts[0])
+            names = _appended_columns(path, existing.names, self._schema.names)
+            self._schema = pa.schema([existing.field(name) for name in names])
+        self._parts = len(parts)
+
+    def writerow(self, row):
+        self._buffer.append(self._encode(row) if self._encode else row)
+        self.rows_written += 1
+
+    def writerows(self, rows):
+        for r in rows:
+            self.writerow(r)
+
+    def flush(self):
+        if not self._buffer:
+            return
+        columns = {name: [r.get(name) for r in self._buffer] for name in self._schema.names}
+        table = self._pa.table(columns, schema=self._schema)
+        part = os.path.join(self.path, f"part-{self._parts:05d}.parquet")
+        # Dot-prefixed files are ignored by parquet readers until renamed into place
+        tmp = os.path.join(self.path, f".{os.path.basename(part)}.tmp")
+        self._pq.write_table(table, tmp, compression="zstd")
+        os.replace(tmp, part)
+        self._parts += 1
+        self._buffer = []
+
+    def size(self):
+        """Number of part files written so far."""
+        return self._parts
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_writer(fmt, base_path, fieldnames, columns, append=False, encode_csv=None, encode_parquet=None):
+    """Open `{base_path}.csv` or `{base_path}.parquet` depending on `fmt`."""
+    if fmt == "parquet":
+        return StreamingParquetWriter(f"{base_path}.parquet", columns, append=append, encode=encode_parquet)
+    return StreamingCSVWriter(f"{base_path}.csv", fieldnames, append=append, encode=encode_csv)
+
+
+def output_size(path):
+    """Size in the units of `size()`: bytes for csv files, part count for parquet directories,
+    commits for diff stores."""
+    if is_store(path):
+        return store_size(path)
+    if os.path.isdir(path):
+        return len(_part_files(path))
+    return os.path.getsize(path)
+
+
+def truncate_output(path, size):
+    """Roll an output back to an earlier `size()`."""
+    if is_store(path):
+        truncate_store(path, size)
+    elif os.path.isdir(path):
+        for part in _part_files(path)[size:]:
+            os.remove(part)
+    else:
+        os.truncate(path, size)